@@ -0,0 +1,121 @@
+"""List and posting latency while the archive job drains a backlog.
+
+    python bench/bench_archive.py [--posts 100000] [--aged 0.6] [--data-dir DIR] [--json]
+
+A copy of the synthetic corpus (see corpus.py) is aged so that `--aged` of it
+is past ARCHIVE_AFTER_DAYS, then the job runs with its normal slicing and
+rests while another thread keeps reading the first list page and posting.
+The same reads and posts are timed with the job idle for comparison.
+
+  page_ms   p50/p99 of query_posts for the first list page
+  post_ms   p50/p99 of adding one post (waits on the job's write lock)
+  archived  posts the job moved, and how long the pass took end to end
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+
+import corpus  # noqa: E402
+from archive import ARCHIVE_AFTER_DAYS, DAY, ArchiveJob  # noqa: E402
+from models import Post  # noqa: E402
+from storage import PostStore  # noqa: E402
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50": round(statistics.median(samples) * 1000, 3),
+        "p99": round(samples[int(len(samples) * 0.99) - 1] * 1000, 3),
+    }
+
+
+def load(store: PostStore, stop: threading.Event, pages: list, posts: list) -> None:
+    """Read the first page and add a post alternately until `stop` is set."""
+    i = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        store.query_posts(limit=25)
+        pages.append(time.perf_counter() - started)
+        if i % 10 == 0:
+            post = Post.new(f"Bench item {i}", "left behind during a benchmark", "Keys", "Student Center", "2025-01-01")
+            started = time.perf_counter()
+            store.add(post)
+            posts.append(time.perf_counter() - started)
+        i += 1
+        time.sleep(0.002)
+
+
+def timed_load(store: PostStore, seconds: float = None, during=None) -> tuple:
+    stop = threading.Event()
+    pages, posts = [], []
+    worker = threading.Thread(target=load, args=(store, stop, pages, posts))
+    worker.start()
+    result = None
+    if during is not None:
+        result = during()
+    else:
+        time.sleep(seconds)
+    stop.set()
+    worker.join()
+    return pages, posts, result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--aged", type=float, default=0.6, help="fraction of the corpus past the archive age")
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    corpus.build_store(args.posts, args.data_dir)
+    source = os.path.join(args.data_dir, f"corpus-{args.posts}-7.db")
+    with tempfile.TemporaryDirectory() as tmp:
+        #the pass empties the table it runs on; work on a copy of the cached corpus
+        path = os.path.join(tmp, "archive-bench.db")
+        shutil.copyfile(source, path)
+        store = PostStore(path)
+        with store.batch() as conn:
+            conn.execute(
+                "UPDATE posts SET created_at = created_at - ? WHERE seq <= ?",
+                ((ARCHIVE_AFTER_DAYS + 1) * DAY, int(args.posts * args.aged))
+            )
+
+        idle_pages, idle_posts, _ = timed_load(store, seconds=3)
+        job = ArchiveJob(store)
+        started = time.perf_counter()
+        busy_pages, busy_posts, stats = timed_load(store, during=job.run_once)
+        wall = time.perf_counter() - started
+
+    results = {
+        "posts": args.posts,
+        "archived": stats["archived"],
+        "pass_seconds": round(wall, 2),
+        "busy_seconds": round(stats["busy_seconds"], 2),
+        "idle": {"page_ms": percentiles(idle_pages), "post_ms": percentiles(idle_posts)},
+        "archiving": {"page_ms": percentiles(busy_pages), "post_ms": percentiles(busy_posts)},
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"archived {results['archived']} posts in {results['pass_seconds']}s "
+              f"({results['busy_seconds']}s holding the write lock)")
+        print(f"{'':>10}{'page p50':>10}{'page p99':>10}{'post p50':>10}{'post p99':>10}")
+        for name in ("idle", "archiving"):
+            r = results[name]
+            print(f"{name:>10}{r['page_ms']['p50']:>10.2f}{r['page_ms']['p99']:>10.2f}"
+                  f"{r['post_ms']['p50']:>10.2f}{r['post_ms']['p99']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Throughput and memory of the bulk import/export CLI (cli.py) by file size.
+
+    python bench/bench_bulk.py [--sizes 10000,100000,500000] [--format csv] [--json]
+
+For each size a synthetic file (see corpus.py) is written to a temp dir and
+then, each into a fresh database:
+
+  validate_rps  parsing and validating the file without writing (--dry-run)
+  import_rps    the full import into an empty database (a bulk load, see
+                PostStore.bulk_load), index builds included; matching the
+                imported posts is not timed
+  export_rps    exporting what was imported
+  peak_mb       peak Python heap while validating, transaction-sized batches
+                included (tracemalloc); flat across sizes since rows are
+                streamed and batches are bounded
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+
+import corpus  # noqa: E402
+from bulk import export_posts, import_posts, read_records  # noqa: E402
+from storage import POST_FIELDS, PostStore  # noqa: E402
+
+
+def write_file(path: str, n: int, fmt: str) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(POST_FIELDS)
+            writer.writerows([p[k] for k in POST_FIELDS] for p in corpus.generate(n))
+        else:
+            for p in corpus.generate(n):
+                f.write(json.dumps(p) + "\n")
+
+
+def rate(n: int, fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - started)
+
+
+def run_size(n: int, fmt: str, tmp: str) -> dict:
+    source = os.path.join(tmp, f"posts-{n}.{fmt}")
+    write_file(source, n, fmt)
+
+    def validate():
+        with open(source, encoding="utf-8-sig", newline="") as f:
+            import_posts(None, read_records(f, fmt))
+
+    store = PostStore(os.path.join(tmp, f"import-{n}.db"))
+    store.set_cache_mb(64)
+
+    def load():
+        with open(source, encoding="utf-8-sig", newline="") as f:
+            stats = import_posts(store, read_records(f, fmt))
+        assert stats["imported"] == n, stats
+
+    def export():
+        with open(os.path.join(tmp, f"export-{n}.{fmt}"), "w", encoding="utf-8", newline="") as f:
+            export_posts(store, f, fmt)
+
+    validate_rps = rate(n, validate)
+    #traced separately: tracemalloc would slow the timed runs down
+    tracemalloc.start()
+    validate()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "rows": n,
+        "validate_rps": round(validate_rps),
+        "import_rps": round(rate(n, load)),
+        "export_rps": round(rate(n, export)),
+        "peak_mb": round(peak / 2 ** 20, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,500000", help="comma-separated row counts")
+    parser.add_argument("--format", default="csv", choices=("csv", "jsonl"))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [run_size(int(s), args.format, tmp) for s in args.sizes.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'rows':>10}{'validate/s':>12}{'import/s':>10}{'export/s':>10}{'peak MB':>9}")
+        for r in results:
+            print(f"{r['rows']:>10}{r['validate_rps']:>12}{r['import_rps']:>10}{r['export_rps']:>10}{r['peak_mb']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
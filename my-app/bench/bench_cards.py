@@ -0,0 +1,110 @@
+"""Allocation cost of rendering the post list, with card recycling on and off.
+
+    python bench/bench_cards.py [--size 10000] [--rounds 20] [--data-dir DIR] [--json]
+
+The lost items screen is opened headlessly on a synthetic corpus (see
+corpus.py) and the search box is cycled through item names, so every render
+swaps a full page of cards for other posts. Measured per render under
+tracemalloc, once with the card pool and once with it disabled (every card
+built from scratch, as before cards were recycled):
+
+  controls   controls constructed (Flet's control id counter)
+  peak_kb    peak Python heap above the starting point during the render
+  blocks     memory blocks still allocated after the render and a gc pass;
+             cards dropped from the list are garbage, so this is what the
+             render left for the collector to find
+  ms         wall time, measured in a separate untraced pass
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+os.environ["MSF_DEBOUNCE_MS"] = "0"
+
+import cards  # noqa: E402
+import corpus  # noqa: E402
+import post  # noqa: E402
+from matching import get_matcher  # noqa: E402
+from flet.controls.id_counter import ControlId  # noqa: E402
+from harness import HeadlessApp  # noqa: E402
+
+SEARCH_LABEL = "Search title, description, category or location"
+
+
+async def run_mode(store, pool_size: int, rounds: int) -> dict:
+    cards.POOL_SIZE = pool_size
+    app = HeadlessApp()
+    post.main(app.page, posts_store=store, current_user={"email": "bench@montclair.edu", "logged_in": True})
+    #let the matcher finish indexing the corpus so its allocations are not counted
+    get_matcher(store)._executor.submit(lambda: None).result()
+    search = app.by_label(SEARCH_LABEL)
+    queries = [item.lower() for item in corpus.ITEMS]
+    #one round first so the pool holds a page of cards, as it does once a user has searched
+    for q in queries[:2]:
+        await app.type(search, q)
+
+    started = time.perf_counter()
+    for i in range(rounds):
+        await app.type(search, queries[i % len(queries)])
+    ms = (time.perf_counter() - started) / rounds * 1000
+
+    controls, peaks, blocks = [], [], []
+    for i in range(rounds):
+        gc.collect()
+        gc.disable()
+        tracemalloc.start()
+        first_id = ControlId.next()
+        base, _ = tracemalloc.get_traced_memory()
+        before = tracemalloc.take_snapshot()
+        await app.type(search, queries[(i + 3) % len(queries)])
+        _, peak = tracemalloc.get_traced_memory()
+        controls.append(ControlId.next() - first_id - 1)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        gc.enable()
+        new_blocks = sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+        peaks.append((peak - base) / 1024)
+        blocks.append(new_blocks)
+    return {
+        "pool": pool_size,
+        "controls": round(statistics.fmean(controls)),
+        "peak_kb": round(statistics.fmean(peaks)),
+        "blocks": round(statistics.fmean(blocks)),
+        "ms": round(ms, 2),
+    }
+
+
+async def run(size: int, rounds: int, data_dir: str) -> list:
+    store = corpus.build_store(size, data_dir)
+    pool_size = cards.POOL_SIZE
+    return [await run_mode(store, 0, rounds), await run_mode(store, pool_size, rounds)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000, help="posts in the corpus")
+    parser.add_argument("--rounds", type=int, default=20, help="measured renders per mode")
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"), help="where corpora are cached")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.size, args.rounds, args.data_dir))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'pool':>6}{'controls':>10}{'peak KB':>9}{'blocks':>8}{'ms':>8}")
+        for r in results:
+            print(f"{r['pool']:>6}{r['controls']:>10}{r['peak_kb']:>9}{r['blocks']:>8}{r['ms']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Cost of resolving locations and of the nearby queries (src/geo.py).
+
+    python bench/bench_geo.py [--points 100,1000,10000] [--size 100000] [--data-dir DIR] [--json]
+
+  resolve_us   Gazetteer lookup of one location string, uncached: an exact
+               name, a name inside longer text, and a misspelling (the
+               difflib fallback)
+  within_us    GridIndex radius query (100 m around a campus point; `hits`
+               is how many points it returns, which is what it mostly costs)
+  nearest_us   and 10-nearest query, over `--points` random points spread
+               over the campus. The app's index holds one point per distinct
+               location string, so a few hundred at most
+  page_ms      the "nearest to a building" list order over a synthetic
+               corpus (see corpus.py) of `--size` posts: the first page, a
+               page 40 pages deep, and the same first page computed the way
+               it would be without the index, by reading and sorting every post
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+
+import corpus  # noqa: E402
+from geo import GridIndex, PlaceIndex, get_gazetteer  # noqa: E402
+
+PAGE = 25
+ORIGIN = "Sprague Library"
+LOCATIONS = {"exact": "Sprague Library", "inside": "left on the 2nd floor of sprague library", "misspelt": "sprage libary"}
+
+
+def per_call_us(calls: int, fn) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def grid_results(points: int, gazetteer) -> dict:
+    rnd = random.Random(7)
+    lats = [p.lat for p in gazetteer.places]
+    lons = [p.lon for p in gazetteer.places]
+    grid = GridIndex(sum(lats) / len(lats))
+    for i in range(points):
+        grid.add(i, rnd.uniform(min(lats), max(lats)), rnd.uniform(min(lons), max(lons)))
+    origin = gazetteer.get(ORIGIN)
+    return {
+        "points": points,
+        "hits": len(grid.within(origin.lat, origin.lon, 100)),
+        "within_us": round(per_call_us(200, lambda: grid.within(origin.lat, origin.lon, 100)), 1),
+        "nearest_us": round(per_call_us(200, lambda: grid.nearest(origin.lat, origin.lon, 10)), 1),
+    }
+
+
+def scan_page(store, gazetteer, origin) -> list:
+    #no index: resolve and measure every post, then sort them all
+    kx = math.cos(math.radians(origin.lat))
+
+    def distance(location):
+        place = gazetteer.resolve(location)
+        if place is None:
+            return math.inf
+        return math.hypot((place.lon - origin.lon) * kx, place.lat - origin.lat)
+
+    rows = store._conn().execute("SELECT seq, location FROM posts").fetchall()
+    rows.sort(key=lambda r: (distance(r["location"]), r["location"], r["seq"]))
+    return [r["seq"] for r in rows[:PAGE]]
+
+
+def page_results(size: int, data_dir: str, gazetteer) -> dict:
+    store = corpus.build_store(size, data_dir)
+    places = PlaceIndex(store, gazetteer)
+    origin = gazetteer.get(ORIGIN)
+    first = places.query_near(origin, limit=PAGE)
+    after = first[-1]
+    for _ in range(40):
+        after = places.query_near(origin, after=after, limit=PAGE)[-1]
+    assert [p.seq for p in first] == scan_page(store, gazetteer, origin)
+    return {
+        "posts": size,
+        "first_page_ms": round(per_call_us(50, lambda: places.query_near(origin, limit=PAGE)) / 1000, 2),
+        "deep_page_ms": round(per_call_us(50, lambda: places.query_near(origin, after=after, limit=PAGE)) / 1000, 2),
+        "scan_page_ms": round(per_call_us(3, lambda: scan_page(store, gazetteer, origin)) / 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", default="100,1000,10000", help="comma-separated grid sizes")
+    parser.add_argument("--size", type=int, default=100000, help="posts in the corpus")
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"), help="where corpora are cached")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    gazetteer = get_gazetteer()
+    results = {
+        "resolve_us": {k: round(per_call_us(200, lambda t=t: gazetteer._resolve(t)), 1) for k, t in LOCATIONS.items()},
+        "grid": [grid_results(int(n), gazetteer) for n in args.points.split(",")],
+        "pages": page_results(args.size, args.data_dir, gazetteer),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print("resolve us   " + "  ".join(f"{k} {v}" for k, v in results["resolve_us"].items()))
+    print(f"{'points':>10}{'hits':>7}{'within us':>11}{'nearest us':>12}")
+    for r in results["grid"]:
+        print(f"{r['points']:>10}{r['hits']:>7}{r['within_us']:>11}{r['nearest_us']:>12}")
+    r = results["pages"]
+    print(f"{r['posts']} posts: first page {r['first_page_ms']} ms, 40 pages deep {r['deep_page_ms']} ms, "
+          f"sorting every post {r['scan_page_ms']} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
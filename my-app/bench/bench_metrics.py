@@ -0,0 +1,127 @@
+"""What the metrics instrumentation (src/metrics.py) costs per call.
+
+    python bench/bench_metrics.py [--calls 200000] [--updates 2000] [--json]
+
+  call_ns          a plain function call, for reference
+  instrument_ns    the same function under @instrument() (two perf_counter
+                   reads, two ControlId probes, two histogram updates)
+  track_ns         an async handler run through track(), as TaskScope.handler
+                   does, against awaiting it directly
+  profiled_ns      track() while a profile capture is on for the session
+  update_us        page.update() of 100 changed Text controls in a headless
+                   session: unwatched, watched with the default payload
+                   sampling, and watched sizing every message
+
+The recorded payload sizes are checked against the bytes the headless
+connection counted, so a mismatch with what goes on the wire shows up here.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+
+import flet as ft  # noqa: E402
+
+import metrics  # noqa: E402
+from harness import HeadlessApp  # noqa: E402
+
+TEXTS = 100
+
+
+def work(x):
+    return x + 1
+
+
+async def handler(x):
+    return x + 1
+
+
+def per_call_ns(calls: int, fn) -> float:
+    start = time.perf_counter_ns()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter_ns() - start) / calls
+
+
+async def per_await_ns(calls: int, make) -> float:
+    start = time.perf_counter_ns()
+    for i in range(calls):
+        await make(i)
+    return (time.perf_counter_ns() - start) / calls
+
+
+async def update_us(updates: int, watch: bool, sample: int) -> tuple:
+    """Mean page.update() time, and (bytes sent, sampled bytes recorded, messages) while timed."""
+    app = HeadlessApp()
+    metrics.PAYLOAD_SAMPLE = sample
+    if watch:
+        metrics.watch_page(app.page)
+    texts = [ft.Text("0") for _ in range(TEXTS)]
+    app.page.add(ft.Column(texts))
+    histogram = metrics.get_metrics()._histograms.get(("msf_update_payload_bytes", "PATCH_CONTROL"))
+    recorded = histogram.sum if histogram else 0
+    sent, messages = app.conn.bytes_sent, app.conn.messages
+    start = time.perf_counter()
+    for n in range(updates):
+        for t in texts:
+            t.value = str(n)
+        app.page.update()
+    elapsed = time.perf_counter() - start
+    histogram = metrics.get_metrics()._histograms.get(("msf_update_payload_bytes", "PATCH_CONTROL"))
+    recorded = (histogram.sum if histogram else 0) - recorded
+    return elapsed / updates * 1e6, (app.conn.bytes_sent - sent, recorded, app.conn.messages - messages)
+
+
+async def run(calls: int, updates: int) -> dict:
+    sample = metrics.PAYLOAD_SAMPLE
+    timed = metrics.instrument()(work)
+    result = {
+        "call_ns": round(per_call_ns(calls, work)),
+        "instrument_ns": round(per_call_ns(calls, timed)),
+        "await_ns": round(await per_await_ns(calls, handler)),
+        "track_ns": round(await per_await_ns(calls, lambda i: metrics.track("handler", handler, i))),
+    }
+
+    app = HeadlessApp()
+    metrics.watch_page(app.page)
+    metrics.start_profile(app.session.id, 60)
+    result["profiled_ns"] = round(await per_await_ns(calls, lambda i: metrics.track("handler", handler, i)))
+    metrics._captures.clear()
+
+    plain, _ = await update_us(updates, watch=False, sample=sample)
+    watched, _ = await update_us(updates, watch=True, sample=sample)
+    every, (sent, recorded, messages) = await update_us(updates, watch=True, sample=1)
+    #the harness counts [action, body] the way the socket server encodes it; so does the wrapper
+    assert sent == recorded, (sent, recorded)
+    result.update({
+        "update_us": round(plain, 1),
+        f"update_watched_1_in_{sample}_us": round(watched, 1),
+        "update_watched_every_us": round(every, 1),
+        "bytes_per_update": round(sent / messages),
+    })
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000, help="calls per micro-benchmark")
+    parser.add_argument("--updates", type=int, default=2000, help="page updates per mode")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.calls, args.updates))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            print(f"{key:>28}  {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Cost of matching new posts to saved searches, and of mailing the alerts (src/notify.py).
+
+    python bench/bench_notify.py [--subscriptions 1000,10000,100000] [--posts 500] [--json]
+
+For each number of subscriptions (random saved searches over the synthetic
+corpus vocabulary, see corpus.py), `--posts` new posts are matched:
+
+  index_us     per post, through the subscription index
+  scan_us      per post, testing every subscription (what the index avoids)
+  checked      subscriptions the index hands over for checking, per post
+  matched      subscriptions matched, per post
+
+and then, in a temp database:
+
+  queue_us     per post, writing its alerts to the outbox (one transaction)
+  mail_ms      mailing everything queued, with a sender that only counts
+  emails       messages sent; one digest per user, however many alerts
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+
+import corpus  # noqa: E402
+import notify  # noqa: E402
+from models import Post  # noqa: E402
+from storage import PostStore  # noqa: E402
+
+USERS = 5000
+
+
+class CountingSender:
+    def __init__(self):
+        self.messages = 0
+
+    def send_batch(self, messages) -> list:
+        self.messages += len(messages)
+        return [None] * len(messages)
+
+
+def saved_searches(n: int, rnd: random.Random):
+    for _ in range(n):
+        item, color = rnd.choice(corpus.ITEMS), rnd.choice(corpus.COLORS)
+        kind = rnd.random()
+        if kind < 0.6:
+            yield {"keywords": f"{color} {item}"}
+        elif kind < 0.95:
+            yield {"category": item, "location": rnd.choice(corpus.LOCATIONS)}
+        else:
+            yield {"location": rnd.choice(corpus.LOCATIONS)}
+
+
+def run(n: int, posts: list, tmp: str) -> dict:
+    rnd = random.Random(n)
+    store = PostStore(os.path.join(tmp, f"notify-{n}.db"))
+    sender = CountingSender()
+    notifier = notify.Notifier(store, sender=sender)
+    #one transaction for all of them; the per-user cap does not matter here
+    notify.MAX_SUBSCRIPTIONS = n
+    with notifier.alerts.batch():
+        for search in saved_searches(n, rnd):
+            notifier.subscribe(f"user{rnd.randrange(USERS)}@montclair.edu", **search)
+    notifier._refresh()
+    subs = list(notifier._subs.values())
+
+    def terms(p):
+        return (str(p.status), notify.category_key(p.category), notifier.place_key(p.location),
+                notify.keyword_terms(f"{p.title} {p.description} {p.category}"))
+
+    start = time.perf_counter()
+    matched = sum(len(notifier.match(p)) for p in posts)
+    index_us = (time.perf_counter() - start) / len(posts) * 1e6
+    checked = sum(len(notifier._index.candidates(*terms(p))) for p in posts)
+
+    start = time.perf_counter()
+    scanned = 0
+    for p in posts:
+        t = terms(p)
+        scanned += sum(1 for s in subs if s.matches(*t) and s.email != p.author)
+    scan_us = (time.perf_counter() - start) / len(posts) * 1e6
+    assert scanned == matched, (scanned, matched)
+
+    start = time.perf_counter()
+    queued = sum(notifier._process([p]) for p in posts)
+    queue_us = (time.perf_counter() - start) / len(posts) * 1e6
+
+    start = time.perf_counter()
+    notifier.deliver(time.time() + notify.DIGEST_DELAY + 1)
+    mail_ms = (time.perf_counter() - start) * 1000
+    return {
+        "subscriptions": n,
+        "index_us": round(index_us, 1),
+        "scan_us": round(scan_us, 1),
+        "checked": round(checked / len(posts), 1),
+        "matched": round(matched / len(posts), 1),
+        "queue_us": round(queue_us, 1),
+        "alerts": queued,
+        "emails": sender.messages,
+        "mail_ms": round(mail_ms),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscriptions", default="1000,10000,100000", help="comma-separated counts")
+    parser.add_argument("--posts", type=int, default=500, help="new posts matched per count")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    posts = [Post.from_dict(dict(p, status="Found", author="")) for p in corpus.generate(args.posts, seed=11)]
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [run(int(n), posts, tmp) for n in args.subscriptions.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'subs':>8}{'index us':>10}{'scan us':>10}{'checked':>9}{'matched':>9}{'queue us':>10}{'alerts':>8}{'emails':>8}{'mail ms':>9}")
+    for r in results:
+        print(f"{r['subscriptions']:>8}{r['index_us']:>10}{r['scan_us']:>10}{r['checked']:>9}{r['matched']:>9}"
+              f"{r['queue_us']:>10}{r['alerts']:>8}{r['emails']:>8}{r['mail_ms']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Memory and (de)serialization cost of Post records against the old row dicts.
+
+    python bench/bench_post_memory.py [--posts 100000] [--data-dir DIR] [--json]
+
+Both representations are built from the same rows of a synthetic corpus (see
+corpus.py): the dicts the store used to return (`dict(row)` over `posts.*`)
+and the Post records it returns now. Reported per representation:
+
+  bytes_per_post  memory held by the materialized list, via tracemalloc
+  load_ns         per-row cost of turning a fetched sqlite row into the record
+  to_row_ns       per-post cost of turning the record back into insert params
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+
+import corpus  # noqa: E402
+from models import Post  # noqa: E402
+from storage import POST_FIELDS, POST_SELECT  # noqa: E402
+
+#what PostStore read before posts became records
+LEGACY_SELECT = "SELECT posts.*, (SELECT COUNT(*) FROM post_matches m WHERE m.post_id = posts.id) AS match_count"
+
+
+def held_bytes(build) -> tuple:
+    """(bytes still allocated once `build()` returns, the built value)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current, value
+
+
+def per_item_ns(fn, items) -> float:
+    start = time.perf_counter_ns()
+    for item in items:
+        fn(item)
+    return (time.perf_counter_ns() - start) / len(items)
+
+
+def run(n: int, data_dir: str) -> list:
+    store = corpus.build_store(n, data_dir)
+    conn = store._conn()
+
+    def legacy():
+        return [dict(r) for r in conn.execute(f"{LEGACY_SELECT} FROM posts")]
+
+    def records():
+        return [Post.from_row(r) for r in conn.execute(f"{POST_SELECT} FROM posts")]
+
+    legacy_bytes, dicts = held_bytes(legacy)
+    post_bytes, posts = held_bytes(records)
+    legacy_rows = conn.execute(f"{LEGACY_SELECT} FROM posts").fetchall()
+    post_rows = conn.execute(f"{POST_SELECT} FROM posts").fetchall()
+    return [
+        {
+            "representation": "dict",
+            "posts": len(dicts),
+            "bytes_per_post": round(legacy_bytes / len(dicts), 1),
+            "load_ns": round(per_item_ns(dict, legacy_rows), 1),
+            "to_row_ns": round(per_item_ns(lambda d: tuple(d.get(f, "") for f in POST_FIELDS), dicts), 1),
+        },
+        {
+            "representation": "Post",
+            "posts": len(posts),
+            "bytes_per_post": round(post_bytes / len(posts), 1),
+            "load_ns": round(per_item_ns(Post.from_row, post_rows), 1),
+            "to_row_ns": round(per_item_ns(Post.to_row, posts), 1),
+        },
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100_000, help="corpus size")
+    parser.add_argument("--data-dir", default=os.path.join(HERE, ".data"), help="where corpora are cached")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.posts, args.data_dir)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'representation':<16}{'posts':>10}{'bytes/post':>12}{'load ns':>10}{'to_row ns':>11}")
+        for r in results:
+            print(f"{r['representation']:<16}{r['posts']:>10}{r['bytes_per_post']:>12.0f}"
+                  f"{r['load_ns']:>10.0f}{r['to_row_ns']:>11.0f}")
+        saved = 1 - results[1]["bytes_per_post"] / results[0]["bytes_per_post"]
+        print(f"\nPost records hold {saved:.0%} less memory than dicts")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Per-call cost and memory of the sign-in rate limiter as tracked keys grow.
+
+    python bench/bench_ratelimit.py [--sizes 1000,10000,100000,1000000] [--json]
+
+For each size the limiter is filled with that many distinct keys (the state
+an address-spraying attacker would leave behind), then timed on:
+
+  hit_ns    an attempt for a key it already tracks (wait + take)
+  miss_ns   an attempt for a new key, which also evicts once the cap is reached
+  sweep_ns  the same attempts after a quarter turn of the time wheel, so
+            sweeping expired slots is paid for inside the timed calls
+
+bytes_per_key is what the filled limiter holds per key, keys included.
+Flat ns columns across sizes are the point: every call is O(1).
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ratelimit import LOGIN_BURST, LOGIN_REFILL_SECONDS, RateLimiter  # noqa: E402
+
+CALLS = 200_000
+
+
+def attempts_ns(limiter: RateLimiter, keys: list, now: float) -> float:
+    start = time.perf_counter_ns()
+    for key in keys:
+        if not limiter.wait(key, now):
+            limiter.take(key, now)
+    return (time.perf_counter_ns() - start) / len(keys)
+
+
+def run_size(n: int) -> dict:
+    keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}/{i}" for i in range(n)]
+    gc.collect()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    limiter = RateLimiter(LOGIN_BURST, LOGIN_REFILL_SECONDS, max_keys=n)
+    now = 1_000_000.0
+    for key in keys:
+        limiter.take(key, now)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    #the key strings were allocated before tracing started; count them in
+    held += sum(sys.getsizeof(k) for k in keys) - base
+
+    rnd = random.Random(1)
+    known = [keys[rnd.randrange(n)] for _ in range(CALLS)]
+    fresh = [f"new/{i}" for i in range(CALLS)]
+    hit = attempts_ns(limiter, known, now)
+    miss = attempts_ns(limiter, fresh, now)
+    later = now + limiter.idle_seconds / 4
+    sweep = attempts_ns(limiter, [keys[rnd.randrange(n)] for _ in range(CALLS)], later)
+    return {
+        "keys": n,
+        "tracked": len(limiter),
+        "bytes_per_key": round(held / n, 1),
+        "hit_ns": round(hit, 1),
+        "miss_ns": round(miss, 1),
+        "sweep_ns": round(sweep, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="comma-separated key counts")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = [run_size(int(s)) for s in args.sizes.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'keys':>10}{'bytes/key':>12}{'hit ns':>10}{'miss ns':>10}{'sweep ns':>10}")
+        for r in results:
+            print(f"{r['keys']:>10}{r['bytes_per_key']:>12.0f}{r['hit_ns']:>10.0f}{r['miss_ns']:>10.0f}{r['sweep_ns']:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Cost of keeping a device's post cache in step with the server (src/sync.py).
+
+    python bench/bench_sync.py [--sizes 1000,10000,100000] [--changes 20] [--json]
+
+For each size a server database is built from the synthetic corpus (see
+corpus.py) and served on localhost; a client with an empty cache then syncs:
+
+  first_s / first_kb   the first sync, a full snapshot of every post
+  delta_s / delta_kb   a later sync after --changes writes on the server
+                       (new posts, status changes and deletes in equal parts)
+  idle_ms / idle_kb    a sync when nothing changed
+
+kb is the JSON the client received. The delta columns should not grow with
+the corpus; that is the point of syncing on the change sequence.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "..", "src"), HERE]
+
+import corpus  # noqa: E402
+from models import Post  # noqa: E402
+from storage import PostStore  # noqa: E402
+from sync import SyncClient, SyncService, serve  # noqa: E402
+
+
+class CountingClient(SyncClient):
+    """Adds up the size of every answer received."""
+    received = 0
+
+    def _request(self, method: str, path: str, body: dict = None) -> dict:
+        answer = super()._request(method, path, body)
+        self.received += len(json.dumps(answer, separators=(",", ":")))
+        return answer
+
+
+def timed_sync(client: CountingClient) -> tuple:
+    client.received = 0
+    started = time.perf_counter()
+    client.sync_once()
+    return time.perf_counter() - started, client.received / 1024
+
+
+def run_size(n: int, changes: int, tmp: str) -> dict:
+    server_store = PostStore(os.path.join(tmp, f"server-{n}.db"))
+    batch = []
+    for p in corpus.generate(n):
+        batch.append(Post.from_dict(p))
+        if len(batch) == 5000:
+            server_store.add_many(batch)
+            batch = []
+    if batch:
+        server_store.add_many(batch)
+    server = serve(SyncService(server_store), "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = CountingClient(PostStore(os.path.join(tmp, f"client-{n}.db")), url=f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        first_s, first_kb = timed_sync(client)
+        assert client.store.count() == n
+
+        third = max(1, changes // 3)
+        server_store.add_many(Post.from_dict(p) for p in corpus.generate(third, seed=n + 1))
+        for p in server_store.list_posts(0, third * 2)[:third]:
+            server_store.set_status(p.id, "Claimed")
+        for p in server_store.list_posts(0, third * 2)[third:]:
+            server_store.delete(p.id)
+        delta_s, delta_kb = timed_sync(client)
+        assert client.store.count() == server_store.count()
+
+        idle_s, idle_kb = timed_sync(client)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        "posts": n,
+        "first_s": round(first_s, 2),
+        "first_kb": round(first_kb),
+        "delta_s": round(delta_s, 3),
+        "delta_kb": round(delta_kb, 1),
+        "idle_ms": round(idle_s * 1000, 1),
+        "idle_kb": round(idle_kb, 2),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated post counts")
+    parser.add_argument("--changes", type=int, default=20, help="server writes between the first and the delta sync")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [run_size(int(s), args.changes, tmp) for s in args.sizes.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'posts':>8}{'first s':>9}{'first KB':>10}{'delta s':>9}{'delta KB':>10}{'idle ms':>9}{'idle KB':>9}")
+        for r in results:
+            print(f"{r['posts']:>8}{r['first_s']:>9}{r['first_kb']:>10}{r['delta_s']:>9}{r['delta_kb']:>10}"
+                  f"{r['idle_ms']:>9}{r['idle_kb']:>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Per-call cost of the auth form validators that run on every keystroke.
+
+    python bench/bench_validators.py [--json] [--max-ns N]
+
+--max-ns makes the run fail (exit 1) when any validator is slower than N
+nanoseconds per call, so a regression in the on_change path shows up in CI.
+The pre-validators.py implementations are measured alongside for reference.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import validators  # noqa: E402
+
+
+#the per-call `import re` versions that used to live inside main()
+def legacy_is_valid_signin_input(value: str) -> bool:
+    import re
+    email_pattern = r'^[a-zA-Z0-9._%+-]+@montclair\.edu$'
+    username_pattern = r'^[a-zA-Z0-9._%+-]+$'
+    return bool(re.match(email_pattern, value) or re.match(username_pattern, value))
+
+
+def legacy_is_valid_email(email: str) -> bool:
+    import re
+    pattern = r'^[a-zA-Z0-9._%+-]+@montclair\.edu$'
+    return re.match(pattern, email) is not None
+
+
+def legacy_is_password_strong(password: str):
+    if len(password) < 8:
+        return False, "Password must be at least 8 characters"
+    if not any(c.isupper() for c in password):
+        return False, "Password must contain at least one uppercase letter"
+    if not any(c.islower() for c in password):
+        return False, "Password must contain at least one lowercase letter"
+    if not any(c.isdigit() for c in password):
+        return False, "Password must contain at least one number"
+    return True, "Password is strong"
+
+
+CASES = [
+    ("is_valid_signin_input", "netid", "jdoe12"),
+    ("is_valid_signin_input", "email", "jdoe12@montclair.edu"),
+    ("is_valid_email", "valid", "jdoe12@montclair.edu"),
+    ("is_valid_email", "invalid", "jdoe12@gmail.com"),
+    ("is_password_strong", "strong", "CorrectHorse9Battery"),
+    ("is_password_strong", "weak", "password"),
+    ("is_password_strong", "long weak", "a" * 64),
+]
+
+LEGACY = {
+    "is_valid_signin_input": legacy_is_valid_signin_input,
+    "is_valid_email": legacy_is_valid_email,
+    "is_password_strong": legacy_is_password_strong,
+}
+
+
+def per_call_ns(fn, arg, repeat: int = 5) -> float:
+    timer = timeit.Timer(lambda: fn(arg))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def run() -> list:
+    results = []
+    for name, label, arg in CASES:
+        results.append({
+            "validator": name,
+            "case": label,
+            "ns_per_call": round(per_call_ns(getattr(validators, name), arg), 1),
+            "legacy_ns_per_call": round(per_call_ns(LEGACY[name], arg), 1),
+        })
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--max-ns", type=float, help="fail if any validator exceeds this per-call cost")
+    args = parser.parse_args(argv)
+
+    results = run()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'validator':<24}{'case':<12}{'ns/call':>10}{'legacy':>10}")
+        for r in results:
+            print(f"{r['validator']:<24}{r['case']:<12}{r['ns_per_call']:>10.0f}{r['legacy_ns_per_call']:>10.0f}")
+
+    if args.max_ns is not None:
+        slow = [r for r in results if r["ns_per_call"] > args.max_ns]
+        for r in slow:
+            print(f"over budget: {r['validator']} ({r['case']}) {r['ns_per_call']:.0f} ns > {args.max_ns:.0f} ns", file=sys.stderr)
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Synthetic lost-and-found posts for benchmarks.
+
+Corpora are deterministic for a given size and seed and are cached as SQLite
+files, so building the 1M-post store is paid for once per machine.
+"""
+import os
+import random
+import uuid
+from datetime import date, timedelta
+
+from models import Post
+from storage import PostStore
+
+ITEMS = ["Wallet", "Keys", "Phone", "Umbrella", "Backpack", "Laptop", "Charger", "AirPods",
+         "Jacket", "Water Bottle", "Student ID", "Glasses", "Notebook", "Calculator", "Headphones"]
+COLORS = ["black", "blue", "red", "green", "grey", "white", "brown", "pink", "silver"]
+DETAILS = ["with a sticker", "in a case", "with initials", "slightly scratched", "brand new",
+           "with a keychain", "left on a table", "near the entrance", "under a chair"]
+LOCATIONS = ["University Hall", "Sprague Library", "Student Center", "Dinallo Heights",
+             "Schmitt Hall", "Recreation Center", "Dickson Hall", "Cali School of Music",
+             "Feliciano School of Business", "Blanton Hall", "Red Hawk Deck", "Yogi Berra Stadium"]
+STATUSES = ["Lost", "Lost", "Found", "Found", "Claimed"]
+
+
+def generate(n: int, seed: int = 7):
+    """Plain post dicts, the shape posts are imported/exported in."""
+    rnd = random.Random(seed)
+    start = date(2024, 1, 1)
+    for i in range(n):
+        item = rnd.choice(ITEMS)
+        color = rnd.choice(COLORS)
+        yield {
+            "id": uuid.UUID(int=rnd.getrandbits(128)).hex,
+            "title": f"{color.title()} {item}",
+            "description": f"{color} {item.lower()} {rnd.choice(DETAILS)}, {rnd.choice(DETAILS)}",
+            "category": item,
+            "location": rnd.choice(LOCATIONS),
+            "date": (start + timedelta(days=rnd.randrange(700))).isoformat(),
+            "contact": f"user{i % 5000}@montclair.edu",
+            "image": "",
+            "status": rnd.choice(STATUSES),
+            "author": f"user{i % 5000}@montclair.edu",
+        }
+
+
+def build_store(n: int, data_dir: str, seed: int = 7, batch_size: int = 5000) -> PostStore:
+    """Return a PostStore holding `n` synthetic posts, reusing a cached file when present."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"corpus-{n}-{seed}.db")
+    store = PostStore(path)
+    have = store.count()
+    if have == n:
+        return store
+    if have:
+        store = None
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        store = PostStore(path)
+    batch = []
+    for post in generate(n, seed):
+        batch.append(Post.from_dict(post))
+        if len(batch) == batch_size:
+            store.add_many(batch)
+            batch = []
+    if batch:
+        store.add_many(batch)
+    return store
@@ -0,0 +1,163 @@
+"""Drive the Flet app without a browser.
+
+A HeadlessApp is a real flet Session whose connection, instead of talking to a
+client, msgpack-encodes every outgoing message exactly like the socket server
+does and records its size. Control diffs, event dispatch and auto-update all go
+through Flet's own code, so the byte counts are what `page.update()` would put
+on the wire.
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import flet as ft  # noqa: E402
+from flet.controls.base_control import BaseControl  # noqa: E402
+from flet.controls.context import _context_page  # noqa: E402
+from flet.controls.id_counter import ControlId  # noqa: E402
+from flet.messaging.connection import Connection  # noqa: E402
+from flet.messaging.protocol import ClientAction, configure_encode_object_for_msgpack  # noqa: E402
+from flet.messaging.session import Session  # noqa: E402
+from flet.pubsub.pubsub_hub import PubSubHub  # noqa: E402
+
+_encode = configure_encode_object_for_msgpack(BaseControl)
+
+
+def encode(message) -> bytes:
+    return msgpack.packb(message, default=_encode)
+
+
+class RecordingConnection(Connection):
+    """Counts what goes out and answers service calls the way a client would.
+
+    SharedPreferences calls are served from `client_storage`, a plain dict that
+    can be handed to the next HeadlessApp to simulate the same device
+    reconnecting; every other method call resolves to None.
+    """
+
+    def __init__(self, client_storage: dict = None):
+        super().__init__()
+        self.messages = 0
+        self.bytes_sent = 0
+        self.session = None
+        self.client_storage = {} if client_storage is None else client_storage
+
+    def send_message(self, message):
+        self.messages += 1
+        self.bytes_sent += len(encode([message.action, message.body]))
+        if message.action == ClientAction.INVOKE_METHOD:
+            body = message.body
+            self.loop.call_soon(
+                self.session.handle_invoke_method_results,
+                body.control_id, body.call_id, self._client_method(body.name, body.args or {}), None
+            )
+
+    def _client_method(self, name: str, args: dict):
+        if name == "get":
+            return self.client_storage.get(args["key"])
+        if name == "set":
+            self.client_storage[args["key"]] = args["value"]
+            return True
+        if name == "remove":
+            return self.client_storage.pop(args["key"], None) is not None
+        if name == "contains_key":
+            return args["key"] in self.client_storage
+        return None
+
+    def get_upload_url(self, file_name: str, expires: int) -> str:
+        return f"/upload/{file_name}?expires={expires}"
+
+
+class HeadlessApp:
+    """One simulated client session. Create it inside a running event loop."""
+
+    def __init__(self, client_storage: dict = None):
+        loop = asyncio.get_running_loop()
+        self.conn = RecordingConnection(client_storage)
+        self.conn.loop = loop
+        self.conn.executor = ThreadPoolExecutor(thread_name_prefix="headless")
+        self.conn.pubsubhub = PubSubHub(loop, self.conn.executor)
+        self.session = Session(self.conn)
+        self.conn.session = self.session
+        self.page = self.session.page
+        _context_page.set(self.page)
+        #the client registration: the initial page patch goes out (and arms list diffing)
+        self.conn.bytes_sent += len(encode(self.session.get_page_patch()))
+
+    #finding controls
+    def walk(self, root=None):
+        stack = [root if root is not None else self.page]
+        seen = set()
+        while stack:
+            c = stack.pop()
+            if isinstance(c, (list, tuple)):
+                stack.extend(reversed(c))
+                continue
+            if not isinstance(c, BaseControl) or id(c) in seen:
+                continue
+            seen.add(id(c))
+            yield c
+            for name in ("views", "controls", "content", "actions", "leading", "title",
+                         "appbar", "items", "overlay"):
+                child = getattr(c, name, None)
+                if child is not None:
+                    stack.append(child)
+
+    def find_all(self, predicate) -> list:
+        return [c for c in self.walk() if predicate(c)]
+
+    def find(self, predicate):
+        found = self.find_all(predicate)
+        if not found:
+            raise LookupError("no matching control on the page")
+        return found[0]
+
+    def by_label(self, label: str):
+        return self.find(lambda c: getattr(c, "label", None) == label)
+
+    def button(self, text: str):
+        return self.find(lambda c: isinstance(c, (ft.Button, ft.OutlinedButton, ft.TextButton)) and c.content == text)
+
+    #user input, delivered the way the client delivers it
+    async def type(self, control, value: str) -> None:
+        self.session.apply_patch(control._i, {"value": value})
+        before = asyncio.all_tasks()
+        await self.session.dispatch_event(control._i, "change", value)
+        #a debounced handler runs as its own task (right away under MSF_DEBOUNCE_MS=0); wait for it
+        started = asyncio.all_tasks() - before
+        if started:
+            await asyncio.gather(*started, return_exceptions=True)
+
+    async def check(self, control, value: bool = True) -> None:
+        """Tick (or untick) a checkbox; its on_change runs like a text field's."""
+        await self.type(control, value)
+
+    async def click(self, control) -> None:
+        await self.session.dispatch_event(control._i, "click", None)
+
+
+class Measurement:
+    """Latency, controls constructed and bytes sent while the block runs."""
+
+    def __init__(self, app: HeadlessApp):
+        self.app = app
+
+    def __enter__(self):
+        self._controls = ControlId.next()
+        self._bytes = self.app.conn.bytes_sent
+        self._messages = self.app.conn.messages
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        #the counter also moved once for our own probe above
+        self.controls_built = ControlId.next() - self._controls - 1
+        self.bytes_sent = self.app.conn.bytes_sent - self._bytes
+        self.messages = self.app.conn.messages - self._messages
+        return False
@@ -0,0 +1,233 @@
+"""Headless load test of the app's screens against synthetic post corpora.
+
+    python bench/run.py [--sizes 1000,10000,100000,1000000] [--repeat 20]
+                        [--out results.json] [--compare baseline.json]
+
+Every scenario drives the real screens through bench/harness.py and reports
+latency percentiles, controls constructed and bytes sent by page.update().
+Each corpus size runs in its own process so store, matcher and image
+singletons start cold. --out writes the results as JSON; --compare prints the
+p50 and bytes deltas against an earlier --out file, so two commits can be
+compared by running this once on each.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(HERE, ".data")
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+
+BENCH_USER = "bench@montclair.edu"
+NEW_POST = {
+    "Item Title": "Blue Wallet",
+    "Description": "blue leather wallet with a campus ID inside",
+    "Last Seen Location": "Sprague Library",
+}
+SEARCH_QUERY = "blue wallet"
+SIGNUP_PASSWORD = "Bench-pass1"
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples: list) -> dict:
+    ms = [s.seconds * 1000 for s in samples]
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(ms, 0.50), 3),
+        "p90_ms": round(percentile(ms, 0.90), 3),
+        "p99_ms": round(percentile(ms, 0.99), 3),
+        "max_ms": round(max(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "controls_built": round(statistics.fmean(s.controls_built for s in samples), 1),
+        "bytes_sent": round(statistics.fmean(s.bytes_sent for s in samples), 1),
+        "messages": round(statistics.fmean(s.messages for s in samples), 1),
+    }
+
+
+async def run_size(size: int, repeat: int, data_dir: str) -> dict:
+    """All scenarios against one corpus; runs in a fresh process (see main)."""
+    from corpus import build_store
+    from harness import HeadlessApp, Measurement
+    import main as app_main
+    from matching import get_matcher
+    import post as post_module
+
+    started = time.perf_counter()
+    store = build_store(size, data_dir)
+    corpus_seconds = time.perf_counter() - started
+    #the process's feed, matcher and alerts run on the corpus; the auth screen's prewarm
+    #would otherwise start them on the scratch store
+    post_module.start_services(store)
+
+    samples = {}
+
+    def record(name: str, m: Measurement) -> None:
+        samples.setdefault(name, []).append(m)
+
+    for n in range(repeat):
+        app = HeadlessApp()
+        with Measurement(app) as m:
+            await app_main.main(app.page)
+        record("auth_screen", m)
+        with Measurement(app) as m:
+            await app.type(app.by_label("NetID"), "jdoe12")
+        record("signin_keystroke", m)
+
+        with Measurement(app) as m:
+            await app.click(app.button("Sign Up"))
+        record("open_signup", m)
+        #a fresh account each run: a taken address returns before the KDF
+        signup = {
+            "Email": f"bench-signup-{n}@montclair.edu",
+            "Password": SIGNUP_PASSWORD,
+            "Confirm Password": SIGNUP_PASSWORD,
+        }
+        with Measurement(app) as m:
+            for label, value in signup.items():
+                await app.type(app.by_label(label), value)
+            await app.check(app.by_label("I agree to the terms"))
+        record("fill_signup", m)
+        with Measurement(app) as m:
+            await app.click(app.button("Sign Up"))
+        record("sign_up", m)
+
+        app = HeadlessApp()
+        with Measurement(app) as m:
+            post_module.main(app.page, posts_store=store, current_user={"email": BENCH_USER, "logged_in": True})
+        record("open_list", m)
+        #let the matcher finish indexing the corpus so it does not compete with the scenarios
+        get_matcher(store)._executor.submit(lambda: None).result()
+
+        load_more = app.button("Load more")
+        if load_more.visible:
+            with Measurement(app) as m:
+                await app.click(load_more)
+            record("load_more", m)
+
+        search = app.by_label("Search title, description, category or location")
+        with Measurement(app) as m:
+            await app.type(search, SEARCH_QUERY)
+        record("search", m)
+        with Measurement(app) as m:
+            await app.type(search, "")
+        record("clear_search", m)
+
+        with Measurement(app) as m:
+            await app.click(app.button("Create Post"))
+        record("open_create", m)
+        with Measurement(app) as m:
+            for label, value in NEW_POST.items():
+                await app.type(app.by_label(label), value)
+        record("fill_form", m)
+        with Measurement(app) as m:
+            await app.click(app.button("Post Lost Item"))
+        record("post_item", m)
+
+        #drop the new post again so the cached corpus keeps its size
+        for row in store._conn().execute("SELECT id FROM posts WHERE author = ?", (BENCH_USER,)).fetchall():
+            store.delete(row["id"])
+            get_matcher(store).remove(row["id"])
+
+    return {
+        "size": size,
+        "corpus_build_s": round(corpus_seconds, 3),
+        "scenarios": {name: summarize(s) for name, s in samples.items()},
+    }
+
+
+def run_child(size: int, repeat: int, data_dir: str) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", str(size),
+           "--repeat", str(repeat), "--data-dir", data_dir]
+    out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(out)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_table(results: list) -> None:
+    print(f"{'size':>9}  {'scenario':<17}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'controls':>10}{'bytes':>10}")
+    for r in results:
+        for name, s in r["scenarios"].items():
+            print(f"{r['size']:>9}  {name:<17}{s['p50_ms']:>9.2f}{s['p90_ms']:>9.2f}{s['p99_ms']:>9.2f}"
+                  f"{s['controls_built']:>10.0f}{s['bytes_sent']:>10.0f}")
+
+
+def print_comparison(results: list, baseline: dict) -> None:
+    before = {(r["size"], name): s for r in baseline["results"] for name, s in r["scenarios"].items()}
+    print(f"\nagainst {baseline.get('commit') or 'baseline'}:")
+    print(f"{'size':>9}  {'scenario':<17}{'p50 before':>11}{'p50 now':>9}{'change':>9}{'bytes before':>14}{'bytes now':>11}")
+    for r in results:
+        for name, s in r["scenarios"].items():
+            b = before.get((r["size"], name))
+            if b is None:
+                continue
+            change = (s["p50_ms"] / b["p50_ms"] - 1) * 100 if b["p50_ms"] else 0.0
+            print(f"{r['size']:>9}  {name:<17}{b['p50_ms']:>11.2f}{s['p50_ms']:>9.2f}{change:>+8.0f}%"
+                  f"{b['bytes_sent']:>14.0f}{s['bytes_sent']:>11.0f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated corpus sizes")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each scenario per size")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where generated corpora are cached")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON from an earlier --out to compare against")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        #before the app modules are imported: accounts and images go to a scratch dir
+        with tempfile.TemporaryDirectory(prefix="msf-bench-", ignore_cleanup_errors=True) as scratch:
+            os.environ.setdefault("MSF_DB_PATH", os.path.join(scratch, "app.db"))
+            os.environ.setdefault("MSF_IMAGE_DIR", os.path.join(scratch, "images"))
+            json.dump(asyncio.run(run_size(args.child, args.repeat, args.data_dir)), sys.stdout)
+        return 0
+
+    results = [run_child(int(s), args.repeat, args.data_dir) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    print_table(results)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+#before the app modules are imported: no debounce delay
+os.environ["MSF_DEBOUNCE_MS"] = "0"
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+if __name__ == "__main__":
+    sys.exit(main())
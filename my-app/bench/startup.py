@@ -0,0 +1,143 @@
+"""Cold-start report for the app entry point.
+
+    python bench/startup.py [--runs 5] [--top 15] [--json] [--max-first-frame-ms N]
+
+Each run starts a fresh interpreter that imports main.py and renders its first
+screen on a headless page. Reported per run (median over --runs):
+
+  process_ms      interpreter launch to first frame, as seen from this process
+  imports_ms      startup.T0 to the end of main.py's imports
+  first_frame_ms  startup.T0 to the first screen being sent
+  prewarm_ms      startup.T0 to the lost items module being ready in the background
+
+One extra run under `python -X importtime` gives the import cost per module.
+--max-first-frame-ms exits 1 when the median process_ms is over budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+CHILD = f"""
+import sys, time, json, asyncio
+sys.path[:0] = [{SRC!r}, {HERE!r}]
+import startup
+import main
+from harness import HeadlessApp
+
+async def run():
+    app = HeadlessApp()
+    await main.main(app.page)
+    frame = time.time()
+    #give the background prewarm a moment to finish so it shows up in the marks
+    for _ in range(100):
+        if "prewarmed post" in startup.marks():
+            break
+        await asyncio.sleep(0.02)
+    return frame
+
+frame = asyncio.run(run())
+print(json.dumps({{"first_frame_wall": frame, "marks": startup.marks()}}))
+"""
+
+
+def child_env() -> dict:
+    scratch = tempfile.mkdtemp(prefix="msf-startup-")
+    env = dict(os.environ)
+    env["MSF_DB_PATH"] = os.path.join(scratch, "app.db")
+    env["MSF_IMAGE_DIR"] = os.path.join(scratch, "images")
+    return env
+
+
+def timed_run() -> dict:
+    launched = time.time()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], env=child_env(), check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    marks = result["marks"]
+    return {
+        "process_ms": round((result["first_frame_wall"] - launched) * 1000, 1),
+        "imports_ms": marks.get("imports"),
+        "first_frame_ms": marks.get("first frame"),
+        "prewarm_ms": marks.get("prewarmed post"),
+    }
+
+
+def import_costs() -> list:
+    """(module, self_us, cumulative_us, depth) from one `-X importtime` run."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD], env=child_env(), check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    ).stderr
+    modules = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def app_modules() -> set:
+    return {f[:-3] for f in os.listdir(SRC) if f.endswith(".py")}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=15, help="heaviest imports to list")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-first-frame-ms", type=float, help="fail if median process_ms exceeds this")
+    args = parser.parse_args(argv)
+
+    runs = [timed_run() for _ in range(args.runs)]
+    summary = {
+        key: round(statistics.median(r[key] for r in runs if r[key] is not None), 1)
+        for key in ("process_ms", "imports_ms", "first_frame_ms", "prewarm_ms")
+        if any(r[key] is not None for r in runs)
+    }
+    modules = import_costs()
+    #top-level imports and the modules they pulled in directly
+    ours = app_modules()
+    top = sorted((m for m in modules if m[3] <= 1), key=lambda m: m[2], reverse=True)[:args.top]
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "startup": summary,
+        "imports_total_ms": round(sum(m[1] for m in modules) / 1000, 1),
+        "heaviest_imports": [{"module": m[0], "cumulative_ms": round(m[2] / 1000, 1)} for m in top],
+        "app_modules": [
+            {"module": m[0], "self_ms": round(m[1] / 1000, 1), "cumulative_ms": round(m[2] / 1000, 1)}
+            for m in modules if m[0] in ours
+        ],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in summary.items():
+            print(f"{key:<16}{value:>10.1f} ms")
+        print(f"\n{'import':<40}{'cumulative ms':>14}")
+        for m in report["heaviest_imports"]:
+            print(f"{m['module']:<40}{m['cumulative_ms']:>14.1f}")
+        print(f"\n{'app module':<40}{'self ms':>14}{'cumulative ms':>14}")
+        for m in report["app_modules"]:
+            print(f"{m['module']:<40}{m['self_ms']:>14.1f}{m['cumulative_ms']:>14.1f}")
+
+    if args.max_first_frame_ms is not None and summary["process_ms"] > args.max_first_frame_ms:
+        print(f"over budget: first frame after {summary['process_ms']:.0f} ms > {args.max_first_frame_ms:.0f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
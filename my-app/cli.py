@@ -0,0 +1,183 @@
+"""Command-line tools for the posts database.
+
+    python cli.py import FILE [--format csv|jsonl] [--status Found] [--author EMAIL]
+                              [--batch 20000] [--rejects FILE] [--dry-run] [--[no-]bulk] [--db PATH]
+    python cli.py export FILE [--format csv|jsonl] [--archived] [--db PATH]
+    python cli.py sync-server [--host 127.0.0.1] [--port 8600] [--db PATH]
+    python cli.py smtp-sink [--host 127.0.0.1] [--port 8025] [--mbox alerts.mbox]
+
+FILE may be - for stdin or stdout. The format follows the file extension
+unless --format says otherwise. Imports take the create form's fields as
+columns (title, description, category, location, date, contact, image,
+status, author, and optionally id); rows the form would refuse are skipped and
+listed in --rejects (JSON Lines) or on stderr. Into an empty database the
+file goes in as one bulk load with the indexes built at the end (--bulk or
+--no-bulk to choose); the imported posts are then matched and checked against
+saved searches before the command returns. Export writes the same columns,
+so an export can be imported into another database as it is.
+
+sync-server serves the database to devices running with MSF_SYNC_URL set
+(see src/sync.py) until interrupted. smtp-sink stands in for a mail server
+for the alert emails (src/notify.py; run the app with MSF_SMTP_HOST=127.0.0.1
+MSF_SMTP_PORT=8025), appending every message it gets to an mbox file.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+
+from bulk import BATCH_SIZE, FORMATS, detect_format, export_posts, import_posts, process_imported, read_records  # noqa: E402
+from changes import CHANGE_RETENTION, PRUNE_INTERVAL  # noqa: E402
+from matching import get_matcher  # noqa: E402
+from models import Status  # noqa: E402
+from notify import get_notifier, serve_smtp  # noqa: E402
+from storage import PostStore, get_store  # noqa: E402
+from sync import SyncService, serve  # noqa: E402
+
+#page cache for the CLI's connection; a batch touches pages all over the posts indexes
+IMPORT_CACHE_MB = 64
+#rejected rows echoed to stderr when there is no --rejects file
+MAX_REJECTS_SHOWN = 20
+
+
+def open_input(path: str):
+    #utf-8-sig drops the byte order mark spreadsheet programs put in front of CSV exports
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def open_output(path: str):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def run_import(args, store) -> int:
+    fmt = args.format or detect_format(args.file)
+    rejects = open(args.rejects, "w", encoding="utf-8") if args.rejects else None
+    shown = [0]
+
+    def on_reject(line, record, problems):
+        if rejects is not None:
+            rejects.write(json.dumps({"line": line, "problems": problems, "record": record}, ensure_ascii=False) + "\n")
+        elif shown[0] < MAX_REJECTS_SHOWN:
+            shown[0] += 1
+            print(f"line {line}: {'; '.join(problems.values())}", file=sys.stderr)
+
+    after = store.last_seq()
+    started = time.perf_counter()
+    try:
+        with open_input(args.file) as stream:
+            stats = import_posts(
+                None if args.dry_run else store, read_records(stream, fmt),
+                default_status=args.status, default_author=args.author,
+                batch_size=args.batch, on_reject=on_reject, bulk=args.bulk,
+            )
+    finally:
+        if rejects is not None:
+            rejects.close()
+    elapsed = time.perf_counter() - started
+    verb = "would import" if args.dry_run else "imported"
+    print(
+        f"{verb} {stats['imported']} of {stats['read']} rows "
+        f"({stats['duplicates']} already stored, {stats['rejected']} rejected) "
+        f"in {elapsed:.1f}s, {stats['read'] / max(elapsed, 1e-9):,.0f} rows/s",
+        file=sys.stderr
+    )
+    if stats["imported"] and not args.dry_run:
+        started = time.perf_counter()
+        count = process_imported(store, after, get_matcher(store), get_notifier(store))
+        print(f"matched {count} imported posts and checked them against saved searches "
+              f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 1 if stats["rejected"] else 0
+
+
+def run_export(args, store) -> int:
+    fmt = args.format or detect_format(args.file)
+    started = time.perf_counter()
+    with open_output(args.file) as stream:
+        count = export_posts(store, stream, fmt, archived=args.archived)
+    elapsed = time.perf_counter() - started
+    print(f"exported {count} posts in {elapsed:.1f}s, {count / max(elapsed, 1e-9):,.0f} rows/s", file=sys.stderr)
+    return 0
+
+
+def run_sync_server(args, store) -> int:
+    server = serve(SyncService(store), args.host, args.port)
+
+    #app processes prune the change log too; this covers a database only the sync server has open
+    def prune():
+        while True:
+            store.prune_changes(time.time() - CHANGE_RETENTION)
+            time.sleep(PRUNE_INTERVAL)
+
+    threading.Thread(target=prune, name="prune-changes", daemon=True).start()
+    print(f"serving {store.path} to syncing devices on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def run_smtp_sink(args) -> int:
+    server = serve_smtp(args.host, args.port, args.mbox)
+    print(f"writing mail sent to {args.host}:{args.port} to {args.mbox}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="posts database (default: MSF_DB_PATH, as the app uses)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="add posts from a CSV or JSON Lines file")
+    importer.add_argument("file", help="file to read, or - for stdin")
+    importer.add_argument("--format", choices=FORMATS)
+    importer.add_argument("--status", default=Status.FOUND.value, choices=[s.value for s in Status],
+                          help="status for rows that leave it blank (default: %(default)s)")
+    importer.add_argument("--author", default="", help="author for rows that leave it blank")
+    importer.add_argument("--batch", type=int, default=BATCH_SIZE, help="rows per transaction")
+    importer.add_argument("--rejects", help="write rejected rows and why to this JSON Lines file")
+    importer.add_argument("--dry-run", action="store_true", help="validate only; write nothing")
+    importer.add_argument("--bulk", action=argparse.BooleanOptionalAction,
+                          help="load in one transaction, building indexes at the end (default: when the database is empty)")
+
+    exporter = commands.add_parser("export", help="write every post to a CSV or JSON Lines file")
+    exporter.add_argument("file", help="file to write, or - for stdout")
+    exporter.add_argument("--format", choices=FORMATS)
+    exporter.add_argument("--archived", action="store_true", help="export the archive instead of live posts")
+
+    sync_server = commands.add_parser("sync-server", help="serve the posts to devices that sync with MSF_SYNC_URL")
+    sync_server.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    sync_server.add_argument("--port", type=int, default=8600)
+
+    smtp_sink = commands.add_parser("smtp-sink", help="a local mail server that keeps the alert emails in an mbox file")
+    smtp_sink.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    smtp_sink.add_argument("--port", type=int, default=8025)
+    smtp_sink.add_argument("--mbox", default="alerts.mbox", help="file to append messages to (default: %(default)s)")
+
+    args = parser.parse_args(argv)
+    if args.command == "smtp-sink":
+        return run_smtp_sink(args)
+    store = PostStore(args.db) if args.db else get_store()
+    if args.command == "import":
+        store.set_cache_mb(IMPORT_CACHE_MB)
+        return run_import(args, store)
+    if args.command == "sync-server":
+        return run_sync_server(args, store)
+    return run_export(args, store)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Background archiving of old posts and compaction of the live store.
+
+Posts older than ARCHIVE_AFTER_DAYS, and posts marked Claimed more than
+ARCHIVE_CLAIMED_AFTER_DAYS ago, are moved to the store's archive table, which
+the list never reads and search does. After each pass the full-text indexes
+are merged, freed pages are handed back and the planner statistics refreshed.
+
+All of it runs on one thread in small steps: each step is sized to hold the
+write lock for about SLICE_MS, and the job rests several times that long
+before the next one, so posting and list reads (which never wait on a writer
+under WAL) carry on as usual while a large backlog drains.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#age at which a post is archived, and how long a claimed post stays listed (0 turns either off)
+ARCHIVE_AFTER_DAYS = float(os.getenv("MSF_ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_CLAIMED_AFTER_DAYS = float(os.getenv("MSF_ARCHIVE_CLAIMED_AFTER_DAYS", "7"))
+ARCHIVE_INTERVAL = float(os.getenv("MSF_ARCHIVE_INTERVAL_SECONDS", "3600"))
+#first pass waits until the app has finished starting up
+ARCHIVE_START_DELAY = 60
+#target length of one step, and how many steps' worth the job rests after each
+SLICE_MS = float(os.getenv("MSF_ARCHIVE_SLICE_MS", "10"))
+REST_FACTOR = 4
+#posts moved per step adapt between these to fit the slice
+MIN_BATCH = 16
+MAX_BATCH = 4096
+MERGE_PAGES = 64
+VACUUM_PAGES = 256
+DAY = 86400
+
+
+class ArchiveJob:
+    """Moves expired posts to the archive and compacts the store, a slice at a time."""
+
+    def __init__(self, store, after_days: float = ARCHIVE_AFTER_DAYS,
+                 claimed_after_days: float = ARCHIVE_CLAIMED_AFTER_DAYS, slice_ms: float = SLICE_MS):
+        self.store = store
+        self.after_days = after_days
+        self.claimed_after_days = claimed_after_days
+        self.slice = slice_ms / 1000
+        self.batch = MIN_BATCH * 4
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self, interval: float = ARCHIVE_INTERVAL, delay: float = ARCHIVE_START_DELAY) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, args=(interval, delay), name="archive", daemon=True).start()
+
+    def _run(self, interval: float, delay: float) -> None:
+        time.sleep(delay)
+        while True:
+            try:
+                stats = self.run_once()
+                if stats["archived"]:
+                    logger.info("archived %(archived)d posts in %(steps)d steps", stats)
+            except Exception:
+                logger.exception("archive pass failed")
+            time.sleep(interval)
+
+    def run_once(self, now: float = None, rest: bool = True) -> dict:
+        """One full pass; returns {"archived", "steps", "busy_seconds"}.
+
+        With `rest` off the steps run back to back (for tools and benchmarks).
+        """
+        now = time.time() if now is None else now
+        created_before = now - self.after_days * DAY if self.after_days > 0 else 0.0
+        claimed_before = now - self.claimed_after_days * DAY if self.claimed_after_days > 0 else 0.0
+        stats = {"archived": 0, "steps": 0, "busy_seconds": 0.0}
+        #a checkpoint inside a step's commit would hold the write lock for it;
+        #run them between steps instead, where they block no one
+        self.store.manual_checkpoints()
+
+        def archive_step() -> bool:
+            started = time.perf_counter()
+            limit = self.batch
+            seqs = self.store.archive_candidates(created_before, claimed_before, limit)
+            if not seqs:
+                return False
+            stats["archived"] += self.store.archive(seqs, now)
+            self._resize(len(seqs), time.perf_counter() - started)
+            return len(seqs) == limit
+
+        #each phase is repeated while it reports more to do
+        phases = [
+            archive_step,
+            lambda: self.store.merge_search_index("posts_fts", MERGE_PAGES),
+            lambda: self.store.merge_search_index("posts_archive_fts", MERGE_PAGES),
+            lambda: self.store.vacuum_step(VACUUM_PAGES),
+            self.store.optimize,
+        ]
+        for step in phases:
+            more = True
+            while more:
+                started = time.perf_counter()
+                more = step()
+                elapsed = time.perf_counter() - started
+                stats["steps"] += 1
+                stats["busy_seconds"] += elapsed
+                self.store.checkpoint()
+                if rest:
+                    time.sleep(max(elapsed, self.slice / 4) * REST_FACTOR)
+        return stats
+
+    def _resize(self, moved: int, elapsed: float) -> None:
+        #size the next step from this one's cost per post, aiming a little under
+        #the slice and moving halfway there so one slow commit does not swing it
+        target = self.slice * 0.8 / max(elapsed / moved, 1e-6)
+        self.batch = int(min(MAX_BATCH, max(MIN_BATCH, (self.batch + target) / 2)))
+
+
+_default_job = None
+_default_lock = threading.Lock()
+
+
+def get_archive_job(store) -> ArchiveJob:
+    global _default_job
+    if _default_job is None:
+        with _default_lock:
+            if _default_job is None:
+                _default_job = ArchiveJob(store)
+    return _default_job
@@ -0,0 +1,144 @@
+"""Post cards for the lost items list, built once and re-bound to other posts.
+
+A card is fifteen or so controls. Building them for every post shown, and
+dropping them again when the list moves on (search, filters, matches),
+allocates more than the rest of a render put together, so cards taken out of
+the list go to a CardPool and the next post shown takes one from there:
+binding sets a handful of values on controls that already exist. Event
+handlers are attached once per card and read the post it is bound to when
+they fire.
+"""
+import flet as ft
+
+#cards kept for reuse per screen; two list pages' worth
+POOL_SIZE = 50
+
+STATUS_COLORS = {
+    "Lost":    ft.Colors.RED_400,
+    "Found":   ft.Colors.GREEN_400,
+    "Claimed": ft.Colors.BLUE_400,
+}
+#badge background per label, "Archived" included; anything else is grey
+BADGE_COLORS = {**STATUS_COLORS, "Archived": ft.Colors.GREY_400}
+BADGE_DEFAULT_COLOR = ft.Colors.GREY_400
+#shared by every badge; never changed after import
+BADGE_PADDING = ft.Padding.symmetric(horizontal=10, vertical=4)
+
+
+def match_label(count: int) -> str:
+    return f"{count} possible match{'es' if count != 1 else ''}"
+
+
+class PostCard:
+    """The controls of one post card. `card` goes in the list; its `data` is this object.
+
+    `on_matches(card)` runs when the matches button is clicked, and
+    `author_actions(card)` builds the status/delete controls the first time
+    the card is bound to a post of the signed-in user.
+    """
+    __slots__ = ("card", "post", "photo", "image", "title", "badge", "actions",
+                 "description", "details", "contact", "matches", "_author_actions")
+
+    def __init__(self, on_matches, author_actions):
+        self.post = None
+        self._author_actions = author_actions
+        self.photo = ft.Container(width=160, height=120, border_radius=8, bgcolor=ft.Colors.GREY_200, visible=False)
+        #created the first time a photo is shown, then its src is swapped
+        self.image = None
+        self.title = ft.Text("", size=16, weight=ft.FontWeight.BOLD, expand=True)
+        self.badge = ft.Container(
+            content=ft.Text("", color=ft.Colors.WHITE, size=12, weight=ft.FontWeight.BOLD),
+            bgcolor=BADGE_DEFAULT_COLOR,
+            border_radius=12,
+            padding=BADGE_PADDING
+        )
+        self.actions = ft.Container(visible=False)
+        self.description = ft.Text("", size=13)
+        self.details = ft.Text("")
+        self.contact = ft.Text("")
+        self.matches = ft.TextButton(icon=ft.Icons.LINK, visible=False, on_click=on_matches(self))
+        self.card = ft.Card(
+            content=ft.Container(
+                content=ft.Column(
+                    controls=[
+                        self.photo,
+                        ft.Row(
+                            controls=[self.title, self.badge, self.actions],
+                            alignment=ft.MainAxisAlignment.SPACE_BETWEEN
+                        ),
+                        self.description,
+                        ft.Row(controls=[self.details]),
+                        ft.Row(controls=[self.contact]),
+                        self.matches,
+                    ],
+                    spacing=6
+                ),
+                padding=12
+            ),
+            elevation=2,
+            data=self
+        )
+
+    def bind(self, p, is_author: bool) -> None:
+        """Show post `p`. The photo is left hidden; the caller fills it (see show_photo)."""
+        self.post = p
+        self.card.visible = True
+        self.title.value = p.title
+        self.set_status("Archived" if p.archived else p.status.value)
+        if is_author and self.actions.content is None:
+            self.actions.content = self._author_actions(self)
+        self.actions.visible = is_author
+        self.description.value = p.description
+        self.details.value = f"Category: {p.category}  |  Location: {p.location}  |  Date: {p.date or 'Unknown'}"
+        self.contact.value = f"Contact: {p.contact}"
+        self.set_match_count(p.match_count)
+        self.photo.visible = False
+        if self.image is not None:
+            self.image.src = None
+
+    def set_status(self, status: str) -> bool:
+        """Restyle the badge; False when it already showed `status`."""
+        label = self.badge.content
+        if label.value == status:
+            return False
+        label.value = status
+        self.badge.bgcolor = BADGE_COLORS.get(status, BADGE_DEFAULT_COLOR)
+        return True
+
+    def set_match_count(self, count: int) -> bool:
+        """Update the matches button; False when nothing about it changed."""
+        content, visible = match_label(count), count > 0
+        if self.matches.content == content and self.matches.visible == visible:
+            return False
+        self.matches.content = content
+        self.matches.visible = visible
+        return True
+
+    def show_photo(self, data: bytes) -> None:
+        if self.image is None:
+            self.image = ft.Image(src=data, fit=ft.BoxFit.COVER, border_radius=8)
+            self.photo.content = self.image
+        else:
+            self.image.src = data
+        self.photo.visible = True
+
+
+class CardPool:
+    """Cards out of the list, kept (up to `size`) for the next posts to be shown.
+
+    Not locked: each lost items screen has its own pool, and every caller runs on
+    that session's event loop.
+    """
+
+    def __init__(self, new_card, size: int = None):
+        self._new_card = new_card
+        self._size = POOL_SIZE if size is None else size
+        self._free = []
+
+    def take(self) -> PostCard:
+        return self._free.pop() if self._free else self._new_card()
+
+    def give(self, card: PostCard) -> None:
+        if len(self._free) < self._size:
+            card.post = None
+            self._free.append(card)
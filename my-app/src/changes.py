@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#how often the change log is checked for commits from other connections/processes
+CHANGE_POLL_MS = int(os.getenv("MSF_CHANGE_POLL_MS", "200"))
+#log rows older than this are pruned; a process that falls further behind gets a reset
+#batch and reloads, and a synced device that does takes a full snapshot (see sync.py)
+CHANGE_RETENTION = float(os.getenv("MSF_CHANGE_RETENTION_HOURS", "1")) * 3600
+PRUNE_INTERVAL = 300
+#change rows read per poll; a larger burst is delivered over several ticks
+CHANGE_BATCH = 1000
+
+
+class ChangeBatch:
+    """Everything that happened to posts since the last tick, collapsed per post.
+
+    `created` and `updated` hold fresh post rows (fetched once per batch, not
+    per subscriber); a post that was created and deleted inside the same batch
+    only shows up in `deleted`. `facets` carries the store's filter counts as of
+    this batch. `reset` means log rows this process never saw were pruned: the
+    lists are empty and subscribers must reload whatever they keep from the store.
+    """
+    __slots__ = ("created", "updated", "deleted", "facets", "reset")
+
+    def __init__(self, created: list, updated: list, deleted: list, facets: dict = None, reset: bool = False):
+        self.created = created
+        self.updated = updated
+        self.deleted = deleted
+        self.facets = facets
+        self.reset = reset
+
+
+class ChangeFeed:
+    """Tails the store's post_changes log and fans batches out to subscribers.
+
+    One thread per process polls the log (a PRAGMA data_version check when
+    nothing changed), so however many sessions are open and however many posts
+    arrive in a burst, each subscriber gets at most one call per tick.
+    Subscribers run on the feed thread and must not block.
+    """
+
+    def __init__(self, store, poll_ms: int = CHANGE_POLL_MS):
+        self.store = store
+        self.interval = poll_ms / 1000
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._cursor = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._cursor = self.store.last_change()
+        threading.Thread(target=self._run, name="change-feed", daemon=True).start()
+
+    def subscribe(self, callback):
+        """Call `callback(batch)` for every ChangeBatch; returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers[callback] = None
+        return lambda: self.unsubscribe(callback)
+
+    def unsubscribe(self, callback) -> None:
+        with self._lock:
+            self._subscribers.pop(callback, None)
+
+    def _run(self) -> None:
+        version = None
+        next_prune = 0.0
+        while True:
+            time.sleep(self.interval)
+            try:
+                current = self.store.data_version()
+                if current != version:
+                    version = current
+                    while self._poll():
+                        pass
+                now = time.time()
+                if now >= next_prune:
+                    next_prune = now + PRUNE_INTERVAL
+                    self.store.prune_changes(now - CHANGE_RETENTION)
+            except Exception:
+                logger.exception("change feed poll failed")
+
+    def _poll(self) -> bool:
+        """Deliver one batch; True when the log may hold more."""
+        oldest, head = self.store.change_bounds()
+        if self._cursor < oldest - 1:
+            logger.warning("change log pruned past seq %d; subscribers reload", self._cursor)
+            self._cursor = head
+            self._publish(ChangeBatch([], [], [], facets=self.store.facet_counts(), reset=True))
+            return False
+        rows = self.store.changes_since(self._cursor, CHANGE_BATCH)
+        if not rows:
+            return False
+        self._cursor = rows[-1]["seq"]
+        created, updated, deleted = {}, set(), set()
+        for row in rows:
+            kind, post_id = row["kind"], row["post_id"]
+            if kind == "create":
+                created[post_id] = None
+                deleted.discard(post_id)
+            elif kind == "delete":
+                created.pop(post_id, None)
+                deleted.add(post_id)
+            elif post_id not in deleted:
+                updated.add(post_id)
+        updated.difference_update(created)
+        posts = self.store.get_many(list(created) + list(updated))
+        batch = ChangeBatch(
+            created=[posts[i] for i in created if i in posts],
+            updated=[posts[i] for i in updated if i in posts],
+            deleted=list(deleted),
+            facets=self.store.facet_counts(),
+        )
+        self._publish(batch)
+        return len(rows) == CHANGE_BATCH
+
+    def _publish(self, batch: ChangeBatch) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(batch)
+            except Exception:
+                #a session that went away without unsubscribing
+                logger.exception("change subscriber failed; dropping it")
+                self.unsubscribe(callback)
+
+
+_default_feed = None
+_default_lock = threading.Lock()
+
+
+def get_feed(store) -> ChangeFeed:
+    global _default_feed
+    if _default_feed is None:
+        with _default_lock:
+            if _default_feed is None:
+                _default_feed = ChangeFeed(store)
+    return _default_feed
@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import DEFAULT_DB_PATH, SQLiteStore
+
+#scrypt cost; raising these makes existing hashes get upgraded on their next login
+SCRYPT_N = int(os.getenv("MSF_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("MSF_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("MSF_SCRYPT_P", "1"))
+#hashlib.scrypt releases the GIL, so a thread pool hashes concurrent logins in parallel
+KDF_WORKERS = int(os.getenv("MSF_KDF_WORKERS", str(os.cpu_count() or 2)))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+USERS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email      TEXT PRIMARY KEY,
+    pw_hash    TEXT NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=128 * r * n * 2 + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+
+def hash_password(password: str, n: int = None, r: int = None, p: int = None) -> str:
+    """Return a self-describing hash: scrypt$n$r$p$salt$key (base64 salt and key)."""
+    n, r, p = n or SCRYPT_N, r or SCRYPT_R, p or SCRYPT_P
+    salt = os.urandom(SALT_BYTES)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password(password: str, encoded: str):
+    """Check `password` against a stored hash.
+
+    Returns (ok, needs_rehash); needs_rehash is True when the hash was made
+    with weaker parameters than the current SCRYPT_* settings.
+    """
+    try:
+        scheme, n, r, p, salt, key = encoded.split("$")
+        n, r, p = int(n), int(r), int(p)
+        salt, key = base64.b64decode(salt), base64.b64decode(key)
+    except ValueError:
+        return False, False
+    if scheme != "scrypt":
+        return False, False
+    ok = hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+    return ok, ok and (n < SCRYPT_N or r < SCRYPT_R or p < SCRYPT_P)
+
+
+#compared against when the account does not exist, so a miss costs as much as a hit
+_DUMMY_HASH = None
+
+
+class CredentialStore(SQLiteStore):
+    """Salted scrypt password hashes, with the KDF run off the UI thread.
+
+    `register` and `authenticate` return concurrent.futures.Future objects;
+    await them with asyncio.wrap_future from async Flet handlers.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, workers: int = KDF_WORKERS):
+        super().__init__(path)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+
+    def init_schema(self, conn: sqlite3.Connection) -> None:
+        conn.executescript(USERS_SCHEMA)
+
+    def exists(self, email: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+
+    def _register(self, email: str, password: str) -> bool:
+        pw_hash = hash_password(password)
+        with self.batch() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO users (email, pw_hash, created_at) VALUES (?, ?, ?)",
+                (email, pw_hash, time.time())
+            )
+            return cur.rowcount > 0
+
+    def _authenticate(self, email: str, password: str) -> bool:
+        global _DUMMY_HASH
+        row = self._conn().execute("SELECT pw_hash FROM users WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            if _DUMMY_HASH is None:
+                _DUMMY_HASH = hash_password("")
+            verify_password(password, _DUMMY_HASH)
+            return False
+        ok, needs_rehash = verify_password(password, row["pw_hash"])
+        if needs_rehash:
+            new_hash = hash_password(password)
+            with self.batch() as conn:
+                #only replace the hash we verified against
+                conn.execute(
+                    "UPDATE users SET pw_hash = ? WHERE email = ? AND pw_hash = ?",
+                    (new_hash, email, row["pw_hash"])
+                )
+        return ok
+
+    def register(self, email: str, password: str):
+        """Future resolving to False when the account already exists."""
+        return self._executor.submit(self._register, email, password)
+
+    def authenticate(self, email: str, password: str):
+        """Future resolving to whether the password is right."""
+        return self._executor.submit(self._authenticate, email, password)
+
+
+_default_credentials = None
+_default_lock = threading.Lock()
+
+
+def get_credentials() -> CredentialStore:
+    global _default_credentials
+    if _default_credentials is None:
+        with _default_lock:
+            if _default_credentials is None:
+                _default_credentials = CredentialStore()
+    return _default_credentials
@@ -0,0 +1,68 @@
+import asyncio
+import inspect
+import logging
+import os
+
+import flet as ft
+
+logger = logging.getLogger(__name__)
+
+#how long input has to stay quiet before a debounced handler runs
+DEBOUNCE_MS = int(os.getenv("MSF_DEBOUNCE_MS", "250"))
+
+
+class Debouncer:
+    """Collapse a burst of on_change events into one call of `handler`.
+
+    Every call restarts the wait; `handler` runs once on the session's event
+    loop with the latest event, `wait_ms` after the last keystroke, so it may
+    update the page like any other handler. A coroutine it returns is run as a
+    task on the loop. Flet's automatic page update after each event is switched
+    off, so the handler has to update the controls it touched itself. Call it
+    from the loop only (Flet runs event handlers there).
+    """
+
+    def __init__(self, handler, wait_ms: int = DEBOUNCE_MS):
+        self.handler = handler
+        self.wait = wait_ms / 1000
+        self._pending = None
+        self._event = None
+        #the loop only keeps weak references to tasks
+        self._running = set()
+
+    def __call__(self, e=None):
+        ft.context.disable_auto_update()
+        if self.wait <= 0:
+            self._run(e)
+            return
+        if self._pending is not None:
+            self._pending.cancel()
+        self._event = e
+        self._pending = asyncio.get_running_loop().call_later(self.wait, self._fire)
+
+    def _fire(self):
+        e, self._event, self._pending = self._event, None, None
+        self._run(e)
+
+    def _run(self, e):
+        result = self.handler(e)
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._running.add(task)
+            task.add_done_callback(self._done)
+
+    def _done(self, task) -> None:
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("debounced handler failed", exc_info=task.exception())
+
+    def cancel(self) -> None:
+        if self._pending is not None:
+            self._pending.cancel()
+        self._event, self._pending = None, None
+
+    def flush(self) -> None:
+        """Run the pending call now, if there is one."""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._fire()
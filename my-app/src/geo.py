@@ -0,0 +1,358 @@
+"""Where posts were last seen: campus places and a grid index over them.
+
+"Last Seen Location" is free text. The Gazetteer resolves it against the
+campus buildings in data/campus_buildings.csv: a name or alias, a name inside
+longer text ("2nd floor of Sprague Library"), then close misspellings.
+PlaceIndex files every distinct location string in the store at the
+coordinates it resolved to, in a grid of CELL_M metre cells, so radius and
+nearest-neighbour queries only look at the cells around a point. The "near a
+building" list order pages through posts one place at a time on the store's
+(location, seq) index instead of scanning every post.
+"""
+import bisect
+import csv
+import difflib
+import heapq
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+GAZETTEER_PATH = os.getenv(
+    "MSF_GAZETTEER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "campus_buildings.csv")
+)
+
+#grid cell edge, about a building's width; a walk-over radius touches a few dozen cells
+CELL_M = 100
+#how alike (difflib ratio) a misspelt name has to be to count as that place
+FUZZY_CUTOFF = 0.85
+#metres per degree of latitude; a degree of longitude is this times cos(latitude)
+M_PER_DEG = 111_320
+#most locations one list query names; keeps the IN list well under SQLite's variable limit
+GROUP_CHUNK = 500
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+#words around a place name that say nothing about which place it is
+_FILLER = frozenset("a an and at by floor for from front in inside near next of on outside room the to".split())
+
+
+def words(text: str) -> tuple:
+    return tuple(w for w in _WORD.findall(text.lower()) if w not in _FILLER)
+
+
+@dataclass(frozen=True, slots=True)
+class Place:
+    name: str
+    lat: float
+    lon: float
+
+
+class Gazetteer:
+    """Campus places by name and alias, with fuzzy lookup of free-text locations."""
+
+    def __init__(self, places: list, aliases: dict):
+        self.places = places
+        self._by_name = {p.name: p for p in places}
+        #word tuple of every name and alias -> place
+        self._by_words = aliases
+        self._longest = max(map(len, aliases), default=0)
+        self._spelled = [(" ".join(k), len(k), p) for k, p in aliases.items()]
+        #locations repeat across posts; each distinct string is resolved once
+        self.resolve = lru_cache(maxsize=8192)(self._resolve)
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        places, aliases = [], {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(line for line in f if not line.startswith("#")):
+                place = Place(row["name"].strip(), float(row["lat"]), float(row["lon"]))
+                places.append(place)
+                for name in [place.name, *(row.get("aliases") or "").split(";")]:
+                    key = words(name)
+                    if key:
+                        aliases.setdefault(key, place)
+        return cls(places, aliases)
+
+    def get(self, name: str):
+        return self._by_name.get(name)
+
+    def _resolve(self, text: str):
+        """The Place a location names, or None."""
+        ws = words(text or "")
+        if not ws:
+            return None
+        place = self._by_words.get(ws)
+        if place is not None:
+            return place
+        #a known name inside longer text, longest first: "by the Sprague Library doors"
+        for n in range(min(len(ws), self._longest), 0, -1):
+            for i in range(len(ws) - n + 1):
+                place = self._by_words.get(ws[i:i + n])
+                if place is not None:
+                    return place
+        #misspellings: the whole text, then runs of as many words as the name has
+        spans = {" ".join(ws): 0}
+        for n in range(1, min(len(ws), self._longest) + 1):
+            for i in range(len(ws) - n + 1):
+                spans.setdefault(" ".join(ws[i:i + n]), n)
+        best, cutoff = None, FUZZY_CUTOFF
+        for span, n in spans.items():
+            for spelled, length, place in self._spelled:
+                if n and n != length:
+                    continue
+                m = difflib.SequenceMatcher(None, span, spelled)
+                if m.real_quick_ratio() >= cutoff and m.quick_ratio() >= cutoff:
+                    ratio = m.ratio()
+                    if ratio >= cutoff:
+                        best, cutoff = place, ratio
+        return best
+
+
+class GridIndex:
+    """Keyed points bucketed into square cells of a flat projection around `ref_lat`.
+
+    Over a campus the projection is off by well under a metre. Not locked.
+    """
+
+    def __init__(self, ref_lat: float, cell_m: float = CELL_M):
+        self.cell_m = cell_m
+        self._kx = M_PER_DEG * math.cos(math.radians(ref_lat))
+        self._cells = {}
+        self._points = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _xy(self, lat: float, lon: float) -> tuple:
+        return lon * self._kx, lat * M_PER_DEG
+
+    def _cell(self, x: float, y: float) -> tuple:
+        return int(x // self.cell_m), int(y // self.cell_m)
+
+    def add(self, key, lat: float, lon: float) -> None:
+        self.remove(key)
+        x, y = self._xy(lat, lon)
+        self._points[key] = (x, y)
+        self._cells.setdefault(self._cell(x, y), {})[key] = (x, y)
+
+    def remove(self, key) -> None:
+        xy = self._points.pop(key, None)
+        if xy is None:
+            return
+        cell = self._cell(*xy)
+        points = self._cells[cell]
+        del points[key]
+        if not points:
+            del self._cells[cell]
+
+    def within(self, lat: float, lon: float, radius_m: float) -> list:
+        """(metres, key) for every point within `radius_m` (may be math.inf), nearest first."""
+        x, y = self._xy(lat, lon)
+        span = 2 * radius_m / self.cell_m + 2
+        if span * span > len(self._cells):
+            cells = self._cells.values()
+        else:
+            (cx0, cy0), (cx1, cy1) = self._cell(x - radius_m, y - radius_m), self._cell(x + radius_m, y + radius_m)
+            cells = [self._cells[c] for c in
+                     ((cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)) if c in self._cells]
+        found = []
+        for points in cells:
+            for key, (px, py) in points.items():
+                d = math.hypot(px - x, py - y)
+                if d <= radius_m:
+                    found.append((d, key))
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> list:
+        """The `k` closest (metres, key), nearest first, looking at rings of cells outwards."""
+        x, y = self._xy(lat, lon)
+        cx, cy = self._cell(x, y)
+        found, visited, r = [], 0, 0
+        while visited < len(self._cells):
+            if r == 0:
+                ring = [(cx, cy)]
+            else:
+                ring = [(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in (-r, r)]
+                ring += [(cx + dx, cy + dy) for dx in (-r, r) for dy in range(-r + 1, r)]
+            for cell in ring:
+                points = self._cells.get(cell)
+                if points is not None:
+                    visited += 1
+                    found.extend((math.hypot(px - x, py - y), key) for key, (px, py) in points.items())
+            #anything in a ring further out is at least r cells away
+            if len(found) >= k and heapq.nsmallest(k, found)[-1][0] <= r * self.cell_m:
+                break
+            r += 1
+        return heapq.nsmallest(k, found)
+
+
+class PlaceIndex:
+    """Every distinct "Last Seen Location" in the store, filed at its campus place.
+
+    Built from the store's location facet counts (one row per distinct
+    string, not per post) and kept current by the change feed. Locations
+    that name no known place are kept aside and listed last.
+    """
+
+    def __init__(self, store, gazetteer: Gazetteer):
+        self.store = store
+        self.gazetteer = gazetteer
+        places = gazetteer.places
+        self._grid = GridIndex(sum(p.lat for p in places) / len(places) if places else 0.0)
+        self._placed = {}
+        self._unplaced = set()
+        #near orders by (origin, radius), dropped whenever a location comes or goes
+        self._orders = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self) -> None:
+        if not self._loaded:
+            self._loaded = True
+            self._sync(self.store.facet_counts()["location"])
+
+    def _add(self, location: str) -> None:
+        if location in self._placed or location in self._unplaced:
+            return
+        place = self.gazetteer.resolve(location)
+        if place is None:
+            self._unplaced.add(location)
+        else:
+            self._placed[location] = place
+            self._grid.add(location, place.lat, place.lon)
+        self._orders.clear()
+
+    def _sync(self, locations) -> None:
+        for location in [l for l in (*self._placed, *self._unplaced) if l not in locations]:
+            self._placed.pop(location, None)
+            self._unplaced.discard(location)
+            self._grid.remove(location)
+            self._orders.clear()
+        for location in locations:
+            self._add(location)
+
+    def apply_changes(self, batch) -> None:
+        """ChangeFeed subscriber: file locations that appeared, forget ones no post uses any more."""
+        with self._lock:
+            if not self._loaded:
+                return
+            if batch.facets is not None:
+                self._sync(batch.facets["location"])
+            else:
+                for p in (*batch.created, *batch.updated):
+                    self._add(p.location)
+
+    def place_of(self, location: str):
+        with self._lock:
+            self._load()
+            place = self._placed.get(location)
+        return place if place is not None or location in self._unplaced else self.gazetteer.resolve(location)
+
+    def within(self, lat: float, lon: float, radius_m: float) -> list:
+        """(metres, location) for every location within `radius_m` of a point, nearest first."""
+        with self._lock:
+            self._load()
+            return self._grid.within(lat, lon, radius_m)
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> list:
+        with self._lock:
+            self._load()
+            return self._grid.nearest(lat, lon, k)
+
+    def _order(self, origin: Place, radius_m) -> tuple:
+        """([locations per place, nearest place first], {location: group}), cached.
+
+        A place with more than GROUP_CHUNK locations (the unknown ones, mostly)
+        is split into consecutive groups of sorted locations, so the order does
+        not change and no group needs a longer IN list.
+        """
+        key = (origin, radius_m)
+        order = self._orders.get(key)
+        if order is None:
+            hits = self._grid.within(origin.lat, origin.lon, math.inf if radius_m is None else radius_m)
+            groups, by_place = [], {}
+            for _, location in hits:
+                place = self._placed[location]
+                if place not in by_place:
+                    by_place[place] = len(groups)
+                    groups.append([])
+                groups[by_place[place]].append(location)
+            if radius_m is None and self._unplaced:
+                groups.append(list(self._unplaced))
+            for g in groups:
+                g.sort()
+            groups = [g[i:i + GROUP_CHUNK] for g in groups for i in range(0, len(g), GROUP_CHUNK)]
+            order = self._orders[key] = (groups, {l: i for i, g in enumerate(groups) for l in g})
+        return order
+
+    def near_key(self, origin: Place, p, radius_m=None):
+        """Where post `p` sorts in the near order, or None when it is outside the radius.
+
+        Also None for a location the change feed has not filed yet; filing it
+        here would drop every cached order on a lookup.
+        """
+        with self._lock:
+            self._load()
+            group = self._order(origin, radius_m)[1].get(p.location)
+        return None if group is None else (group, p.location, p.seq)
+
+    def query_near(self, origin: Place, filters=None, after=None, limit: int = 25, radius_m=None) -> list:
+        """Posts matching `filters`, those last seen nearest `origin` first, continuing after post `after`.
+
+        Places go nearest first (unknown locations last, unless `radius_m`
+        leaves them out); within a place posts go by location, then oldest
+        first. A page reads on from the location the last one stopped in, then
+        takes one query per place after it, all on the (location, seq) index.
+        """
+        filters = dict(filters or {})
+        with self._lock:
+            self._load()
+            groups, rank = self._order(origin, radius_m)
+        start = 0
+        if after is not None:
+            start = rank.get(after.location)
+            if start is None:
+                return []
+        if filters.get("location"):
+            only = rank.get(filters["location"])
+            groups = [[filters["location"]] if i == only else [] for i in range(len(groups))]
+        rows = []
+        for group in groups[start:]:
+            if after is not None:
+                #finish the location the last page stopped in (a seq range on the index), then the rest of its place
+                rows.extend(self.store.query_posts({**filters, "location": after.location}, "oldest", after=after, limit=limit))
+                group = group[bisect.bisect_right(group, after.location):]
+                after = None
+            if group and len(rows) < limit:
+                rows.extend(self.store.query_posts({**filters, "locations": group}, "location", limit=limit - len(rows)))
+            if len(rows) >= limit:
+                break
+        return rows
+
+
+_default_gazetteer = None
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    global _default_gazetteer
+    if _default_gazetteer is None:
+        with _default_lock:
+            if _default_gazetteer is None:
+                _default_gazetteer = Gazetteer.load()
+    return _default_gazetteer
+
+
+def get_places(store) -> PlaceIndex:
+    global _default_index
+    if _default_index is None:
+        gazetteer = get_gazetteer()
+        with _default_lock:
+            if _default_index is None:
+                _default_index = PlaceIndex(store, gazetteer)
+    return _default_index
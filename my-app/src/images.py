@@ -0,0 +1,293 @@
+import hashlib
+import http.client
+import ipaddress
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tasks import get_scheduler
+
+#content-addressed image store: <IMAGE_DIR>/<ab>/<sha256>/{original,thumb.jpg,thumb.webp,large.webp}
+IMAGE_DIR = os.getenv(
+    "MSF_IMAGE_DIR",
+    os.path.join(os.getenv("FLET_APP_STORAGE_DATA", "."), "images")
+)
+#where the web build's FilePicker uploads land before they are ingested
+UPLOAD_DIR = os.getenv(
+    "MSF_UPLOAD_DIR",
+    os.path.join(os.getenv("FLET_APP_STORAGE_TEMP", tempfile.gettempdir()), "msf-uploads")
+)
+
+THUMB_SIZE = (320, 240)
+LARGE_SIZE = (1280, 1280)
+THUMB_VARIANT = "thumb.webp"
+IMAGE_WORKERS = int(os.getenv("MSF_IMAGE_WORKERS", "2"))
+THUMB_CACHE_BYTES = int(os.getenv("MSF_THUMB_CACHE_MB", "32")) * 1024 * 1024
+MAX_IMAGE_BYTES = 15 * 1024 * 1024
+#redirects followed when fetching a pasted image URL
+MAX_REDIRECTS = 3
+
+
+class ImageError(Exception):
+    pass
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """socket.create_connection() for hosts on the public internet only.
+
+    Pasted image URLs are fetched by the server, so every address the host
+    resolves to is checked (loopback, private, link-local and reserved ranges
+    are refused) and the socket connects to an address that passed, not to a
+    second lookup.
+    """
+    host, port = address
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for *_, sockaddr in infos:
+        ip = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ImageError("Images can only be fetched from public addresses")
+    error = None
+    for family, kind, proto, _, sockaddr in infos:
+        sock = socket.socket(family, kind, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error or OSError(f"could not connect to {host}")
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _RedirectHandler(urllib.request.HTTPRedirectHandler):
+    max_redirections = MAX_REDIRECTS
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not newurl.lower().startswith(("http://", "https://")):
+            raise ImageError("Only http(s) image URLs are supported")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+#no proxies: the address checks have to see the image host itself
+_url_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _RedirectHandler
+)
+
+
+def is_digest(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def image_path(root: str, digest: str, variant: str = "original") -> str:
+    return os.path.join(root, digest[:2], digest, variant)
+
+
+def make_variants(root: str, digest: str) -> None:
+    """Decode an original once and write its resized variants.
+
+    Module level so the scheduler can run it in a worker process: decoding and
+    resizing are pure CPU and would otherwise hold the GIL the UI needs.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(image_path(root, digest)) as im:
+            im = ImageOps.exif_transpose(im).convert("RGB")
+            large = im.copy()
+            large.thumbnail(LARGE_SIZE)
+            thumb = ImageOps.fit(im, THUMB_SIZE)
+    except OSError as e:
+        raise ImageError(f"Not a readable image: {e}") from e
+    #write the variants under temp names first so readers never see half a file
+    for variant, img, fmt, opts in (
+        ("large.webp", large, "WEBP", {"quality": 80}),
+        ("thumb.jpg", thumb, "JPEG", {"quality": 80, "optimize": True}),
+        (THUMB_VARIANT, thumb, "WEBP", {"quality": 75}),
+    ):
+        target = image_path(root, digest, variant)
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        img.save(tmp, fmt, **opts)
+        os.replace(tmp, target)
+
+
+class ThumbnailCache:
+    """LRU of thumbnail bytes, evicting least recently used entries by total size."""
+
+    def __init__(self, max_bytes: int = THUMB_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class ImagePipeline:
+    """Ingests post photos and hands out thumbnails without blocking the UI.
+
+    Hashing and file I/O happen on a small worker pool and decoding/resizing in
+    the scheduler's worker processes; callers get their result through a
+    callback (which runs on a worker thread).
+    """
+
+    def __init__(self, root: str = IMAGE_DIR, workers: int = IMAGE_WORKERS):
+        self.root = root
+        self.cache = ThumbnailCache()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+
+    def path(self, digest: str, variant: str = "original") -> str:
+        return image_path(self.root, digest, variant)
+
+    #ingest
+    def _store_original(self, src_path: str) -> str:
+        h = hashlib.sha256()
+        with open(src_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        target = self.path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{threading.get_ident()}.tmp"
+            shutil.copyfile(src_path, tmp)
+            os.replace(tmp, target)
+        return digest
+
+    def _make_variants(self, digest: str) -> None:
+        if os.path.exists(self.path(digest, THUMB_VARIANT)):
+            return
+        get_scheduler().cpu(make_variants, self.root, digest).result()
+
+    def _ingest_file(self, src_path: str) -> str:
+        if os.path.getsize(src_path) > MAX_IMAGE_BYTES:
+            raise ImageError("Image is larger than 15 MB")
+        digest = self._store_original(src_path)
+        self._make_variants(digest)
+        return digest
+
+    def _ingest_url(self, url: str) -> str:
+        if not url.lower().startswith(("http://", "https://")):
+            raise ImageError("Only http(s) image URLs are supported")
+        fd, tmp = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as out, _url_opener.open(url, timeout=15) as resp:
+                copied = 0
+                for chunk in iter(lambda: resp.read(1 << 16), b""):
+                    copied += len(chunk)
+                    if copied > MAX_IMAGE_BYTES:
+                        raise ImageError("Image is larger than 15 MB")
+                    out.write(chunk)
+            return self._ingest_file(tmp)
+        finally:
+            os.unlink(tmp)
+
+    def _ingest_upload(self, src_path: str) -> str:
+        #the upload is only a staging copy; it goes whether or not it was usable
+        try:
+            return self._ingest_file(src_path)
+        finally:
+            try:
+                os.unlink(src_path)
+            except FileNotFoundError:
+                pass
+
+    def _run(self, fn, arg, on_done, on_error):
+        try:
+            result = fn(arg)
+        except Exception as e:
+            if on_error is not None:
+                on_error(e)
+            return
+        if on_done is not None:
+            on_done(result)
+
+    def ingest_file(self, src_path: str, on_done=None, on_error=None):
+        """Copy a local/uploaded file into the store; `on_done(digest)` once thumbnails exist."""
+        return self._executor.submit(self._run, self._ingest_file, src_path, on_done, on_error)
+
+    def ingest_upload(self, src_path: str, on_done=None, on_error=None):
+        """Like ingest_file, for a file uploaded into UPLOAD_DIR, which is removed afterwards."""
+        return self._executor.submit(self._run, self._ingest_upload, src_path, on_done, on_error)
+
+    def ingest_url(self, url: str, on_done=None, on_error=None):
+        """Download a remote image once and store it like an upload."""
+        return self._executor.submit(self._run, self._ingest_url, url, on_done, on_error)
+
+    #serve
+    def _read_thumbnail(self, digest: str) -> bytes:
+        path = self.path(digest, THUMB_VARIANT)
+        if not os.path.exists(path):
+            self._make_variants(digest)
+        with open(path, "rb") as f:
+            data = f.read()
+        self.cache.put(digest, data)
+        return data
+
+    def thumbnail(self, digest: str, on_ready, on_error=None):
+        """Return cached thumbnail bytes, or None and pass them to `on_ready` once loaded."""
+        data = self.cache.get(digest)
+        if data is not None:
+            return data
+        self._executor.submit(self._run, self._read_thumbnail, digest, on_ready, on_error)
+        return None
+
+
+_default_pipeline = None
+_default_lock = threading.Lock()
+
+
+def get_pipeline() -> ImagePipeline:
+    global _default_pipeline
+    if _default_pipeline is None:
+        with _default_lock:
+            if _default_pipeline is None:
+                _default_pipeline = ImagePipeline()
+    return _default_pipeline
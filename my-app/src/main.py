@@ -1,6 +1,21 @@
+#first, so the startup clock starts before flet and the app modules load
+import startup
+import asyncio
 import flet as ft
+from debounce import Debouncer
+from metrics import instrument, start_exporters, watch_page
+from ratelimit import client_key, get_login_guard, retry_message
+from credentials import get_credentials
+from sessions import CLIENT_STORAGE_KEY, get_sessions
+from tasks import session_tasks
+from validators import is_password_strong, is_valid_email, is_valid_signin_input, normalize_to_email
 
-def main(page: ft.Page) -> None:
+startup.mark("imports")
+
+#how long to wait for the client to return a remembered session token
+SESSION_RESTORE_TIMEOUT = 5
+
+async def main(page: ft.Page) -> None:
     page.title = "Montclair State Find"
     page.vertical_alignment = ft.MainAxisAlignment.CENTER
     page.window_width = 360
@@ -8,42 +23,35 @@ def main(page: ft.Page) -> None:
     page.padding = 20
     page.theme_mode = ft.ThemeMode.LIGHT
 
-    
-    users = {}
+    #salted scrypt hashes, shared by every session; hashing runs on the KDF pool
+    credentials = get_credentials()
+    #signed session tokens; the token itself lives in the client's SharedPreferences
+    sessions = get_sessions()
+    #sign-in attempts are throttled per account and per client address
+    login_guard = get_login_guard()
+    client_storage = ft.SharedPreferences()
+    #this session's share of the background pools; database calls go through it
+    tasks = session_tasks(page)
+    #handler and render timings, update payload sizes, and on-demand profiling (see metrics.py)
+    watch_page(page)
+    start_exporters()
+    tasks.on_busy = lambda: page.show_dialog(ft.SnackBar(ft.Text("Still working on your last request...")))
 
     
-    current_user = {"email": "", "logged_in": False}
-
-    def is_valid_signin_input(value: str) -> bool:
-        import re
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@montclair\.edu$'
-        username_pattern = r'^[a-zA-Z0-9._%+-]+$'
-        return bool(re.match(email_pattern, value) or re.match(username_pattern, value))
-
-    def normalize_to_email(value: str) -> str:
-        if "@" not in value:
-            return f"{value}@montclair.edu"
-        return value
-
-
-    #error containers
-    signin_email_error = ft.Container(content=ft.Text("", color=ft.Colors.RED, size=12), visible=False, padding=ft.padding.only(bottom=5))
-    signin_password_error = ft.Container(content=ft.Text("", color=ft.Colors.RED, size=12), visible=False, padding=ft.padding.only(bottom=5))
+    current_user = {"email": "", "logged_in": False, "token": ""}
 
-    signup_email_error = ft.Container(content=ft.Text("", color=ft.Colors.RED, size=12), visible=False, padding=ft.padding.only(bottom=5))
-    signup_password_error = ft.Container(content=ft.Text("", color=ft.Colors.RED, size=12), visible=False, padding=ft.padding.only(bottom=5))
-    signup_confirm_error = ft.Container(content=ft.Text("", color=ft.Colors.RED, size=12), visible=False, padding=ft.padding.only(bottom=5))
+    #controls for each screen are built the first time it is shown (see the screen
+    #builders below); a restored session never builds the sign-up form
+    signin_email = signin_password = signin_button = None
+    signin_email_error = signin_password_error = None
+    signup_email = signup_password = signup_confirm = signup_checkbox = signup_button = None
+    signup_email_error = signup_password_error = signup_confirm_error = None
+    screens = {}
+    #the saved-search alerts banner while it is on screen
+    alert_banner = {"banner": None}
 
-    #UI controls
-    signin_email = ft.TextField(label="NetID", width=260)
-    signin_password = ft.TextField(label="Password", width=260, password=True)
-    signin_button = ft.ElevatedButton("Sign In", width=260, disabled=True)
-
-    signup_email = ft.TextField(label="Email", width=260)
-    signup_password = ft.TextField(label="Password", width=260, password=True)
-    signup_confirm = ft.TextField(label="Confirm Password", width=260, password=True)
-    signup_checkbox = ft.Checkbox(label="I agree to the terms", value=False)
-    signup_button = ft.ElevatedButton("Sign Up", width=260, disabled=True)
+    def error_container() -> ft.Container:
+        return ft.Container(content=ft.Text("", color=ft.Colors.RED, size=12), visible=False, padding=ft.padding.only(bottom=5))
 
     #helpers for error handling
     def set_error(container: ft.Container, message: str) -> None:
@@ -54,52 +62,48 @@ def main(page: ft.Page) -> None:
         container.content.value = ""
         container.visible = False
 
-    #validation helpers
-    def is_valid_email(email: str) -> bool:
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@montclair\.edu$'
-        return re.match(pattern, email) is not None
-
-    def is_password_strong(password: str):
-        if len(password) < 8:
-            return False, "Password must be at least 8 characters"
-        if not any(c.isupper() for c in password):
-            return False, "Password must contain at least one uppercase letter"
-        if not any(c.islower() for c in password):
-            return False, "Password must contain at least one lowercase letter"
-        if not any(c.isdigit() for c in password):
-            return False, "Password must contain at least one number"
-        return True, "Password is strong"
-
-    #screen builders
+    #screen builders; each runs once per session and the result is reused
+    def screen(name: str, build):
+        if name not in screens:
+            screens[name] = build()
+        return screens[name]
+
+    def build_signin_screen():
+        nonlocal signin_email, signin_password, signin_button, signin_email_error, signin_password_error
+        signin_email_error = error_container()
+        signin_password_error = error_container()
+        signin_email = ft.TextField(label="NetID", width=260, on_change=validate_signin)
+        signin_password = ft.TextField(label="Password", width=260, password=True, on_change=validate_signin)
+        signin_button = ft.ElevatedButton("Sign In", width=260, disabled=True, on_click=on_signin)
+        return ft.Row(
+            controls=[
+                ft.Column(
+                    controls=[
+                        ft.Text("Welcome Back!", size=24, weight=ft.FontWeight.BOLD),
+                        signin_email,
+                        signin_password,
+                        signin_button,
+                        signin_email_error,
+                        signin_password_error,
+                        ft.Row(
+                            controls=[ft.Text("Don't have an account?"), ft.TextButton("Sign Up", on_click=lambda _: show_signup_screen())],
+                            alignment=ft.MainAxisAlignment.CENTER,
+                            spacing=5
+                        )
+                    ],
+                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                    spacing=15
+                )
+            ],
+            alignment=ft.MainAxisAlignment.CENTER
+        )
+
     def show_signin_screen():
         page.clean()
         page.appbar = None
-        page.add(
-            ft.Row(
-                controls=[
-                    ft.Column(
-                        controls=[
-                            ft.Text("Welcome Back!", size=24, weight=ft.FontWeight.BOLD),
-                            signin_email,
-                            signin_password,
-                            signin_button,
-                            signin_email_error,
-                            signin_password_error,
-                            ft.Row(
-                                controls=[ft.Text("Don't have an account?"), ft.TextButton("Sign Up", on_click=lambda _: show_signup_screen())],
-                                alignment=ft.MainAxisAlignment.CENTER,
-                                spacing=5
-                            )
-                        ],
-                        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                        spacing=15
-                    )
-                ],
-                alignment=ft.MainAxisAlignment.CENTER
-            )
-        )
+        page.add(screen("signin", build_signin_screen))
         
+        validate_signin.cancel()
         signin_email.value = ""
         signin_password.value = ""
         clear_error(signin_email_error)
@@ -107,37 +111,49 @@ def main(page: ft.Page) -> None:
         signin_button.disabled = True
         page.update()
 
+    def build_signup_screen():
+        nonlocal signup_email, signup_password, signup_confirm, signup_checkbox, signup_button
+        nonlocal signup_email_error, signup_password_error, signup_confirm_error
+        signup_email_error = error_container()
+        signup_password_error = error_container()
+        signup_confirm_error = error_container()
+        signup_email = ft.TextField(label="Email", width=260, on_change=validate_signup)
+        signup_password = ft.TextField(label="Password", width=260, password=True, on_change=validate_signup)
+        signup_confirm = ft.TextField(label="Confirm Password", width=260, password=True, on_change=validate_signup)
+        signup_checkbox = ft.Checkbox(label="I agree to the terms", value=False, on_change=validate_signup)
+        signup_button = ft.ElevatedButton("Sign Up", width=260, disabled=True, on_click=on_signup)
+        return ft.Row(
+            controls=[
+                ft.Column(
+                    controls=[
+                        ft.Text("Create Account", size=24, weight=ft.FontWeight.BOLD),
+                        signup_email,
+                        signup_password,
+                        signup_confirm,
+                        signup_checkbox,
+                        signup_button,
+                        signup_email_error,
+                        signup_password_error,
+                        signup_confirm_error,
+                        ft.Row(
+                            controls=[ft.Text("Already have an account?"), ft.TextButton("Sign In", on_click=lambda _: show_signin_screen())],
+                            alignment=ft.MainAxisAlignment.CENTER,
+                            spacing=5
+                        )
+                    ],
+                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                    spacing=15
+                )
+            ],
+            alignment=ft.MainAxisAlignment.CENTER
+        )
+
     def show_signup_screen():
         page.clean()
         page.appbar = None
-        page.add(
-            ft.Row(
-                controls=[
-                    ft.Column(
-                        controls=[
-                            ft.Text("Create Account", size=24, weight=ft.FontWeight.BOLD),
-                            signup_email,
-                            signup_password,
-                            signup_confirm,
-                            signup_checkbox,
-                            signup_button,
-                            signup_email_error,
-                            signup_password_error,
-                            signup_confirm_error,
-                            ft.Row(
-                                controls=[ft.Text("Already have an account?"), ft.TextButton("Sign In", on_click=lambda _: show_signin_screen())],
-                                alignment=ft.MainAxisAlignment.CENTER,
-                                spacing=5
-                            )
-                        ],
-                        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                        spacing=15
-                    )
-                ],
-                alignment=ft.MainAxisAlignment.CENTER
-            )
-        )
+        page.add(screen("signup", build_signup_screen))
         #reset signup fields
+        validate_signup.cancel()
         signup_email.value = ""
         signup_password.value = ""
         signup_confirm.value = ""
@@ -148,28 +164,25 @@ def main(page: ft.Page) -> None:
         signup_button.disabled = True
         page.update()
 
+    @instrument()
     def open_lost_items_module():
-
-        if not hasattr(page, "lost_items_store"):
-            page.lost_items_store = []
-
-        
+        #the list shows the posts the banner was about
+        close_alert_banner(seen=True)
         page.clean()
 
-        
+        #posts live in the shared on-disk store, not on this page
         from post import main as lost_main
-        lost_main(page, on_back=show_welcome_page, posts_store=page.lost_items_store, current_user=current_user)    
+        from storage import get_store
+        lost_main(page, on_back=show_welcome_page, posts_store=get_store(), current_user=current_user)    
 
-    def show_welcome_page():
-        page.clean()
-        page.appbar = ft.AppBar(
+    def build_welcome_screen():
+        appbar = ft.AppBar(
             title=ft.Text(f"You're in!"),
             center_title=False,
             bgcolor=ft.Colors.RED_200,
             actions=[ft.IconButton(ft.Icons.EXIT_TO_APP, on_click=sign_out)]
         )
-        page.add(
-        ft.Column(
+        body = ft.Column(
             controls=[
                 ft.Row(controls=[ft.Text(f"Welcome!", size=20)], alignment=ft.MainAxisAlignment.CENTER),
                 ft.Row(controls=[ft.Text("You're successfully signed in!", size=16)], alignment=ft.MainAxisAlignment.CENTER),
@@ -190,8 +203,46 @@ def main(page: ft.Page) -> None:
             alignment=ft.MainAxisAlignment.CENTER,
             spacing=20
         )
-        )
+        return appbar, body
+
+    @instrument()
+    def show_welcome_page():
+        page.clean()
+        page.appbar, body = screen("welcome", build_welcome_screen)
+        page.add(body)
         page.update()
+        page.run_task(show_alerts)
+
+    #saved-search alerts (see notify.py) stay on the welcome page until viewed or dismissed
+    async def show_alerts():
+        from notify import get_notifier
+        from storage import get_store
+
+        email = current_user["email"]
+        notifier = await tasks.io(lambda: get_notifier(get_store()))
+        count, rows = await tasks.io(notifier.unseen, email)
+        if not count or current_user["email"] != email or alert_banner["banner"] is not None:
+            return
+        titles = ", ".join(r["title"] for r in rows) + (", ..." if count > len(rows) else "")
+        banner = ft.Banner(
+            leading=ft.Icon(ft.Icons.NOTIFICATIONS_ACTIVE, color=ft.Colors.RED_400),
+            content=ft.Text(f"{count} new post{'s' if count != 1 else ''} match{'es' if count == 1 else ''} your saved searches: {titles}"),
+            actions=[
+                ft.TextButton("View", on_click=lambda _: open_lost_items_module()),
+                ft.TextButton("Dismiss", on_click=lambda _: close_alert_banner(seen=True)),
+            ],
+            bgcolor=ft.Colors.AMBER_50
+        )
+        alert_banner.update(banner=banner, notifier=notifier, email=email)
+        page.show_dialog(banner)
+
+    def close_alert_banner(seen: bool) -> None:
+        banner, alert_banner["banner"] = alert_banner["banner"], None
+        if banner is None:
+            return
+        page.pop_dialog()
+        if seen:
+            page.run_task(tasks.io, alert_banner["notifier"].mark_seen, alert_banner["email"])
 
 
     #Event handlers
@@ -207,10 +258,12 @@ def main(page: ft.Page) -> None:
             clear_error(signin_email_error)
 
         signin_button.disabled = not (input_valid and pw)
-        page.update()
+        page.update(signin_email_error, signin_button)
 
 
-    def on_signin(_):
+    @instrument()
+    async def on_signin(_):
+        validate_signin.cancel()
         value = signin_email.value
         pw = signin_password.value
 
@@ -222,11 +275,34 @@ def main(page: ft.Page) -> None:
         # Normalize to full email for lookup
         email = normalize_to_email(value)                   
 
-        if email in users and users[email] == pw:
+        #checked before the KDF, so a throttled attempt costs no hashing
+        client = client_key(page.client_ip, page.session.id)
+        wait = login_guard.attempt(email, client)
+        if wait:
+            set_error(signin_password_error, retry_message(wait))
+            page.update(signin_password_error)
+            return
+
+        #await the KDF instead of blocking the session while it runs
+        signin_button.disabled = True
+        page.update(signin_button)
+        try:
+            ok = await asyncio.wrap_future(credentials.authenticate(email, pw))
+        finally:
+            signin_button.disabled = False
+            page.update(signin_button)
+
+        if ok:
+            login_guard.succeeded(email, client)
+            clear_error(signin_password_error)
             current_user["email"] = email
             current_user["logged_in"] = True
             show_welcome_page()
+            await remember_session(email)
         else:
+            backoff = login_guard.failed(email, client)
+            if backoff:
+                set_error(signin_password_error, retry_message(backoff))
             show_error_dialog("Invalid username or password!")
 
 
@@ -254,9 +330,11 @@ def main(page: ft.Page) -> None:
             clear_error(signup_confirm_error)
 
         signup_button.disabled = not (email_valid and pw_ok and passwords_match and signup_checkbox.value and signup_email.value)
-        page.update()
+        page.update(signup_email_error, signup_password_error, signup_confirm_error, signup_button)
 
-    def on_signup(_):
+    @instrument()
+    async def on_signup(_):
+        validate_signup.cancel()
         email = signup_email.value
         pw = signup_password.value
         if not is_valid_email(email):
@@ -272,18 +350,58 @@ def main(page: ft.Page) -> None:
             set_error(signup_confirm_error, "Passwords do not match")
             page.update()
             return
-        if email in users:
+        if await tasks.io(credentials.exists, email):
+            show_error_dialog("User already exists!")
+            return
+        signup_button.disabled = True
+        page.update(signup_button)
+        try:
+            created = await asyncio.wrap_future(credentials.register(email, pw))
+        finally:
+            signup_button.disabled = False
+            page.update(signup_button)
+        if not created:
             show_error_dialog("User already exists!")
             return
-        users[email] = pw
         current_user["email"] = email
         current_user["logged_in"] = True
         show_welcome_page()
+        await remember_session(email)
+
+    #sessions: a remembered token restores current_user without the KDF
+    async def remember_session(email: str):
+        current_user["token"] = await tasks.io(sessions.create, email)
+        await client_storage.set(CLIENT_STORAGE_KEY, current_user["token"])
+
+    async def restore_session():
+        """The remembered (email, token) on this device, or None."""
+        try:
+            token = await asyncio.wait_for(client_storage.get(CLIENT_STORAGE_KEY), SESSION_RESTORE_TIMEOUT)
+        except (asyncio.TimeoutError, RuntimeError):
+            return None
+        email = await tasks.io(sessions.resolve, token) if isinstance(token, str) else None
+        return None if email is None else (email, token)
+
+    async def resume_session():
+        restored = await restore_session()
+        #the user may have signed in or up by hand while the token was on its way
+        if restored is None or current_user["logged_in"]:
+            return
+        current_user["email"], current_user["token"] = restored
+        current_user["logged_in"] = True
+        show_welcome_page()
 
-    def sign_out(_):
+    @instrument()
+    async def sign_out(_):
+        close_alert_banner(seen=False)
+        token = current_user["token"]
         current_user["logged_in"] = False
         current_user["email"] = ""
+        current_user["token"] = ""
         show_signin_screen()
+        if token:
+            await tasks.io(sessions.revoke, token)
+            await client_storage.remove(CLIENT_STORAGE_KEY)
 
     #error dialog
     error_dialog_open = {"open": False}
@@ -302,19 +420,30 @@ def main(page: ft.Page) -> None:
         d.open = True
         page.update()
 
-    #wire events
-    signin_email.on_change = on_validate_signin
-    signin_password.on_change = on_validate_signin
-    signin_button.on_click = on_signin
-
-    signup_email.on_change = on_signup_validate
-    signup_password.on_change = on_signup_validate
-    signup_confirm.on_change = on_signup_validate
-    signup_checkbox.on_change = on_signup_validate
-    signup_button.on_click = on_signup
+    #bursts of keystrokes collapse into one validation pass; the screen builders wire these up
+    validate_signin = Debouncer(on_validate_signin)
+    validate_signup = Debouncer(on_signup_validate)
 
-    #start
+    #start on the sign-in screen without waiting for the client: a remembered
+    #session is looked up in the background (a client storage round trip) and
+    #swaps in the welcome page when it resolves
     show_signin_screen()
+    startup.mark("first frame")
+    page.run_task(resume_session)
+    #the lost items module (and its store) load in the background while the user reads the first screen
+    startup.prewarm("post", prewarm_post_module)
+
+
+def prewarm_post_module():
+    import post
+    from storage import get_store
+    #the change feed, matcher and saved-search alerts run once per process, not per screen
+    post.start_services(get_store())
+
 
-ft.app(target=main)
+if __name__ == "__main__":
+    from images import UPLOAD_DIR
+    #before the first session connects; the sessions' own calls then find it done
+    startup.prewarm("post", prewarm_post_module)
+    ft.app(target=main, upload_dir=UPLOAD_DIR)
 
@@ -0,0 +1,276 @@
+import hashlib
+import logging
+import re
+from functools import lru_cache
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from models import Post
+
+logger = logging.getLogger(__name__)
+
+#MinHash signature length and LSH banding: 16 bands of 4 rows means two posts
+#whose token sets have Jaccard ~0.4 share a bucket with probability ~0.35,
+#~0.6 with probability ~0.9
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+#how a candidate's score is put together, and what counts as a possible match
+WEIGHTS = {"text": 0.45, "category": 0.2, "location": 0.2, "date": 0.15}
+DATE_WINDOW_DAYS = 30
+MATCH_THRESHOLD = 0.45
+MAX_MATCHES = 5
+MAX_CANDIDATES = 200
+
+OPPOSITE = {"Lost": "Found", "Found": "Lost"}
+
+_MERSENNE = (1 << 61) - 1
+_WORD = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset("a an and at by for from in is it my near of on or the to was with".split())
+
+
+def _permutations(n: int):
+    #fixed seeds so signatures are the same in every worker process
+    out = []
+    for i in range(n):
+        h = hashlib.blake2b(f"perm{i}".encode(), digest_size=16).digest()
+        a = int.from_bytes(h[:8], "little") % _MERSENNE or 1
+        b = int.from_bytes(h[8:], "little") % _MERSENNE
+        out.append((a, b))
+    return out
+
+
+_PERMS = _permutations(NUM_PERM)
+
+
+def tokenize(text: str) -> set:
+    return {w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS}
+
+
+@lru_cache(maxsize=65536)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+def minhash(tokens) -> tuple:
+    hashes = [_token_hash(t) for t in tokens] or [0]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS)
+
+
+def band_keys(signature) -> list:
+    return [hash((i, signature[i * ROWS:(i + 1) * ROWS])) for i in range(BANDS)]
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("status", "category", "location", "day", "tokens", "bands")
+
+    def __init__(self, post: Post):
+        self.status = post.status
+        self.category = post.category.strip().lower()
+        self.location = tokenize(post.location)
+        self.day = post.day or None
+        #category and location words go into the signature too, so posts about
+        #the same kind of item in the same place land in the same buckets
+        self.tokens = tokenize(f"{post.title} {post.description} {post.category}")
+        self.bands = band_keys(minhash(self.tokens | self.location))
+
+
+def score(a: _Entry, b: _Entry) -> float:
+    s = WEIGHTS["text"] * jaccard(a.tokens, b.tokens)
+    if a.category and a.category == b.category and a.category != "unspecified":
+        s += WEIGHTS["category"]
+    s += WEIGHTS["location"] * jaccard(a.location, b.location)
+    if a.day is not None and b.day is not None:
+        s += WEIGHTS["date"] * max(0.0, 1 - abs(a.day - b.day) / DATE_WINDOW_DAYS)
+    return s
+
+
+class MatchEngine:
+    """Pairs Lost posts with likely Found posts (and vice versa).
+
+    Posts are kept in a MinHash/LSH index per status, so a new post is only
+    scored against the few posts it shares a bucket with instead of the whole
+    store. All work runs on a single background worker, in submission order;
+    `submit` returns immediately.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._entries = {}
+        self._buckets = {"Lost": {}, "Found": {}}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="matcher")
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Index every stored post in the background (once per process)."""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        self._submit(self._load)
+
+    def _load(self) -> None:
+        after = 0
+        while True:
+            rows = self.store.list_posts(after_seq=after, limit=1000)
+            if not rows:
+                break
+            for p in rows:
+                self._index(p.id, _Entry(p))
+            after = rows[-1].seq
+
+    def _reload(self) -> None:
+        self._entries.clear()
+        for buckets in self._buckets.values():
+            buckets.clear()
+        self._load()
+
+    def _index(self, post_id: str, entry: _Entry) -> None:
+        buckets = self._buckets.get(entry.status)
+        if buckets is None:
+            return
+        self._entries[post_id] = entry
+        for key in entry.bands:
+            buckets.setdefault(key, set()).add(post_id)
+
+    def _unindex(self, post_id: str) -> None:
+        entry = self._entries.pop(post_id, None)
+        if entry is None:
+            return
+        buckets = self._buckets[entry.status]
+        for key in entry.bands:
+            ids = buckets.get(key)
+            if ids is not None:
+                ids.discard(post_id)
+                if not ids:
+                    del buckets[key]
+
+    def find_matches(self, post: Post) -> list:
+        """Return up to MAX_MATCHES (post id, score) pairs, best first."""
+        return self._matches(_Entry(post))
+
+    def _matches(self, entry: _Entry) -> list:
+        opposite = OPPOSITE.get(entry.status)
+        if opposite is None:
+            return []
+        buckets = self._buckets[opposite]
+        candidates = set()
+        for key in entry.bands:
+            candidates.update(buckets.get(key, ()))
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        scored = []
+        for other_id in candidates:
+            s = score(entry, self._entries[other_id])
+            if s >= MATCH_THRESHOLD:
+                scored.append((other_id, round(s, 3)))
+        scored.sort(key=lambda m: m[1], reverse=True)
+        return scored[:MAX_MATCHES]
+
+    def _submit(self, fn, *args) -> None:
+        #the worker's failures would otherwise sit unread in the Future
+        def report(future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.error("matcher task failed", exc_info=future.exception())
+        self._executor.submit(fn, *args).add_done_callback(report)
+
+    def _process(self, post: Post, on_done) -> None:
+        #the entry (its MinHash signature most of all) is built once for scoring and indexing
+        entry = _Entry(post)
+        matches = self._matches(entry)
+        self._index(post.id, entry)
+        if matches:
+            self.store.save_matches(post.id, matches)
+        if on_done is not None:
+            on_done(post.id, [m[0] for m in matches])
+
+    def submit(self, post: Post, on_done=None) -> None:
+        """Match a newly created post; `on_done(post_id, matched_ids)` runs on the worker."""
+        self.start()
+        self._submit(self._process, post, on_done)
+
+    def submit_many(self, posts) -> None:
+        """Match a batch of posts added together (an import); their matches are saved in one transaction."""
+        self.start()
+
+        def run():
+            found = []
+            for post in posts:
+                entry = _Entry(post)
+                matches = self._matches(entry)
+                self._index(post.id, entry)
+                if matches:
+                    found.append((post.id, matches))
+            with self.store.batch():
+                for post_id, matches in found:
+                    self.store.save_matches(post_id, matches)
+        self._submit(run)
+
+    def join(self) -> None:
+        """Wait until the work queued so far is done."""
+        self._executor.submit(lambda: None).result()
+
+    def remove(self, post_id: str) -> None:
+        self._submit(self._unindex, post_id)
+
+    def update_status(self, post: Post) -> None:
+        """Re-file a post whose status changed and score it again; Claimed posts leave the index.
+
+        Its old matches were with posts of the other status, so they are
+        dropped (in both directions) and replaced in one transaction.
+        """
+        def run():
+            self._unindex(post.id)
+            entry = _Entry(post)
+            matches = self._matches(entry)
+            self._index(post.id, entry)
+            with self.store.batch():
+                self.store.clear_matches(post.id)
+                if matches:
+                    self.store.save_matches(post.id, matches)
+        self._submit(run)
+
+    def apply_changes(self, batch) -> None:
+        """ChangeFeed subscriber: follow posts created, re-filed or deleted by other processes.
+
+        Only the index is updated; the process that created a post has already
+        scored it and saved its matches. A reset batch rebuilds the index.
+        """
+        if batch.reset:
+            if self._started:
+                self._submit(self._reload)
+            return
+
+        def run():
+            for post_id in batch.deleted:
+                self._unindex(post_id)
+            for p in batch.created:
+                if p.id not in self._entries:
+                    self._index(p.id, _Entry(p))
+            for p in batch.updated:
+                entry = self._entries.get(p.id)
+                if entry is None or entry.status != p.status:
+                    self._unindex(p.id)
+                    self._index(p.id, _Entry(p))
+        self._submit(run)
+
+
+_default_engine = None
+_default_lock = threading.Lock()
+
+
+def get_matcher(store) -> MatchEngine:
+    global _default_engine
+    if _default_engine is None:
+        with _default_lock:
+            if _default_engine is None:
+                _default_engine = MatchEngine(store)
+    return _default_engine
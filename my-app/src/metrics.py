@@ -0,0 +1,456 @@
+"""Latency, render and payload metrics for the app's hot paths.
+
+`instrument()` (a decorator) and `measure()` (a context manager) record how
+long a handler or render took and how many controls it built, into
+fixed-bucket histograms that cost a bisect and a few additions per call.
+`watch_page()` times every `page.update()` diff and counts the messages it
+sends, sizing one in MSF_METRICS_PAYLOAD_SAMPLE of them (sizing means
+encoding the message a second time).
+
+Everything is kept in memory per process. MSF_METRICS_PORT serves it as
+Prometheus text on localhost, and MSF_METRICS_DUMP appends a JSON Lines
+snapshot every MSF_METRICS_DUMP_SECONDS. The same local endpoint switches
+cProfile on for one session at a time, for a set number of seconds, so a
+slow session can be profiled in production without a restart:
+
+    curl localhost:9464/sessions
+    curl -X POST 'localhost:9464/profile?session=<id>&seconds=60'
+    curl 'localhost:9464/profile?session=<id>'
+"""
+import bisect
+import cProfile
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from contextvars import ContextVar
+
+import flet as ft
+import msgpack
+from flet.controls.base_control import BaseControl
+from flet.controls.id_counter import ControlId
+from flet.messaging.protocol import configure_encode_object_for_msgpack
+
+logger = logging.getLogger(__name__)
+
+#local endpoint (0 = off), JSON Lines dump file ('' = off) and how often it is written
+METRICS_PORT = int(os.getenv("MSF_METRICS_PORT", "0"))
+METRICS_DUMP = os.getenv("MSF_METRICS_DUMP", "")
+METRICS_DUMP_SECONDS = float(os.getenv("MSF_METRICS_DUMP_SECONDS", "60"))
+#encode one outgoing message in this many to record its size
+PAYLOAD_SAMPLE = max(1, int(os.getenv("MSF_METRICS_PAYLOAD_SAMPLE", "10")))
+#longest profile capture the endpoint accepts, and the rows a report shows
+MAX_PROFILE_SECONDS = 600
+PROFILE_ROWS = 40
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+#metric families: name -> (label, buckets, help)
+FAMILIES = {
+    "msf_handler_seconds": ("handler", LATENCY_BUCKETS, "Time spent in instrumented handlers and renders"),
+    "msf_handler_controls_built": ("handler", COUNT_BUCKETS, "Controls constructed per instrumented call (process-wide counter)"),
+    "msf_update_seconds": ("control", LATENCY_BUCKETS, "Time page.update() spends diffing and sending one control"),
+    "msf_update_payload_bytes": ("action", BYTES_BUCKETS, "Encoded size of sampled outgoing messages"),
+}
+
+_encode = configure_encode_object_for_msgpack(BaseControl)
+
+
+class Histogram:
+    """Counts per bucket upper bound, plus a sum and a total, like a Prometheus histogram."""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        #the last slot is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (the last bound for +Inf)."""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+
+class Metrics:
+    """Every histogram in the process, keyed by family and label value."""
+
+    def __init__(self):
+        self._histograms = {}
+        #handler name -> (latency, controls built) histograms, so a call costs one lookup
+        self._calls = {}
+        self._messages = 0
+        self._lock = threading.Lock()
+
+    def observe(self, family: str, label: str, value: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get((family, label))
+            if histogram is None:
+                histogram = self._histograms[(family, label)] = Histogram(FAMILIES[family][1])
+            histogram.observe(value)
+
+    def observe_call(self, name: str, seconds: float, built: int) -> None:
+        """Both handler histograms for one call of `name`, under one lock."""
+        with self._lock:
+            pair = self._calls.get(name)
+            if pair is None:
+                pair = self._calls[name] = (
+                    self._histograms.setdefault(("msf_handler_seconds", name), Histogram(LATENCY_BUCKETS)),
+                    self._histograms.setdefault(("msf_handler_controls_built", name), Histogram(COUNT_BUCKETS)),
+                )
+            pair[0].observe(seconds)
+            pair[1].observe(built)
+
+    def count_message(self) -> int:
+        with self._lock:
+            self._messages += 1
+            return self._messages
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            items = sorted(self._histograms.items())
+            messages = self._messages
+        lines = [
+            "# HELP msf_messages_sent_total Messages sent to clients",
+            "# TYPE msf_messages_sent_total counter",
+            f"msf_messages_sent_total {messages}",
+        ]
+        family = None
+        for (name, value), h in items:
+            label = FAMILIES[name][0]
+            if name != family:
+                family = name
+                lines.append(f"# HELP {name} {FAMILIES[name][2]}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip(h.bounds + ("+Inf",), h.counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{label}="{value}"}} {h.sum}')
+            lines.append(f'{name}_count{{{label}="{value}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Counts, sums and bucket-resolution p50/p90/p99 per histogram, for the JSON Lines dump."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            messages = self._messages
+        families = {}
+        for (name, value), h in items:
+            families.setdefault(name, {})[value] = {
+                "count": h.count, "sum": round(h.sum, 6),
+                "p50": h.quantile(0.5), "p90": h.quantile(0.9), "p99": h.quantile(0.99),
+            }
+        return {"ts": round(time.time(), 3), "messages_sent": messages, "metrics": families}
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+#per-session profiling
+class _Capture:
+    __slots__ = ("profiler", "until", "started")
+
+    def __init__(self, seconds: float):
+        self.profiler = cProfile.Profile()
+        self.started = time.time()
+        self.until = self.started + seconds
+
+
+#sessions seen by watch_page, and the captures started for them, by session id
+_sessions = weakref.WeakValueDictionary()
+_captures = {}
+#set while an instrumented call is already profiling, so nested ones leave the profiler alone
+_profiling = ContextVar("msf_profiling", default=False)
+
+
+def _current_capture():
+    if not _captures:
+        return None
+    try:
+        session_id = ft.context.page.session.id
+    except (RuntimeError, AttributeError):
+        return None
+    capture = _captures.get(session_id)
+    if capture is None or time.time() > capture.until:
+        return None
+    return capture
+
+
+class _Profiled:
+    """Await a coroutine with the profiler on only while that coroutine runs.
+
+    The event loop interleaves every session's handlers, so switching the
+    profiler on for the whole await would also record the other sessions.
+    """
+
+    def __init__(self, coro, profiler: cProfile.Profile):
+        self._coro = coro
+        self._profiler = profiler
+
+    def __await__(self):
+        coro = self._coro
+        value, error = None, None
+        while True:
+            self._profiler.enable()
+            try:
+                step = coro.throw(error) if error is not None else coro.send(value)
+            except StopIteration as done:
+                return done.value
+            finally:
+                self._profiler.disable()
+            try:
+                value, error = (yield step), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class measure:
+    """Context manager: record the block's latency and the controls built in it under `name`.
+
+    A class rather than a @contextmanager generator; this runs on every
+    instrumented call and the generator machinery costs several times more.
+    """
+    __slots__ = ("name", "first_id", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.first_id = ControlId.next()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        #our own probe took one id
+        _metrics.observe_call(self.name, elapsed, ControlId.next() - self.first_id - 1)
+        return False
+
+
+def _capture_for_call():
+    #an outer instrumented call already has the profiler on (and will switch it off)
+    return None if _profiling.get() else _current_capture()
+
+
+async def track(name: str, fn, *args, **kwargs):
+    """Call `fn`, awaiting what it returns if that is awaitable, as one measured call.
+
+    For event handlers that may be plain functions, coroutine functions or
+    lambdas returning a coroutine. Profiled while the session has a capture.
+    """
+    with measure(name):
+        capture = _capture_for_call()
+        if capture is None:
+            result = fn(*args, **kwargs)
+            return await result if inspect.isawaitable(result) else result
+        token = _profiling.set(True)
+        try:
+            result = capture.profiler.runcall(fn, *args, **kwargs)
+            if inspect.iscoroutine(result):
+                return await _Profiled(result, capture.profiler)
+            return await result if inspect.isawaitable(result) else result
+        finally:
+            _profiling.reset(token)
+
+
+def instrument(name: str = None):
+    """Decorator: `measure()` every call, and profile it while its session has a capture running.
+
+    Works on plain and async functions; `name` defaults to the function's.
+    """
+    def wrap(fn):
+        label = name or fn.__name__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                return await track(label, fn, *args, **kwargs)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with measure(label):
+                capture = _capture_for_call()
+                if capture is None:
+                    return fn(*args, **kwargs)
+                token = _profiling.set(True)
+                try:
+                    return capture.profiler.runcall(fn, *args, **kwargs)
+                finally:
+                    _profiling.reset(token)
+        return run
+    return wrap
+
+
+def watch_page(page) -> None:
+    """Time this session's page.update() diffs and count (and sample the size of) what it sends."""
+    session = page.session
+    if getattr(session, "_msf_watched", False):
+        return
+    session._msf_watched = True
+    _sessions[session.id] = session
+
+    patch_control = session.patch_control
+
+    def timed_patch(control, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return patch_control(control, *args, **kwargs)
+        finally:
+            _metrics.observe("msf_update_seconds", type(control).__name__, time.perf_counter() - started)
+    session.patch_control = timed_patch
+
+    conn = session.connection
+    if conn is None or getattr(conn, "_msf_watched", False):
+        return
+    conn._msf_watched = True
+    send_message = conn.send_message
+
+    def counted_send(message):
+        if _metrics.count_message() % PAYLOAD_SAMPLE == 0:
+            size = len(msgpack.packb([message.action, message.body], default=_encode))
+            _metrics.observe("msf_update_payload_bytes", getattr(message.action, "name", str(message.action)), size)
+        return send_message(message)
+    conn.send_message = counted_send
+
+
+def start_profile(session_id: str, seconds: float) -> bool:
+    """Profile `session_id`'s instrumented calls for the next `seconds`; False if no such session is open."""
+    if session_id not in _sessions:
+        return False
+    #drop captures of sessions that have closed since
+    for stale in [sid for sid in _captures if sid not in _sessions]:
+        del _captures[stale]
+    _captures[session_id] = _Capture(min(seconds, MAX_PROFILE_SECONDS))
+    return True
+
+
+def profile_report(session_id: str) -> str:
+    """pstats text for the session's capture, heaviest cumulative time first; '' when there is none."""
+    import pstats
+
+    capture = _captures.get(session_id)
+    if capture is None:
+        return ""
+    out = io.StringIO()
+    state = "running" if time.time() <= capture.until else "finished"
+    out.write(f"session {session_id}: capture {state}, started {time.ctime(capture.started)}\n")
+    try:
+        pstats.Stats(capture.profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_ROWS)
+    except TypeError:
+        #nothing has been recorded yet
+        out.write("no instrumented calls yet\n")
+    return out.getvalue()
+
+
+#exposition
+def _metrics_server(port: int):
+    """The localhost endpoint; http.server is only imported when one is configured."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    class _Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: str, content_type: str = "text/plain; version=0.0.4") -> None:
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/metrics":
+                self._send(200, _metrics.prometheus_text())
+            elif url.path == "/sessions":
+                now = time.time()
+                sessions = [
+                    {"id": sid, "profiling": sid in _captures and now <= _captures[sid].until}
+                    for sid in list(_sessions.keys())
+                ]
+                self._send(200, json.dumps(sessions), "application/json")
+            elif url.path == "/profile":
+                report = profile_report(query.get("session", [""])[0])
+                self._send(200 if report else 404, report or "no capture for that session\n")
+            else:
+                self._send(404, "not found\n")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path != "/profile":
+                self._send(404, "not found\n")
+                return
+            session_id = query.get("session", [""])[0]
+            try:
+                seconds = float(query.get("seconds", ["60"])[0])
+            except ValueError:
+                self._send(400, "seconds must be a number\n")
+                return
+            if start_profile(session_id, seconds):
+                self._send(200, f"profiling {session_id} for {min(seconds, MAX_PROFILE_SECONDS):g}s\n")
+            else:
+                self._send(404, "no such session\n")
+
+        def log_message(self, format, *args):
+            logger.debug("metrics endpoint: " + format, *args)
+
+    return ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+
+
+def _dump_loop(path: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(_metrics.snapshot()) + "\n")
+        except OSError:
+            logger.exception("could not write metrics to %s", path)
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_exporters(port: int = METRICS_PORT, dump: str = METRICS_DUMP, interval: float = METRICS_DUMP_SECONDS) -> None:
+    """Start the local endpoint and the JSON Lines dump, whichever is configured; once per process."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    if port:
+        try:
+            server = _metrics_server(port)
+        except OSError as e:
+            #another worker process on this host has the port; its numbers are per process too
+            logger.warning("metrics endpoint not started on port %d: %s", port, e)
+        else:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info("metrics on http://127.0.0.1:%d/metrics", port)
+    if dump:
+        threading.Thread(target=_dump_loop, args=(dump, interval), name="metrics-dump", daemon=True).start()
@@ -0,0 +1,110 @@
+import sys
+import uuid
+from dataclasses import dataclass
+from datetime import date
+from enum import Enum
+from functools import lru_cache
+
+
+class Status(str, Enum):
+    """A post's status. Members are str, so they compare and hash like "Lost" etc."""
+    LOST = "Lost"
+    FOUND = "Found"
+    CLAIMED = "Claimed"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+_STATUSES = {s.value: s for s in Status}
+
+
+def to_status(value) -> Status:
+    return _STATUSES.get(value, Status.LOST)
+
+
+def intern_text(value) -> str:
+    """One shared str object per distinct category/location/author across all posts."""
+    return sys.intern(value) if value else ""
+
+
+@lru_cache(maxsize=4096)
+def parse_day(value) -> int:
+    """Ordinal day for a YYYY-MM-DD string; 0 when it is missing or not a date."""
+    try:
+        return date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+
+@lru_cache(maxsize=4096)
+def format_day(day: int) -> str:
+    return date.fromordinal(day).isoformat() if day > 0 else ""
+
+
+@dataclass(slots=True)
+class Post:
+    """One lost-and-found post.
+
+    Slotted, with interned strings and the date held as an ordinal day, so a
+    few hundred thousand of them cost a fraction of the equivalent dicts.
+    `seq` is the store's posting order and `match_count` comes from the
+    store's matches table; both are 0 until the post has been stored.
+    `archived` marks a post read back from the archive, which is read-only.
+    """
+    id: str
+    title: str
+    description: str
+    category: str
+    location: str
+    day: int
+    contact: str = ""
+    image: str = ""
+    status: Status = Status.LOST
+    author: str = ""
+    seq: int = 0
+    match_count: int = 0
+    archived: bool = False
+
+    @classmethod
+    def new(cls, title: str, description: str, category: str, location: str, date_text: str,
+            contact: str = "", image: str = "", status: str = "Lost", author: str = "") -> "Post":
+        return cls(
+            uuid.uuid4().hex, title, description, intern_text(category or "Unspecified"),
+            intern_text(location), parse_day(date_text), contact, image, to_status(status), intern_text(author)
+        )
+
+    @property
+    def date(self) -> str:
+        return format_day(self.day)
+
+    #storage: the column order of POST_FIELDS / POST_COLUMNS in storage.py
+    def to_row(self) -> tuple:
+        return (self.id, self.title, self.description, self.category, self.location,
+                self.date, self.contact, self.image, self.status.value, self.author)
+
+    @classmethod
+    def from_row(cls, row) -> "Post":
+        seq, post_id, title, description, category, location, day, contact, image, status, author, match_count = row
+        return cls(
+            post_id, title, description, intern_text(category), intern_text(location), parse_day(day),
+            contact, image, _STATUSES.get(status, Status.LOST), intern_text(author), seq, match_count
+        )
+
+    #plain dicts for files and the wire (date as YYYY-MM-DD, status as its name)
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id, "title": self.title, "description": self.description,
+            "category": self.category, "location": self.location, "date": self.date,
+            "contact": self.contact, "image": self.image, "status": self.status.value,
+            "author": self.author,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Post":
+        return cls(
+            d.get("id") or uuid.uuid4().hex, d.get("title", ""), d.get("description", ""),
+            intern_text(d.get("category") or "Unspecified"), intern_text(d.get("location", "")),
+            parse_day(d.get("date")), d.get("contact", ""), d.get("image", ""),
+            to_status(d.get("status")), intern_text(d.get("author", "")),
+        )
@@ -0,0 +1,570 @@
+"""Saved searches ("notify me") and the alerts they send.
+
+A subscription is a signed-in user's saved search: posts with a status (Found
+unless they say otherwise) and any of a category, a place and keywords. When
+a post is created the Notifier looks up the subscriptions it could satisfy in
+an index keyed on everything each one asks for (status, category, place and
+its two longest keywords), so a post is only checked against subscriptions
+that already agree with it on those, not against all of them. New posts come
+from the change feed, so posts from the form, `cli.py import` and sync all
+count. Every match becomes a row in the alerts table, one transaction per
+feed batch. Every process tails the same log, but the table keeps one alert
+per user and post.
+
+The alerts table is the outbox for two channels:
+
+  banner  the welcome page shows a user's unseen alerts until they open the
+          list or dismiss them
+  email   a background thread mails each user one digest of everything
+          matched for them, DIGEST_DELAY after the first alert in it, so a
+          burst of matching posts is one email. Rows are leased while they
+          are being sent, so processes sharing the database never mail the
+          same alert twice, and failed sends are retried with backoff up to
+          MAX_ATTEMPTS times. Anything with a `send_batch(messages)` method
+          can be the sender (see SMTPSender); with MSF_SMTP_HOST set it is
+          SMTPSender, otherwise alerts are banner-only.
+
+`python cli.py smtp-sink` is a local SMTP stand-in that appends what it
+receives to an mbox file.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from geo import get_gazetteer, words
+from matching import tokenize
+from storage import DEFAULT_DB_PATH, SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+#how long the first alert of a digest waits for others to join it
+DIGEST_DELAY = float(os.getenv("MSF_NOTIFY_DIGEST_MINUTES", "15")) * 60
+#how often the mail thread looks for digests that are due
+NOTIFY_INTERVAL = float(os.getenv("MSF_NOTIFY_INTERVAL_SECONDS", "60"))
+#outgoing mail; no host means alerts are shown in the app only
+SMTP_HOST = os.getenv("MSF_SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("MSF_SMTP_PORT", "25"))
+SMTP_USER = os.getenv("MSF_SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("MSF_SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("MSF_SMTP_STARTTLS", "0") == "1"
+MAIL_FROM = os.getenv("MSF_MAIL_FROM", "Montclair State Find <noreply@montclair.edu>")
+
+#a failed digest is retried after RETRY_BASE, doubling up to MAX_RETRY, MAX_ATTEMPTS times in all
+RETRY_BASE = 60
+MAX_RETRY = 3600
+MAX_ATTEMPTS = 6
+#how long a process may hold alerts it is mailing before another one takes them over
+LEASE = 300
+#users mailed per pass; alerts listed per digest
+MAIL_USERS = 200
+DIGEST_ITEMS = 50
+#mailed or failed alerts are kept this long for the banner, then deleted
+ALERT_RETENTION = 30 * 86400
+MAX_SUBSCRIPTIONS = 20
+
+NOTIFY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    email      TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    category   TEXT NOT NULL,
+    place      TEXT NOT NULL,
+    keywords   TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subscriptions_email ON subscriptions(email);
+
+--bumped by every subscribe/unsubscribe, so each process knows when to reload its index
+CREATE TABLE IF NOT EXISTS subscriptions_version (
+    id      INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO subscriptions_version (id, version) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS subscriptions_ai AFTER INSERT ON subscriptions
+BEGIN UPDATE subscriptions_version SET version = version + 1; END;
+CREATE TRIGGER IF NOT EXISTS subscriptions_ad AFTER DELETE ON subscriptions
+BEGIN UPDATE subscriptions_version SET version = version + 1; END;
+
+--mail: 'pending' (due at next_try), 'sending' (leased until next_try), 'sent', 'failed' or 'off'
+CREATE TABLE IF NOT EXISTS alerts (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    email      TEXT NOT NULL,
+    post_id    TEXT NOT NULL,
+    title      TEXT NOT NULL,
+    location   TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    seen_at    REAL,
+    mail       TEXT NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    next_try   REAL NOT NULL DEFAULT 0,
+    UNIQUE (email, post_id)
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_mail ON alerts(mail, next_try);
+CREATE INDEX IF NOT EXISTS idx_alerts_unseen ON alerts(email, seen_at);
+"""
+
+
+def _stem(word: str) -> str:
+    #"keys" finds "key"; enough for item names without a stemmer
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def keyword_terms(text: str) -> frozenset:
+    return frozenset(_stem(w) for w in tokenize(text))
+
+
+def category_key(category: str) -> str:
+    category = (category or "").strip().lower()
+    return "" if category == "unspecified" else category
+
+
+class Subscription:
+    """One saved search, as the index holds it."""
+    __slots__ = ("id", "email", "status", "category", "place", "keywords", "terms")
+
+    def __init__(self, id: int, email: str, status: str, category: str, place: str, keywords: str):
+        self.id = id
+        self.email = email
+        self.status = status
+        self.category = category
+        self.place = place
+        self.keywords = keywords
+        self.terms = keyword_terms(keywords)
+
+    def key(self) -> tuple:
+        """(status, category, place, word) and a second word, "" for whatever is left open."""
+        #longer words are rarer in posts, so they narrow the buckets most
+        ordered = sorted(self.terms, key=lambda w: (-len(w), w)) + ["", ""]
+        return (self.status, self.category, self.place, ordered[0]), ordered[1]
+
+    def matches(self, status: str, category: str, place: str, terms) -> bool:
+        return (status == self.status and (not self.category or category == self.category)
+                and (not self.place or place == self.place) and self.terms <= terms)
+
+    def describe(self) -> str:
+        parts = [self.status]
+        if self.category:
+            parts.append(self.category.title())
+        if self.place:
+            parts.append(f"at {self.place}")
+        if self.keywords:
+            parts.append(f'"{self.keywords}"')
+        return " · ".join(parts)
+
+
+class SubscriptionIndex:
+    """Subscriptions filed under Subscription.key(). Not locked.
+
+    A post looks up every combination of its status, its category or "",
+    its place or "", and one of its words or "" (4 x (words + 1) lookups),
+    and of each bucket found takes the groups whose second word it also has.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+
+    def add(self, sub: Subscription) -> None:
+        key, word = sub.key()
+        self._buckets.setdefault(key, {}).setdefault(word, {})[sub.id] = sub
+
+    def remove(self, sub: Subscription) -> None:
+        key, word = sub.key()
+        groups = self._buckets.get(key, {})
+        group = groups.get(word)
+        if group is not None:
+            group.pop(sub.id, None)
+            if not group:
+                del groups[word]
+            if not groups:
+                del self._buckets[key]
+
+    def candidates(self, status: str, category: str, place: str, terms) -> list:
+        found = []
+        for c in {category, ""}:
+            for p in {place, ""}:
+                for w in ("", *terms):
+                    groups = self._buckets.get((status, c, p, w))
+                    if groups is not None:
+                        for word, group in groups.items():
+                            if not word or word in terms:
+                                found.extend(group.values())
+        return found
+
+    def match(self, status: str, category: str, place: str, terms) -> list:
+        return [s for s in self.candidates(status, category, place, terms) if s.matches(status, category, place, terms)]
+
+
+class AlertStore(SQLiteStore):
+    """Subscriptions and the alerts outbox, next to the posts."""
+
+    def init_schema(self, conn) -> None:
+        conn.executescript(NOTIFY_SCHEMA)
+
+    #subscriptions
+    def add_subscription(self, email: str, status: str, category: str, place: str, keywords: str) -> int:
+        with self.batch() as conn:
+            cursor = conn.execute(
+                "INSERT INTO subscriptions (email, status, category, place, keywords, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (email, status, category, place, keywords, time.time())
+            )
+            return cursor.lastrowid
+
+    def delete_subscription(self, email: str, sub_id: int) -> bool:
+        with self.batch() as conn:
+            return conn.execute("DELETE FROM subscriptions WHERE id = ? AND email = ?", (sub_id, email)).rowcount > 0
+
+    def subscriptions(self, email: str = None) -> list:
+        sql = "SELECT id, email, status, category, place, keywords FROM subscriptions"
+        rows = self._conn().execute(sql + (" WHERE email = ? ORDER BY id" if email else ""), (email,) if email else ())
+        return [Subscription(*r) for r in rows]
+
+    def version(self) -> int:
+        return self._conn().execute("SELECT version FROM subscriptions_version").fetchone()[0]
+
+    #alerts
+    def add_alerts(self, rows) -> int:
+        """Insert (email, post_id, title, location, created_at, mail, next_try) rows; a repeat is ignored."""
+        with self.batch() as conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO alerts (email, post_id, title, location, created_at, mail, next_try) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return cursor.rowcount
+
+    def unseen(self, email: str, limit: int = 3) -> tuple:
+        """(how many alerts the user has not seen, the newest `limit` of them)."""
+        conn = self._conn()
+        count = conn.execute("SELECT COUNT(*) FROM alerts WHERE email = ? AND seen_at IS NULL", (email,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT post_id, title, location FROM alerts WHERE email = ? AND seen_at IS NULL ORDER BY id DESC LIMIT ?",
+            (email, limit)
+        ).fetchall() if count else []
+        return count, rows
+
+    def mark_seen(self, email: str) -> None:
+        with self.batch() as conn:
+            conn.execute("UPDATE alerts SET seen_at = ? WHERE email = ? AND seen_at IS NULL", (time.time(), email))
+
+    def claim(self, now: float, users: int = MAIL_USERS) -> dict:
+        """Lease every waiting alert of up to `users` users whose digest is due; {email: [rows]}."""
+        with self.batch() as conn:
+            #leases of a process that died mid-send run out and the alerts go back in line
+            conn.execute("UPDATE alerts SET mail = 'pending' WHERE mail = 'sending' AND next_try <= ?", (now,))
+            emails = [r[0] for r in conn.execute(
+                "SELECT DISTINCT email FROM alerts WHERE mail = 'pending' AND next_try <= ? LIMIT ?", (now, users)
+            )]
+            claimed = {}
+            for email in emails:
+                rows = conn.execute(
+                    "SELECT id, post_id, title, location, attempts FROM alerts WHERE email = ? AND mail = 'pending' ORDER BY id",
+                    (email,)
+                ).fetchall()
+                conn.executemany("UPDATE alerts SET mail = 'sending', next_try = ? WHERE id = ?",
+                                 ((now + LEASE, r["id"]) for r in rows))
+                claimed[email] = rows
+        return claimed
+
+    def sent(self, ids) -> None:
+        with self.batch() as conn:
+            conn.executemany("UPDATE alerts SET mail = 'sent' WHERE id = ?", ((i,) for i in ids))
+
+    def retry(self, ids, attempts: int, now: float) -> None:
+        """Put alerts back for another try, or give up on them after MAX_ATTEMPTS."""
+        if attempts >= MAX_ATTEMPTS:
+            update, params = "mail = 'failed'", ()
+        else:
+            update, params = "mail = 'pending', next_try = ?", (now + min(MAX_RETRY, RETRY_BASE * 2 ** (attempts - 1)),)
+        with self.batch() as conn:
+            conn.executemany(f"UPDATE alerts SET {update}, attempts = ? WHERE id = ?",
+                             ((*params, attempts, i) for i in ids))
+
+    def prune(self, before: float) -> int:
+        with self.batch() as conn:
+            return conn.execute(
+                "DELETE FROM alerts WHERE created_at < ? AND mail NOT IN ('pending', 'sending')", (before,)
+            ).rowcount
+
+
+class SMTPSender:
+    """Sends digests over one SMTP connection per batch."""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, user: str = SMTP_USER,
+                 password: str = SMTP_PASSWORD, starttls: bool = SMTP_STARTTLS, timeout: float = 30):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send_batch(self, messages) -> list:
+        """Send EmailMessages; returns, per message, None or the exception it failed with."""
+        import smtplib
+
+        try:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        except (OSError, smtplib.SMTPException) as e:
+            return [e] * len(messages)
+        results = []
+        with smtp:
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                if self.user:
+                    smtp.login(self.user, self.password)
+            except (OSError, smtplib.SMTPException) as e:
+                return [e] * len(messages)
+            for message in messages:
+                try:
+                    smtp.send_message(message)
+                    results.append(None)
+                except (OSError, smtplib.SMTPException) as e:
+                    results.append(e)
+        return results
+
+
+def digest_message(email: str, rows: list):
+    from email.message import EmailMessage
+
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = email
+    count = len(rows)
+    message["Subject"] = f"{count} new post{'s' if count != 1 else ''} match{'es' if count == 1 else ''} your saved searches"
+    lines = [f"- {r['title']} (last seen: {r['location']})" for r in rows[:DIGEST_ITEMS]]
+    if count > DIGEST_ITEMS:
+        lines.append(f"...and {count - DIGEST_ITEMS} more.")
+    message.set_content(
+        "New posts on Montclair State Find match what you asked to hear about:\n\n"
+        + "\n".join(lines)
+        + "\n\nOpen Lost Items in the app to see them, or remove the saved search there to stop these emails.\n"
+    )
+    return message
+
+
+class Notifier:
+    """Matches new posts to subscriptions and delivers the alerts, once per process.
+
+    Matching runs on one worker thread in feed order (`apply_changes`
+    returns at once); mailing runs on another, every NOTIFY_INTERVAL.
+    """
+
+    def __init__(self, store, sender=None, alerts: AlertStore = None, gazetteer=None):
+        self.store = store
+        self.alerts = alerts or AlertStore(store.path if store is not None else DEFAULT_DB_PATH)
+        self.sender = sender
+        self.gazetteer = gazetteer or get_gazetteer()
+        self._index = SubscriptionIndex()
+        self._subs = {}
+        self._version = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notify")
+        self._lock = threading.Lock()
+        self._started = False
+        self._next_prune = 0.0
+
+    def start(self) -> None:
+        """Start the mail thread (once per process; not needed without a sender)."""
+        with self._lock:
+            if self._started or self.sender is None:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="notify-mail", daemon=True).start()
+
+    #subscriptions
+    def place_key(self, location: str) -> str:
+        """A building name when the gazetteer knows the location, its plain words otherwise."""
+        place = self.gazetteer.resolve(location or "")
+        return place.name if place is not None else " ".join(words(location or ""))
+
+    def subscribe(self, email: str, status: str = "Found", category: str = "", location: str = "", keywords: str = "") -> Subscription:
+        category, place, keywords = category_key(category), self.place_key(location), " ".join((keywords or "").split())
+        if not (category or place or keyword_terms(keywords)):
+            raise ValueError("Give a category, a place or some keywords to watch for")
+        with self._lock:
+            if len(self.alerts.subscriptions(email)) >= MAX_SUBSCRIPTIONS:
+                raise ValueError(f"You can keep up to {MAX_SUBSCRIPTIONS} saved searches")
+            sub_id = self.alerts.add_subscription(email, status, category, place, keywords)
+        return Subscription(sub_id, email, status, category, place, keywords)
+
+    def unsubscribe(self, email: str, sub_id: int) -> bool:
+        return self.alerts.delete_subscription(email, sub_id)
+
+    def subscriptions(self, email: str) -> list:
+        return self.alerts.subscriptions(email)
+
+    def _refresh(self) -> None:
+        #subscriptions change rarely and maybe in another process; reload them all when they do
+        version = self.alerts.version()
+        if version == self._version:
+            return
+        index, subs = SubscriptionIndex(), {}
+        for sub in self.alerts.subscriptions():
+            index.add(sub)
+            subs[sub.id] = sub
+        self._index, self._subs, self._version = index, subs, version
+
+    #matching
+    def match(self, post) -> list:
+        """The subscriptions post `post` satisfies, its author's own left out."""
+        with self._lock:
+            self._refresh()
+            index = self._index
+        terms = keyword_terms(f"{post.title} {post.description} {post.category}")
+        found = index.match(str(post.status), category_key(post.category), self.place_key(post.location), terms)
+        return [s for s in found if s.email != post.author]
+
+    def _process(self, posts) -> int:
+        now = time.time()
+        mail, next_try = ("pending", now + DIGEST_DELAY) if self.sender is not None else ("off", 0)
+        rows = []
+        for post in posts:
+            #one alert per user, however many of their searches matched
+            emails = dict.fromkeys(s.email for s in self.match(post))
+            rows.extend((e, post.id, post.title, post.location, now, mail, next_try) for e in emails)
+        return self.alerts.add_alerts(rows) if rows else 0
+
+    def _submit(self, fn, *args) -> None:
+        #the worker's failures would otherwise sit unread in the Future
+        def report(future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.error("notifier task failed", exc_info=future.exception())
+        self._executor.submit(fn, *args).add_done_callback(report)
+
+    def posts_created(self, posts) -> None:
+        """Queue alerts for new posts, in the background; a post already alerted on adds nothing."""
+        if posts:
+            self._submit(self._process, list(posts))
+
+    def apply_changes(self, batch) -> None:
+        """ChangeFeed subscriber: queue alerts for the posts created (a reset batch carries none)."""
+        self.posts_created(batch.created)
+
+    def join(self) -> None:
+        """Wait until the alerts queued so far are written."""
+        self._executor.submit(lambda: None).result()
+
+    #banner
+    def unseen(self, email: str, limit: int = 3) -> tuple:
+        return self.alerts.unseen(email, limit)
+
+    def mark_seen(self, email: str) -> None:
+        self.alerts.mark_seen(email)
+
+    #mail
+    def _run(self) -> None:
+        while True:
+            try:
+                self.deliver()
+            except Exception:
+                logger.exception("mailing alerts failed")
+            time.sleep(NOTIFY_INTERVAL)
+
+    def deliver(self, now: float = None) -> dict:
+        """Mail every digest that is due; returns how many went out and how many failed."""
+        stats = {"sent": 0, "failed": 0}
+        if self.sender is None:
+            return stats
+        now = time.time() if now is None else now
+        if now >= self._next_prune:
+            self._next_prune = now + 3600
+            self.alerts.prune(now - ALERT_RETENTION)
+        while True:
+            claimed = self.alerts.claim(now)
+            if not claimed:
+                return stats
+            emails = list(claimed)
+            results = self.sender.send_batch([digest_message(e, claimed[e]) for e in emails])
+            sent = []
+            for email, error in zip(emails, results):
+                rows = claimed[email]
+                if error is None:
+                    sent.extend(r["id"] for r in rows)
+                    stats["sent"] += 1
+                else:
+                    logger.warning("could not mail alerts to %s: %s", email, error)
+                    self.alerts.retry([r["id"] for r in rows], max(r["attempts"] for r in rows) + 1, now)
+                    stats["failed"] += 1
+            self.alerts.sent(sent)
+
+
+def serve_smtp(host: str, port: int, mbox_path: str):
+    """A minimal SMTP server appending every message to an mbox; call serve_forever() on it.
+
+    For trying the email channel locally (`python cli.py smtp-sink`); no
+    authentication, TLS or extensions.
+    """
+    import mailbox
+    import socketserver
+
+    lock = threading.Lock()
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def _reply(self, line: str) -> None:
+            self.wfile.write(line.encode("ascii") + b"\r\n")
+
+        def _read_data(self) -> bytes:
+            lines = []
+            while True:
+                line = self.rfile.readline()
+                if not line or line in (b".\r\n", b".\n"):
+                    return b"".join(lines)
+                #transparency: a leading dot was doubled by the client
+                lines.append(line[1:] if line.startswith(b"..") else line)
+
+        def handle(self):
+            self._reply("220 msf smtp sink")
+            recipients = []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode("latin-1").strip()
+                verb = command[:4].upper()
+                if verb in ("HELO", "EHLO"):
+                    self._reply("250 msf smtp sink")
+                elif verb == "MAIL":
+                    recipients = []
+                    self._reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.partition(":")[2].strip())
+                    self._reply("250 OK")
+                elif verb == "DATA":
+                    if not recipients:
+                        self._reply("503 RCPT first")
+                        continue
+                    self._reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = self._read_data()
+                    with lock:
+                        box = mailbox.mbox(mbox_path)
+                        box.add(data)
+                        box.close()
+                    logger.info("smtp sink: message for %s", ", ".join(recipients))
+                    recipients = []
+                    self._reply("250 OK")
+                elif verb in ("RSET", "NOOP"):
+                    if verb == "RSET":
+                        recipients = []
+                    self._reply("250 OK")
+                elif verb == "QUIT":
+                    self._reply("221 Bye")
+                    return
+                else:
+                    self._reply("502 Command not implemented")
+
+    class _Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    return _Server((host, port), _Handler)
+
+
+_default_notifier = None
+_default_lock = threading.Lock()
+
+
+def get_notifier(store) -> Notifier:
+    global _default_notifier
+    if _default_notifier is None:
+        with _default_lock:
+            if _default_notifier is None:
+                _default_notifier = Notifier(store, sender=SMTPSender() if SMTP_HOST else None)
+    return _default_notifier
@@ -1,14 +1,72 @@
+import os
+import uuid
 import flet as ft
-from datetime import datetime
+from dataclasses import replace
+from datetime import date, datetime
+from debounce import Debouncer
+from storage import get_store
+from matching import get_matcher
+from changes import get_feed
+from archive import get_archive_job
+from sync import get_sync
+from geo import get_places
+from notify import get_notifier
+from cards import STATUS_COLORS, CardPool, PostCard
+from models import Post
+from validators import post_problems
+from images import UPLOAD_DIR, get_pipeline, is_digest
+from tasks import session_tasks
+from metrics import instrument
+
+def start_services(posts_store) -> None:
+    """Start the process's background work on the posts; every call after the first changes nothing.
+
+    main.py calls it as the app starts, so alerts go out and synced posts come
+    in whether or not anyone has opened Lost Items yet.
+    """
+    matcher = get_matcher(posts_store)
+    matcher.start()
+    #creates, deletes and status changes from every session and process arrive through the change log
+    change_feed = get_feed(posts_store)
+    change_feed.subscribe(matcher.apply_changes)
+    #every distinct last-seen location filed on the campus map, for the "near a building" order
+    change_feed.subscribe(get_places(posts_store).apply_changes)
+    #other users' saved searches are checked against each new post, however it arrived; alerts go out from the outbox
+    notifier = get_notifier(posts_store)
+    change_feed.subscribe(notifier.apply_changes)
+    notifier.start()
+    change_feed.start()
+    #old and long-claimed posts move to the archive in the background; search still finds them
+    get_archive_job(posts_store).start()
+    #mobile builds mirror a central server (MSF_SYNC_URL) into this store; the list keeps reading it
+    sync = get_sync(posts_store)
+    if sync is not None:
+        sync.start()
+
 
 def main(page: ft.Page, on_back=None, posts_store=None, current_user=None) -> None:
     if posts_store is None:
-        posts_store = []
+        posts_store = get_store()
+    start_services(posts_store)
+    matcher = get_matcher(posts_store)
+    change_feed = get_feed(posts_store)
+    places = get_places(posts_store)
+    notifier = get_notifier(posts_store)
+    sync = get_sync(posts_store)
+    if sync is not None:
+        sync.poke()
+    images = get_pipeline()
+    #this screen's share of the session's background work: handlers await the
+    #pools through it, and leaving the screen cancels whatever is still pending
+    previous_tasks = getattr(page, "lost_tasks", None)
+    if previous_tasks is not None:
+        previous_tasks.cancel()
+    tasks = page.lost_tasks = session_tasks(page).child()
     if current_user is None:
         current_user = {"email": "", "logged_in": False}
     
     page.title = "Lost Item Postings"
-    page.window_width = 900
+    page.window_width = 1000
     page.window_height = 700
     page.padding = 20
     page.theme_mode = ft.ThemeMode.LIGHT
@@ -25,6 +83,11 @@ def main(page: ft.Page, on_back=None, posts_store=None, current_user=None) -> No
     date_field = ft.TextField(label="Date Lost (YYYY-MM-DD)", width=520)
     contact_field = ft.TextField(label="Contact Info", width=520)
     image_url_field = ft.TextField(label="Image URL (optional)", width=520)
+    image_picker = ft.FilePicker()
+    upload_photo_button = ft.OutlinedButton("Upload Photo", icon=ft.Icons.PHOTO_CAMERA, width=200)
+    photo_status = ft.Text("", size=12, color=ft.Colors.GREY_600)
+    #digest of the photo attached to the form, and whether it is still being processed
+    photo_state = {"digest": "", "busy": False}
     post_button = ft.ElevatedButton(
         "Post Lost Item", 
         width=200, 
@@ -54,92 +117,667 @@ def main(page: ft.Page, on_back=None, posts_store=None, current_user=None) -> No
 
    
     list_header = ft.Text("Lost Items List", size=22, weight=ft.FontWeight.BOLD)
+    sync_status = ft.Text("", size=12, color=ft.Colors.GREY_600, visible=False)
     create_header = ft.Text("Create Lost Item", size=22, weight=ft.FontWeight.BOLD)
 
    
     def update_post_button(_=None):
-        post_button.disabled = not (title_field.value and description_field.value and location_field.value and status_dropdown.value)
-        page.update()
-    status_dropdown.on_change = update_post_button    
+        disabled = photo_state["busy"] or not (title_field.value and description_field.value and location_field.value and status_dropdown.value)
+        if post_button.disabled != disabled:
+            post_button.disabled = disabled
+            page.update(post_button)
+    validate_post = Debouncer(update_post_button)
+    status_dropdown.on_change = validate_post
 
-    title_field.on_change = update_post_button
-    description_field.on_change = update_post_button
-    location_field.on_change = update_post_button
+    title_field.on_change = validate_post
+    description_field.on_change = validate_post
+    location_field.on_change = validate_post
+
+    def show_place(_=None):
+        #say which building the text was read as; unknown places still post, and list last when sorting by distance
+        text = (location_field.value or "").strip()
+        place = places.place_of(text) if text else None
+        helper = None
+        if text:
+            helper = f"On the campus map as {place.name}" if place is not None else "Not on the campus map"
+        if location_field.helper != helper:
+            location_field.helper = helper
+            page.update(location_field)
+    location_field.on_blur = tasks.handler(show_place)
 
     page.appbar = ft.AppBar(
         title=ft.Text("Lost Items"),
         bgcolor=ft.Colors.RED_200,
-        leading=ft.IconButton(ft.Icons.ARROW_BACK, on_click=lambda _: on_back()) if on_back else None
+        leading=ft.IconButton(ft.Icons.ARROW_BACK, on_click=tasks.handler(lambda _: leave(), "leave")) if on_back else None
     )
 
-    posts_list = ft.Column(spacing=8, width=700)
+    #cards are built a page at a time as the user scrolls, never for the whole store
+    PAGE_SIZE = 25
+    SCROLL_PREFETCH_PX = 400
 
-    
-    def status_badge(status: str) -> ft.Container:
-        color_map = {
-            "Lost":    ft.Colors.RED_400,
-            "Found":   ft.Colors.GREEN_400,
-            "Claimed": ft.Colors.BLUE_400,
-        }
-        return ft.Container(
-            content=ft.Text(
-                status,
-                color=ft.Colors.WHITE,
-                size=12,
-                weight=ft.FontWeight.BOLD
-            ),
-            bgcolor=color_map.get(status, ft.Colors.GREY_400),
-            border_radius=12,
-            padding=ft.padding.symmetric(horizontal=10, vertical=4)
-        )
+    posts_list = ft.ListView(spacing=8, width=700, expand=True, scroll_interval=100)
+    empty_placeholder = ft.Text("No posts yet. Be the first to post.")
+    load_more_button = ft.TextButton("Load more", visible=False)
+    show_all_button = ft.TextButton("Show all posts", visible=False)
+
+    #search runs against the store's full-text indexes, live posts ranked first and
+    #archived ones after them; results are capped
+    SEARCH_LIMIT = 200
+    search_field = ft.TextField(
+        label="Search title, description, category or location",
+        prefix_icon=ft.Icons.SEARCH,
+        width=520
+    )
 
-    def render_posts(filtered=None):
-        display = filtered if filtered is not None else posts_store
-        posts_list.controls.clear()
+    #what the list is showing: the store (paged by keyset cursor, narrowed by the
+    #filter panel) or a search/matches subset, how many cards are built and
+    #whether another page exists. Store reads run on the I/O pool and everything
+    #else on the session's loop; `generation` moves on with every new render or
+    #search, so a read that comes back after a newer one started is dropped
+    feed = {"filtered": None, "shown": 0, "cursor": None, "more": False, "filters": {}, "sort": "oldest",
+            "near": None, "radius": None, "tombstones": 0, "loading": False, "generation": 0, "rendering": 0}
 
-        if not display:
-            posts_list.controls.append(ft.Text("No posts yet. Be the first to post."))
-        else:
-            for i, p in enumerate(display):
-                is_author = p.get("author") == current_user.get("email")
+    #keyed card cache: post id -> PostCard in the list, so a change only touches its
+    #own card; cards that leave the list are re-bound to the next posts shown
+    card_cache = {}
+    #ids with a live card in posts_list. A deleted post's card is hidden in place
+    #(a tombstone) so the delete patches that one card; tombstones are swept out
+    #on the next render or once MAX_TOMBSTONES have piled up
+    listed = set()
+    MAX_TOMBSTONES = 25
+    #posts deleted while a search/matches subset is open, skipped when it pages on
+    deleted_ids = set()
+
+    #filter panel: every filter is an indexed query in the store, and the option
+    #counts come from the store's trigger-maintained facet table
+    ANY = "any"
+    MAX_FACET_OPTIONS = 50
+    SORT_OPTIONS = {"oldest": "Oldest first", "newest": "Newest first", "date": "Date lost (latest)", "near": "Nearest to a building"}
+    RADIUS_OPTIONS = (100, 250, 500, 1000)
+    status_filter = ft.Dropdown(label="Status", width=200, value=ANY)
+    category_filter = ft.Dropdown(label="Category", width=200, value=ANY, enable_filter=True)
+    location_filter = ft.Dropdown(label="Location", width=200, value=ANY, enable_filter=True)
+    date_from_field = ft.TextField(label="From (YYYY-MM-DD)", width=200)
+    date_to_field = ft.TextField(label="To (YYYY-MM-DD)", width=200)
+    sort_dropdown = ft.Dropdown(
+        label="Sort",
+        width=200,
+        value="oldest",
+        options=[ft.dropdown.Option(key=k, text=t) for k, t in SORT_OPTIONS.items()]
+    )
+    #shown with the "near" sort: the building to measure from, and how far out to list
+    near_dropdown = ft.Dropdown(
+        label="Near",
+        width=200,
+        value=places.gazetteer.places[0].name,
+        enable_filter=True,
+        visible=False,
+        options=[ft.dropdown.Option(key=p.name) for p in sorted(places.gazetteer.places, key=lambda p: p.name)]
+    )
+    radius_dropdown = ft.Dropdown(
+        label="Within",
+        width=200,
+        value=ANY,
+        visible=False,
+        options=[ft.dropdown.Option(key=ANY, text="Any distance")] + [ft.dropdown.Option(key=str(m), text=f"{m} m") for m in RADIUS_OPTIONS]
+    )
+    clear_filters_button = ft.TextButton("Clear filters", visible=False)
+    #saved searches (notify.py): new posts like the current search raise an alert
+    alerts_button = ft.TextButton("Notify me", icon=ft.Icons.NOTIFICATIONS_OUTLINED, visible=bool(current_user.get("logged_in")))
 
-                delete_button = ft.IconButton(
+    def author_actions(card: PostCard) -> ft.Row:
+        return ft.Row(
+            controls=[
+                ft.PopupMenuButton(
+                    icon=ft.Icons.SWAP_HORIZ,
+                    tooltip="Change Status",
+                    items=[
+                        ft.PopupMenuItem(content=ft.Text(s), on_click=tasks.handler(lambda _, s=s: set_post_status(card.post.id, s), "set_post_status"))
+                        for s in STATUS_COLORS
+                    ]
+                ),
+                ft.IconButton(
                     icon=ft.Icons.DELETE_OUTLINE,
                     icon_color=ft.Colors.RED_400,
                     tooltip="Delete Post",
-                    on_click=lambda _, idx=i: delete_post(idx)
-                ) if is_author else ft.Container()
-                card = ft.Card(
-                    content=ft.Container(
-                        content=ft.Column(
-                            controls=[
-                                ft.Row(
-                                    controls=[
-                                        ft.Text(p["title"], size=16, weight=ft.FontWeight.BOLD, expand=True),
-                                        status_badge(p.get("status", "Lost")), delete_button
-                                    ],
-                                    alignment=ft.MainAxisAlignment.SPACE_BETWEEN
-                                ),
-                                ft.Text(p["description"], size=13),
-                                ft.Row(controls=[
-                                    ft.Text(
-                                        f"Category: {p['category']}  |  "
-                                        f"Location: {p['location']}  |  "
-                                        f"Date: {p['date']}"
-                                    )
-                                ]),
-                                ft.Row(controls=[
-                                    ft.Text(f"Contact: {p['contact']}")
-                                ]),
-                            ],
-                            spacing=6
-                        ),
-                        padding=12
-                    ),
-                    elevation=2
-                )
-                posts_list.controls.append(card)
-        page.update()
+                    on_click=tasks.handler(lambda _: delete_post(card.post.id), "delete_post")
+                ),
+            ],
+            spacing=0
+        )
+
+    def new_card() -> PostCard:
+        return PostCard(
+            on_matches=lambda card: tasks.handler(lambda _: show_matches(card.post.id), "show_matches"),
+            author_actions=author_actions,
+        )
+
+    card_pool = CardPool(new_card)
+
+    def bind_card(card: PostCard, p) -> None:
+        #archived posts come only from search and can no longer be changed
+        card.bind(p, is_author=p.author == current_user.get("email") and not p.archived)
+        if is_digest(p.image):
+            show_thumbnail(card, p.image)
+
+    def show_thumbnail(card: PostCard, digest: str):
+        #never decode on the render path: cached bytes go in now, the rest arrive from the image workers
+        def fill_later(data: bytes):
+            #the card may have been re-bound to another post meanwhile
+            if card.post is None or card.post.image != digest:
+                return
+            card.show_photo(data)
+            page.update(card.photo)
+
+        data = images.thumbnail(digest, on_ready=lambda data: tasks.call_soon(fill_later, data))
+        if data is not None:
+            card.show_photo(data)
+        else:
+            card.photo.visible = True
+
+    def get_card(p) -> PostCard:
+        card = card_cache.get(p.id)
+        if card is None:
+            card = card_cache[p.id] = card_pool.take()
+            bind_card(card, p)
+        elif card.post.archived != p.archived:
+            bind_card(card, p)
+        return card
+
+    def release_cards(keep) -> None:
+        """Return the cached cards of posts not in `keep` to the pool."""
+        for post_id in [k for k in card_cache if k not in keep]:
+            card_pool.give(card_cache.pop(post_id))
+
+    def sync_load_more():
+        if load_more_button.visible != feed["more"]:
+            load_more_button.visible = feed["more"]
+            page.update(load_more_button)
+
+    def window_query(limit: int):
+        """The store read for the next `limit` posts of the list, as a call that can run on an I/O thread."""
+        near, radius, filters, sort, cursor = feed["near"], feed["radius"], feed["filters"], feed["sort"], feed["cursor"]
+        #ask for one extra row to learn whether another page exists
+        if near is not None:
+            return lambda: places.query_near(near, filters, after=cursor, limit=limit + 1, radius_m=radius)
+        return lambda: posts_store.query_posts(filters, sort, after=cursor, limit=limit + 1)
+
+    def take_rows(rows: list, start: int, limit: int) -> list:
+        feed["more"] = len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            feed["cursor"] = rows[-1]
+        feed["shown"] = start + len(rows)
+        return rows
+
+    async def fetch_window(start: int, limit: int):
+        """The posts for `limit` places of the list from `start`, or None if a newer render began meanwhile."""
+        if feed["filtered"] is not None:
+            #pages are positions in the subset, so skipping deleted posts does not shift them
+            subset = feed["filtered"]
+            feed["more"] = start + limit < len(subset)
+            feed["shown"] = min(start + limit, len(subset))
+            return [p for p in subset[start:start + limit] if p.id not in deleted_ids]
+        generation = feed["generation"]
+        rows = await tasks.io(window_query(limit))
+        if generation != feed["generation"]:
+            return None
+        return take_rows(rows, start, limit)
+
+    def begin_render(filtered) -> int:
+        """Point the list at `filtered` (None: the store) from the top; returns how many posts to read."""
+        if filtered is not feed["filtered"]:
+            feed["shown"] = 0
+            deleted_ids.clear()
+        feed["filtered"] = filtered
+        feed["generation"] += 1
+        if show_all_button.visible != (filtered is not None):
+            show_all_button.visible = filtered is not None
+            page.update(show_all_button)
+        feed["cursor"] = None
+        #keep the window the user already scrolled through, but start with one page
+        return max(feed["shown"], PAGE_SIZE)
+
+    @instrument()
+    async def render_posts(filtered=None):
+        limit = begin_render(filtered)
+        #appends wait for this; they would page on from a cursor it is about to reset
+        feed["rendering"] += 1
+        try:
+            window = await fetch_window(0, limit)
+        finally:
+            feed["rendering"] -= 1
+        if window is not None:
+            show_window(window)
+
+    def show_window(window: list) -> None:
+        #cards that dropped out of the window (tombstones included) are re-bound to the posts coming in
+        live_ids = {p.id for p in window}
+        release_cards(live_ids)
+        for c in posts_list.controls:
+            if isinstance(c.data, PostCard) and not c.visible:
+                card_pool.give(c.data)
+        wanted = [get_card(p).card for p in window] or [empty_placeholder]
+        listed.clear()
+        listed.update(live_ids)
+        feed["tombstones"] = 0
+
+        #reuse the same control instances so the patch only carries what moved
+        current = posts_list.controls
+        if len(current) != len(wanted) or any(a is not b for a, b in zip(current, wanted)):
+            posts_list.controls = wanted
+            page.update(posts_list)
+        sync_load_more()
+
+    async def append_page():
+        if not feed["more"] or feed["rendering"]:
+            return
+        rows = await fetch_window(feed["shown"], PAGE_SIZE)
+        if rows is None:
+            return
+        if posts_list.controls and posts_list.controls[0] is empty_placeholder:
+            posts_list.controls.clear()
+        posts_list.controls.extend(get_card(p).card for p in rows)
+        listed.update(p.id for p in rows)
+        page.update(posts_list)
+        sync_load_more()
+
+    async def render_found(find):
+        """List what `find()` returns (read on an I/O thread), unless something newer was asked for meanwhile."""
+        feed["generation"] += 1
+        generation = feed["generation"]
+        found = await tasks.io(find)
+        if generation == feed["generation"]:
+            await render_posts(filtered=found)
+
+    async def on_search(_=None):
+        query = search_field.value.strip() if search_field.value else ""
+        if query:
+            filters = feed["filters"]
+            await render_found(lambda: posts_store.search(query, limit=SEARCH_LIMIT, filters=filters, include_archived=True))
+        else:
+            await render_posts()
+
+    search_field.on_change = Debouncer(tasks.handler(on_search))
+
+    def facet_options(facet: str, counts: dict, selected: str) -> list:
+        if facet == "status":
+            values = [v for v in STATUS_COLORS if v in counts or v == selected]
+        else:
+            values = sorted(counts, key=counts.get, reverse=True)[:MAX_FACET_OPTIONS]
+            if selected != ANY and selected not in values:
+                values.append(selected)
+        return [ft.dropdown.Option(key=ANY, text="Any")] + [
+            ft.dropdown.Option(key=v, text=f"{v} ({counts.get(v, 0)})") for v in values
+        ]
+
+    def fill_facets(counts: dict) -> list:
+        """Refresh the filter options from facet counts; returns the dropdowns that changed."""
+        changed = []
+        for facet, dropdown in (("status", status_filter), ("category", category_filter), ("location", location_filter)):
+            options = facet_options(facet, counts.get(facet, {}), dropdown.value)
+            if [o.text for o in options] != [o.text for o in dropdown.options]:
+                #keep the option controls by key, so a count change patches only its text
+                kept = {o.key: o for o in dropdown.options}
+                for i, o in enumerate(options):
+                    if o.key in kept:
+                        kept[o.key].text = o.text
+                        options[i] = kept[o.key]
+                dropdown.options = options
+                changed.append(dropdown)
+        return changed
+
+    def read_date(field: ft.TextField) -> str:
+        value = (field.value or "").strip()
+        error = None
+        if value:
+            try:
+                value = date.fromisoformat(value).isoformat()
+            except ValueError:
+                error, value = "Use YYYY-MM-DD", ""
+        if field.error != error:
+            field.error = error
+            page.update(field)
+        return value
+
+    async def on_filter_change(_=None):
+        filters = {
+            "status": status_filter.value if status_filter.value != ANY else "",
+            "category": category_filter.value if category_filter.value != ANY else "",
+            "location": location_filter.value if location_filter.value != ANY else "",
+            "date_from": read_date(date_from_field),
+            "date_to": read_date(date_to_field),
+        }
+        filters = {k: v for k, v in filters.items() if v}
+        near = places.gazetteer.get(near_dropdown.value) if sort_dropdown.value == "near" else None
+        radius = float(radius_dropdown.value) if near is not None and radius_dropdown.value != ANY else None
+        if filters == feed["filters"] and sort_dropdown.value == feed["sort"] and (near, radius) == (feed["near"], feed["radius"]):
+            return
+        feed["filters"] = filters
+        feed["sort"] = sort_dropdown.value
+        feed["near"], feed["radius"] = near, radius
+        #a new query starts from the first page
+        feed["shown"] = 0
+        changed = []
+        if clear_filters_button.visible != bool(filters):
+            clear_filters_button.visible = bool(filters)
+            changed.append(clear_filters_button)
+        if near_dropdown.visible != (sort_dropdown.value == "near"):
+            near_dropdown.visible = radius_dropdown.visible = sort_dropdown.value == "near"
+            changed += [near_dropdown, radius_dropdown]
+        if changed:
+            page.update(*changed)
+        await on_search()
+
+    async def clear_filters(_):
+        status_filter.value = category_filter.value = location_filter.value = ANY
+        date_from_field.value = date_to_field.value = ""
+        page.update(status_filter, category_filter, location_filter, date_from_field, date_to_field)
+        await on_filter_change()
+
+    for dropdown in (status_filter, category_filter, location_filter, sort_dropdown, near_dropdown, radius_dropdown):
+        dropdown.on_select = tasks.handler(on_filter_change)
+    validate_dates = Debouncer(tasks.handler(on_filter_change))
+    date_from_field.on_change = validate_dates
+    date_to_field.on_change = validate_dates
+    clear_filters_button.on_click = tasks.handler(clear_filters)
+    fill_facets(posts_store.facet_counts())
+
+    async def load_more(_=None):
+        #scroll events keep arriving while a page loads; one fetch at a time is enough
+        if not feed["more"] or feed["loading"]:
+            return
+        feed["loading"] = True
+        try:
+            await append_page()
+        finally:
+            feed["loading"] = False
+
+    async def on_feed_scroll(e: ft.OnScrollEvent):
+        if e.pixels >= e.max_scroll_extent - SCROLL_PREFETCH_PX:
+            await load_more()
+
+    posts_list.on_scroll = tasks.handler(on_feed_scroll)
+    load_more_button.on_click = tasks.handler(load_more)
+
+    def matches_filters(p) -> bool:
+        f = feed["filters"]
+        if any(f.get(c) and getattr(p, c) != f[c] for c in ("status", "category", "location")):
+            return False
+        if f.get("date_from") and p.date < f["date_from"]:
+            return False
+        if f.get("date_to") and p.date > f["date_to"]:
+            return False
+        #outside the radius, or a location the change feed has yet to file (it lists the post then)
+        if feed["near"] is not None and places.near_key(feed["near"], p, feed["radius"]) is None:
+            return False
+        return True
+
+    def comes_before(a, b) -> bool:
+        """Whether post `a` is listed above post `b` in the current sort."""
+        if feed["sort"] == "date":
+            return (a.day, a.seq) > (b.day, b.seq)
+        if feed["sort"] == "newest":
+            return a.seq > b.seq
+        if feed["near"] is not None:
+            return places.near_key(feed["near"], a, feed["radius"]) < places.near_key(feed["near"], b, feed["radius"])
+        return a.seq < b.seq
+
+    def place_card(p) -> bool:
+        #a new post goes where the current filters and sort would list it, unless that is past the loaded window
+        if feed["filtered"] is not None or p.id in card_cache or not matches_filters(p):
+            return False
+        if not listed:
+            posts_list.controls.clear()
+            feed["tombstones"] = 0
+        controls = posts_list.controls
+        if feed["more"] and listed:
+            last = next(c for c in reversed(controls) if c.visible)
+            if not comes_before(p, last.data.post):
+                return False
+        index = next((i for i, c in enumerate(controls) if c.visible and comes_before(p, c.data.post)), len(controls))
+        if index == len(controls):
+            feed["cursor"] = p
+        controls.insert(index, get_card(p).card)
+        listed.add(p.id)
+        feed["shown"] += 1
+        return True
+
+    def drop_card(post_id) -> list:
+        """Take a post's card out of the list; returns the controls to send."""
+        card = card_cache.pop(post_id, None)
+        if card is None or post_id not in listed:
+            return []
+        listed.discard(post_id)
+        if listed and feed["tombstones"] < MAX_TOMBSTONES:
+            card.card.visible = False
+            feed["tombstones"] += 1
+            return [card.card]
+        kept = []
+        for c in posts_list.controls:
+            if c.visible and c is not card.card:
+                kept.append(c)
+            elif isinstance(c.data, PostCard):
+                card_pool.give(c.data)
+        posts_list.controls = kept or [empty_placeholder]
+        feed["tombstones"] = 0
+        return [posts_list]
+
+    def insert_card(p):
+        if place_card(p):
+            page.update(posts_list)
+
+    def patch_card(post_id, status: str):
+        card = card_cache.get(post_id)
+        if card is not None and card.set_status(status):
+            page.update(card.badge)
+
+    def refresh_card(card: PostCard, p) -> list:
+        """Bring a bound card in line with a fresh row; returns the controls that changed."""
+        changed = []
+        card.post = p
+        if card.set_status(p.status.value):
+            changed.append(card.badge)
+        if card.set_match_count(p.match_count):
+            changed.append(card.matches)
+        if is_digest(p.image) and not card.photo.visible:
+            show_thumbnail(card, p.image)
+            changed.append(card.photo)
+        return changed
+
+    async def reload_posts():
+        #the feed skipped changes it could not replay: read the list again and bring every card up to date
+        await render_posts(feed["filtered"])
+        posts = await tasks.io(posts_store.get_many, list(card_cache))
+        changed = []
+        for post_id, card in list(card_cache.items()):
+            p = posts.get(post_id)
+            if p is None or (feed["filtered"] is None and not matches_filters(p)):
+                changed.extend(drop_card(post_id))
+            else:
+                changed.extend(refresh_card(card, p))
+        if changed:
+            page.update(*changed)
+
+    def apply_changes(batch):
+        #runs on the session's loop (see the subscription below); the whole batch goes out in one page.update
+        if batch.reset:
+            changed = fill_facets(batch.facets)
+            if changed:
+                page.update(*changed)
+            page.run_task(tasks.handler(reload_posts, "reload_posts"))
+            return
+        list_changed = False
+        changed = []
+        deleted_ids.update(batch.deleted)
+        for post_id in batch.deleted:
+            changed.extend(drop_card(post_id))
+        for p in batch.created:
+            list_changed = place_card(p) or list_changed
+        for p in batch.updated:
+            card = card_cache.get(p.id)
+            if card is None:
+                #may have just started matching the filters
+                list_changed = place_card(p) or list_changed
+            elif feed["filtered"] is None and not matches_filters(p):
+                changed.extend(drop_card(p.id))
+            else:
+                changed.extend(refresh_card(card, p))
+        if list_changed:
+            changed.append(posts_list)
+        if batch.facets is not None:
+            changed.extend(fill_facets(batch.facets))
+        if changed:
+            page.update(*changed)
+        if list_changed:
+            sync_load_more()
+        if not listed and feed["more"]:
+            #every loaded post was deleted or archived; load the next ones from the top
+            page.run_task(tasks.handler(render_posts, "render_posts"), feed["filtered"])
+
+    async def set_post_status(post_id, status: str):
+        #with sync on, the change is also queued for upload, like a new post
+        if await tasks.io(posts_store.set_status if sync is None else sync.set_status, post_id, status):
+            patch_card(post_id, status)
+            #gone if it was deleted or archived meanwhile
+            post = await tasks.io(posts_store.get, post_id)
+            if post is not None:
+                matcher.update_status(post)
+
+    def attach_image(post_id, digest: str):
+        #runs on an image worker once a pasted URL has been downloaded and thumbnailed;
+        #the post keeps its photo even if the user has left the screen by then
+        if posts_store.set_image(post_id, digest):
+            tasks.call_soon(show_attached_image, post_id, digest)
+
+    def show_attached_image(post_id, digest: str):
+        card = card_cache.get(post_id)
+        if card is not None:
+            card.post = replace(card.post, image=digest)
+            show_thumbnail(card, digest)
+            page.update(card.photo)
+
+    def on_url_failed(error: Exception):
+        page.show_dialog(ft.SnackBar(ft.Text(f"Could not attach the image from that URL: {error}")))
+
+    def on_photo_ready(digest: str):
+        photo_state["digest"] = digest
+        photo_state["busy"] = False
+        photo_status.value = "Photo attached"
+        page.update(photo_status)
+        update_post_button()
+
+    def on_photo_failed(error: Exception):
+        photo_state["busy"] = False
+        photo_status.value = f"Could not use that photo: {error}"
+        page.update(photo_status)
+        update_post_button()
+
+    def start_photo(name: str):
+        photo_state["busy"] = True
+        photo_status.value = f"Processing {name}..."
+        page.update(photo_status)
+        update_post_button()
+
+    #image workers report back through the screen's scope, so a result for a form the user left is dropped
+    def photo_ready(digest: str):
+        tasks.call_soon(on_photo_ready, digest)
+
+    def photo_failed(error: Exception):
+        tasks.call_soon(on_photo_failed, error)
+
+    async def pick_photo(_):
+        files = await image_picker.pick_files(file_type=ft.FilePickerFileType.IMAGE)
+        if not files:
+            return
+        f = files[0]
+        start_photo(f.name)
+        if f.path:
+            images.ingest_file(f.path, on_done=photo_ready, on_error=photo_failed)
+        else:
+            #web: the browser uploads into UPLOAD_DIR first, see on_photo_uploaded
+            upload_name = f"{uuid.uuid4().hex}-{f.name}"
+            await image_picker.upload([
+                ft.FilePickerUploadFile(upload_url=page.get_upload_url(upload_name, 600), id=f.id, name=upload_name)
+            ])
+
+    def on_photo_uploaded(e: ft.FilePickerUploadEvent):
+        if e.error:
+            on_photo_failed(Exception(e.error))
+        elif e.progress == 1:
+            images.ingest_upload(os.path.join(UPLOAD_DIR, e.file_name), on_done=photo_ready, on_error=photo_failed)
+
+    upload_photo_button.on_click = tasks.handler(pick_photo)
+    image_picker.on_upload = tasks.handler(on_photo_uploaded)
+
+    async def show_matches(post_id):
+        await render_found(lambda: posts_store.matches_for(post_id))
+
+    async def show_all(_):
+        search_field.value = ""
+        page.update(search_field)
+        await render_posts()
+
+    show_all_button.on_click = tasks.handler(show_all)
+
+    async def open_alerts(_):
+        #prefilled from what the list is showing, watching for Found posts
+        email = current_user["email"]
+        saved = await tasks.io(notifier.subscriptions, email)
+        near = location_filter.value if location_filter.value != ANY else (feed["near"].name if feed["near"] else "")
+        keywords = ft.TextField(label="Keywords", value=(search_field.value or "").strip(), width=360)
+        category = ft.TextField(label="Category", value=category_filter.value if category_filter.value != ANY else "", width=360)
+        location = ft.TextField(label="Last seen at", value=near, width=360)
+        status = ft.Dropdown(label="When a post is", width=360, value="Found",
+                             options=[ft.dropdown.Option("Found"), ft.dropdown.Option("Lost")])
+        error = ft.Text("", color=ft.Colors.RED_400, size=12, visible=False)
+        saved_list = ft.Column(spacing=0)
+
+        def saved_row(sub) -> ft.Row:
+            return ft.Row(
+                controls=[
+                    ft.Text(sub.describe(), size=13, expand=True),
+                    ft.IconButton(ft.Icons.DELETE_OUTLINE, tooltip="Stop these alerts",
+                                  on_click=tasks.handler(lambda _: remove(sub.id), "remove_alert")),
+                ],
+                data=sub.id
+            )
+
+        async def remove(sub_id):
+            if await tasks.io(notifier.unsubscribe, email, sub_id):
+                saved_list.controls = [r for r in saved_list.controls if r.data != sub_id]
+                page.update(saved_list)
+
+        async def save(_):
+            try:
+                sub = await tasks.io(notifier.subscribe, email, status.value, category.value, location.value, keywords.value)
+            except ValueError as e:
+                error.value, error.visible = str(e), True
+                page.update(error)
+                return
+            page.pop_dialog()
+            page.show_dialog(ft.SnackBar(ft.Text(f"We'll let you know about new posts: {sub.describe()}")))
+
+        def cancel(_):
+            page.pop_dialog()
+
+        saved_list.controls = [saved_row(sub) for sub in saved]
+        page.show_dialog(ft.AlertDialog(
+            title=ft.Text("Notify me about new posts"),
+            content=ft.Column(
+                controls=[keywords, category, location, status, error, saved_list],
+                tight=True,
+                width=380,
+                scroll=ft.ScrollMode.AUTO
+            ),
+            actions=[
+                ft.TextButton("Cancel", on_click=tasks.handler(cancel)),
+                ft.TextButton("Save", on_click=tasks.handler(save)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END
+        ))
+
+    alerts_button.on_click = tasks.handler(open_alerts)
 
 
 
@@ -147,84 +785,165 @@ def main(page: ft.Page, on_back=None, posts_store=None, current_user=None) -> No
         page.lost_view = "create"
         render_view()
 
-    def post_item(_e):
-        if not (title_field.value and description_field.value and location_field.value):
+    async def post_item(_e):
+        validate_post.cancel()
+        date_text = (date_field.value or "").strip() or datetime.now().strftime("%Y-%m-%d")
+        problems = post_problems(
+            title_field.value, description_field.value, location_field.value, date_text, status_dropdown.value
+        )
+        if date_field.error != problems.get("date"):
+            date_field.error = problems.get("date")
+            page.update(date_field)
+        if problems:
             return
-        post = {
-            "title": title_field.value,
-            "description": description_field.value,
-            "category": category_field.value or "Unspecified",
-            "location": location_field.value,
-            "date": date_field.value or datetime.now().strftime("%Y-%m-%d"),
-            "contact": contact_field.value or "",
-            "image": image_url_field.value or "",
-            "status": status_dropdown.value,
-            "author": current_user["email"]
-
-        }
-        posts_store.append(post)
-        render_posts()
+        image_url = image_url_field.value or ""
+        post = Post.new(
+            title=title_field.value,
+            description=description_field.value,
+            category=category_field.value,
+            location=location_field.value,
+            date_text=date_text,
+            contact=contact_field.value or "",
+            image=photo_state["digest"],
+            status=status_dropdown.value,
+            author=current_user["email"]
+        )
+        post_button.disabled = True
+        page.update(post_button)
+        #with sync on, the post is also queued for the sync thread to upload once the server can be reached
+        post = await tasks.io(posts_store.add if sync is None else sync.add, post)
+        insert_card(post)
+        #a pasted URL is fetched and thumbnailed once, in the background
+        if image_url.strip() and not post.image:
+            images.ingest_url(
+                image_url.strip(),
+                on_done=lambda digest: attach_image(post.id, digest),
+                on_error=lambda error: tasks.call_soon(on_url_failed, error)
+            )
+        #match counts reach every open list (this one included) through the change feed
+        matcher.submit(post)
         #clear form
         title_field.value = ""
         description_field.value = ""
         category_field.value = ""
         location_field.value = ""
+        location_field.helper = None
         date_field.value = ""
         contact_field.value = ""
         image_url_field.value = ""
+        photo_state["digest"] = ""
+        photo_status.value = ""
         status_dropdown.value = "Lost"
         update_post_button()
         page.lost_view = "list"
         render_view()
 
-    def delete_post(index: int):
-        def confirm_delete(_):
-            if 0 <= index < len(posts_store):
-                posts_store.pop(index)
-            dialog.open = False
-            page.update()
-            render_posts()
+    def delete_post(post_id):
+        #the dialog is bound to the post's id, so it deletes the right post however
+        #the list changed (or was filtered) while it was open
+        async def confirm_delete(_):
+            page.pop_dialog()
+            if await tasks.io(posts_store.delete if sync is None else sync.delete, post_id):
+                matcher.remove(post_id)
+            deleted_ids.add(post_id)
+            changed = drop_card(post_id)
+            if changed:
+                page.update(*changed)
 
         def cancel_delete(_):
-            dialog.open = False
-            page.update()
+            page.pop_dialog()
 
         dialog = ft.AlertDialog(
             modal=True,
             title=ft.Text("Delete Post"),
             content=ft.Text("Are you sure you want to delete this post?"),
             actions=[
-                ft.TextButton("Cancel", on_click=cancel_delete),
+                ft.TextButton("Cancel", on_click=tasks.handler(cancel_delete)),
                 ft.TextButton(
                     "Delete",
-                    on_click=confirm_delete,
+                    on_click=tasks.handler(confirm_delete),
                     style=ft.ButtonStyle(color=ft.Colors.RED_400)
                 )
             ],
             actions_alignment=ft.MainAxisAlignment.END
         )
-        page.overlay.append(dialog)
-        dialog.open = True
-        page.update()
+        page.show_dialog(dialog)
+
+
+    #one live subscription per page, dropped with the screen's task scope when the
+    #user leaves the list or the session ends. The feed thread only hands the
+    #batch over; the list is changed and sent from the session's loop
+    tasks.defer(change_feed.subscribe(lambda batch: tasks.call_soon(apply_changes, batch)))
+
+    def set_sync_status(online: bool, pending: int) -> bool:
+        if not online:
+            text = "Offline: showing saved posts" + (f", {pending} waiting to upload" if pending else "")
+        elif pending:
+            text = f"Uploading {pending} change{'s' if pending != 1 else ''}..."
+        else:
+            text = ""
+        if sync_status.value == text:
+            return False
+        sync_status.value = text
+        sync_status.visible = bool(text)
+        return True
+
+    def show_sync_state(online: bool, pending: int):
+        if set_sync_status(online, pending):
+            page.update(sync_status)
+
+    if sync is not None:
+        tasks.defer(sync.subscribe(lambda online, pending: tasks.call_soon(show_sync_state, online, pending)))
+        #the last attempt failed: say so from the first frame rather than after the next one
+        if sync.online is False:
+            set_sync_status(False, sync.state.pending())
 
+    def leave():
+        tasks.cancel()
+        on_back()
 
     def go_to_list(_e):
         page.lost_view = "list"
         render_view()
 
-    back_to_list_button.on_click = go_to_list
+    back_to_list_button.on_click = tasks.handler(go_to_list)
 
-    post_button.on_click = post_item
+    post_button.on_click = tasks.handler(post_item)
 
     def layout_list():
         return ft.Column(
             controls=[
                 list_header,
-                ft.Row(controls=[ft.ElevatedButton("Create Post", on_click=go_to_create, width=260)], alignment=ft.MainAxisAlignment.CENTER),
+                sync_status,
+                ft.Row(controls=[ft.ElevatedButton("Create Post", on_click=tasks.handler(go_to_create), width=260)], alignment=ft.MainAxisAlignment.CENTER),
+                ft.Row(controls=[search_field, alerts_button], alignment=ft.MainAxisAlignment.CENTER),
+                show_all_button,
                 ft.Text(""),  # spacer
-                posts_list
+                ft.Row(
+                    controls=[
+                        ft.Column(
+                            controls=[
+                                ft.Text("Filter", size=16, weight=ft.FontWeight.BOLD),
+                                status_filter, category_filter, location_filter,
+                                date_from_field, date_to_field, sort_dropdown,
+                                near_dropdown, radius_dropdown,
+                                clear_filters_button
+                            ],
+                            width=220,
+                            spacing=10
+                        ),
+                        ft.Column(
+                            controls=[posts_list, load_more_button],
+                            expand=True,
+                            horizontal_alignment=ft.CrossAxisAlignment.CENTER
+                        )
+                    ],
+                    expand=True,
+                    vertical_alignment=ft.CrossAxisAlignment.START
+                )
             ],
-            width=860,
+            width=960,
+            expand=True,
             horizontal_alignment=ft.CrossAxisAlignment.CENTER
         )
 
@@ -266,6 +985,8 @@ def main(page: ft.Page, on_back=None, posts_store=None, current_user=None) -> No
                     alignment=ft.MainAxisAlignment.CENTER),
                 ft.Row(controls=[image_url_field], 
                     alignment=ft.MainAxisAlignment.CENTER),
+                ft.Row(controls=[upload_photo_button, photo_status], 
+                    alignment=ft.MainAxisAlignment.CENTER),
                 ft.Row(controls=[status_dropdown], 
                     alignment=ft.MainAxisAlignment.CENTER),
 
@@ -289,38 +1010,32 @@ def main(page: ft.Page, on_back=None, posts_store=None, current_user=None) -> No
 
 
 
+    #both views are mounted once and toggled, so a view switch only ships a visibility patch
+    list_layout = ft.Column(
+        controls=[layout_list()],
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        width=1900,
+        expand=True
+    )
+    create_layout = ft.Column(
+        controls=[layout_create()],
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        width=1900
+    )
+
+    @instrument()
     def render_view():
-        page.clean()
-        page.appbar = ft.AppBar(
-            title=ft.Text("Lost Items"),
-            bgcolor=ft.Colors.RED_200,
-            leading=ft.IconButton(ft.Icons.ARROW_BACK, on_click=lambda _: on_back()) if on_back else None
-        )
-        if page.lost_view == "list":
-            page.add(
-                ft.Column(
-                    controls=[layout_list()],
-                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                    width=1900
-                )
-            )
-        else:
-            page.add(
-                ft.Column(
-                    controls=[layout_create()],
-                    horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                    width=1900
-                )
-            )
-        page.update()
+        list_layout.visible = page.lost_view == "list"
+        create_layout.visible = not list_layout.visible
+        page.update(list_layout, create_layout)
 
 
     
-    render_view()
+    page.clean()
+    list_layout.visible = page.lost_view == "list"
+    create_layout.visible = not list_layout.visible
+    page.add(list_layout, create_layout)
+    #the first page is read right away, so the screen arrives with it in one frame
+    show_window(take_rows(window_query(begin_render(None))(), 0, PAGE_SIZE))
    
     update_post_button()
-
-
-
-
-
@@ -0,0 +1,260 @@
+import math
+import os
+import threading
+import time
+from array import array
+
+#per account: a burst of attempts, then one more every LOGIN_REFILL_SECONDS
+LOGIN_BURST = int(os.getenv("MSF_LOGIN_BURST", "5"))
+LOGIN_REFILL_SECONDS = float(os.getenv("MSF_LOGIN_REFILL_SECONDS", "60"))
+#per client address: roomier, since a campus NAT puts many users behind one address
+CLIENT_BURST = 30
+CLIENT_REFILL_SECONDS = 2.0
+#consecutive failures allowed before backoff starts, and how it grows
+FREE_FAILURES = 3
+BACKOFF_BASE = 5.0
+MAX_BACKOFF = 15 * 60
+#keys tracked per limiter; past this the least recently used go first
+MAX_KEYS = int(os.getenv("MSF_RATE_LIMIT_KEYS", "1000000"))
+WHEEL_SLOTS = 64
+#reverse proxies and load balancers in front of the web build; a connection
+#from one of them says nothing about which user is behind it
+TRUSTED_PROXIES = frozenset(a.strip() for a in os.getenv("MSF_TRUSTED_PROXIES", "").split(",") if a.strip())
+
+
+def client_key(client_ip: str, session_id: str) -> str:
+    """The key sign-in attempts are counted under per client.
+
+    The client's address, which Flet's web server takes from X-Forwarded-For
+    when uvicorn trusts the proxy that set it (FORWARDED_ALLOW_IPS). When the
+    address is missing or is one of TRUSTED_PROXIES, everyone behind it would
+    share one bucket and one attacker could lock them all out, so attempts are
+    counted per session instead.
+    """
+    if client_ip and client_ip not in TRUSTED_PROXIES:
+        return f"ip:{client_ip}"
+    return f"session:{session_id}"
+
+
+class RateLimiter:
+    """Token buckets with progressive backoff for an unbounded set of keys.
+
+    Bucket state lives in flat arrays indexed by a row number (a dict maps key
+    to row), so a tracked key costs a few dozen bytes plus the key itself. Rows
+    are filed into a time wheel by the tick they were last touched in; as time
+    moves on, each wheel slot that comes round again is swept and the rows
+    still idle in it are dropped. Idle means the bucket has refilled and any
+    backoff has run out, so forgetting the key loses nothing. Every call is
+    O(1), amortized over the sweeps.
+    """
+
+    def __init__(self, burst: int, refill_seconds: float, free_failures: int = FREE_FAILURES,
+                 backoff_base: float = BACKOFF_BASE, max_backoff: float = MAX_BACKOFF,
+                 max_keys: int = MAX_KEYS, wheel_slots: int = WHEEL_SLOTS):
+        self.burst = burst
+        self.rate = 1.0 / refill_seconds
+        self.free_failures = free_failures
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.max_keys = max_keys
+        #a key is forgotten once it has been idle for a full turn of the wheel
+        self.idle_seconds = max(burst * refill_seconds, max_backoff) + 1
+        self._tick_seconds = self.idle_seconds / wheel_slots
+        self._rows = {}
+        self._keys = []
+        self._tokens = array("d")
+        self._stamp = array("d")
+        self._until = array("d")
+        self._strikes = array("H")
+        self._touched = array("q")
+        self._free = array("I")
+        self._wheel = [array("I") for _ in range(wheel_slots)]
+        #how far into each slot over-the-cap eviction has already read
+        self._evicted = [0] * wheel_slots
+        #no live row was filed before this tick
+        self._floor = 0
+        self._tick = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    #time wheel
+    def _advance(self, now: float) -> int:
+        tick = int(now // self._tick_seconds)
+        if self._tick is None:
+            self._tick = tick
+        n = len(self._wheel)
+        #each slot swept is the one about to be refilled: its rows were last touched a full turn ago
+        for t in range(max(self._tick + 1, tick - n + 1), tick + 1):
+            self._sweep(t % n, t - n)
+        if tick > self._tick:
+            self._tick = tick
+        return tick
+
+    def _sweep(self, slot: int, expired_tick: int) -> None:
+        rows = self._wheel[slot]
+        for row in rows:
+            #a row is filed again on every touch; only its latest filing counts
+            if self._keys[row] is not None and self._touched[row] <= expired_tick:
+                self._drop(row)
+        del rows[:]
+        self._evicted[slot] = 0
+
+    def _drop(self, row: int) -> None:
+        del self._rows[self._keys[row]]
+        self._keys[row] = None
+        self._free.append(row)
+
+    def _evict_oldest(self) -> None:
+        n = len(self._wheel)
+        for t in range(max(self._floor, self._tick - n + 1), self._tick + 1):
+            slot = t % n
+            rows = self._wheel[slot]
+            i = self._evicted[slot]
+            while i < len(rows):
+                row = rows[i]
+                i += 1
+                if self._keys[row] is not None and self._touched[row] == t:
+                    self._drop(row)
+                    if len(self._rows) < self.max_keys:
+                        self._evicted[slot] = i
+                        return
+            self._evicted[slot] = i
+            self._floor = t + 1
+
+    def _row(self, key, now: float, tick: int, create: bool):
+        row = self._rows.get(key)
+        if row is not None:
+            self._tokens[row] = min(self.burst, self._tokens[row] + (now - self._stamp[row]) * self.rate)
+            self._stamp[row] = now
+            if create and self._touched[row] != tick:
+                self._file(row, tick)
+            return row
+        if not create:
+            return None
+        if len(self._rows) >= self.max_keys:
+            self._evict_oldest()
+        if self._free:
+            row = self._free.pop()
+            self._keys[row] = key
+            self._tokens[row] = self.burst
+            self._stamp[row] = now
+            self._until[row] = 0.0
+            self._strikes[row] = 0
+        else:
+            row = len(self._keys)
+            self._keys.append(key)
+            self._tokens.append(self.burst)
+            self._stamp.append(now)
+            self._until.append(0.0)
+            self._strikes.append(0)
+            self._touched.append(tick)
+        self._rows[key] = row
+        self._file(row, tick)
+        return row
+
+    def _file(self, row: int, tick: int) -> None:
+        self._floor = min(self._floor, tick)
+        self._touched[row] = tick
+        self._wheel[tick % len(self._wheel)].append(row)
+
+    #buckets
+    def wait(self, key, now: float = None) -> float:
+        """Seconds until `key` may try again; 0 when it may now. Does not use up a token."""
+        now = time.time() if now is None else now
+        with self._lock:
+            tick = self._advance(now)
+            row = self._row(key, now, tick, create=False)
+            if row is None:
+                return 0.0
+            wait = max(self._until[row] - now, (1 - self._tokens[row]) / self.rate)
+            #float residue from the refill arithmetic is not worth a retry message
+            return wait if wait > 1e-6 else 0.0
+
+    def take(self, key, now: float = None) -> None:
+        """Use up one token for `key` (call after `wait` said 0)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            tick = self._advance(now)
+            row = self._row(key, now, tick, create=True)
+            self._tokens[row] = max(0.0, self._tokens[row] - 1)
+
+    def failure(self, key, now: float = None) -> float:
+        """Record a failed attempt; returns the backoff it earned (0 while still free)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            tick = self._advance(now)
+            row = self._row(key, now, tick, create=True)
+            strikes = min(self._strikes[row] + 1, 0xFFFF)
+            self._strikes[row] = strikes
+            if strikes <= self.free_failures:
+                return 0.0
+            delay = min(self.max_backoff, self.backoff_base * 2 ** (strikes - self.free_failures - 1))
+            self._until[row] = now + delay
+            return delay
+
+    def success(self, key) -> None:
+        """Clear `key`'s failure streak; its bucket keeps counting attempts."""
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                self._strikes[row] = 0
+                self._until[row] = 0.0
+
+
+class LoginGuard:
+    """Sign-in throttling per account and per client address.
+
+    An attempt is let through only when both buckets allow it, so it is
+    checked before the password KDF runs and a blocked attempt costs nothing.
+    """
+
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.accounts = RateLimiter(LOGIN_BURST, LOGIN_REFILL_SECONDS, max_keys=max_keys)
+        self.clients = RateLimiter(
+            CLIENT_BURST, CLIENT_REFILL_SECONDS, free_failures=FREE_FAILURES * 5,
+            backoff_base=1.0, max_keys=max_keys
+        )
+
+    def attempt(self, account: str, client: str, now: float = None) -> float:
+        """0 and one token used from each bucket, or the seconds to wait before trying again."""
+        now = time.time() if now is None else now
+        wait = max(self.accounts.wait(account, now), self.clients.wait(client, now))
+        if wait > 0:
+            return wait
+        self.accounts.take(account, now)
+        self.clients.take(client, now)
+        return 0.0
+
+    def failed(self, account: str, client: str, now: float = None) -> float:
+        """Record a wrong password; returns how long the next attempt has to wait."""
+        now = time.time() if now is None else now
+        return max(self.accounts.failure(account, now), self.clients.failure(client, now))
+
+    def succeeded(self, account: str, client: str) -> None:
+        self.accounts.success(account)
+        self.clients.success(client)
+
+
+def retry_message(wait: float) -> str:
+    seconds = math.ceil(wait)
+    if seconds < 90:
+        when = f"{seconds} second{'s' if seconds != 1 else ''}"
+    else:
+        minutes = math.ceil(seconds / 60)
+        when = f"{minutes} minutes"
+    return f"Too many sign-in attempts. Try again in {when}."
+
+
+_default_guard = None
+_default_lock = threading.Lock()
+
+
+def get_login_guard() -> LoginGuard:
+    global _default_guard
+    if _default_guard is None:
+        with _default_lock:
+            if _default_guard is None:
+                _default_guard = LoginGuard()
+    return _default_guard
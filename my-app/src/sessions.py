@@ -0,0 +1,180 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from storage import DEFAULT_DB_PATH, SQLiteStore
+
+#how long a sign-in is remembered on a device
+SESSION_TTL = int(os.getenv("MSF_SESSION_TTL_HOURS", str(14 * 24))) * 3600
+#resolved tokens kept in memory; entries are re-read from the table after
+#SESSION_CACHE_TTL seconds so a sign-out in another process takes effect
+SESSION_CACHE_SIZE = int(os.getenv("MSF_SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = 30
+#expired rows are swept at most this often, a bounded chunk per statement
+PURGE_INTERVAL = 600
+PURGE_CHUNK = 1000
+
+#key the token is kept under in the client's SharedPreferences
+CLIENT_STORAGE_KEY = "msf.session"
+
+SESSIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    key        TEXT PRIMARY KEY,
+    email      TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
+
+CREATE TABLE IF NOT EXISTS app_secrets (
+    name  TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class SessionStore(SQLiteStore):
+    """Signed session tokens backed by a table with TTL eviction.
+
+    A token is `<id>.<hmac>`: the signature lets a forged or mangled token be
+    rejected without touching the database, and only a hash of the id is stored,
+    so a copy of the database cannot be replayed as a sign-in. The signing key
+    comes from MSF_SESSION_SECRET, or is generated once into the database so
+    every process sharing it accepts the same tokens.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, cache_size: int = SESSION_CACHE_SIZE):
+        super().__init__(path)
+        self._secret = self._load_secret()
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def init_schema(self, conn: sqlite3.Connection) -> None:
+        conn.executescript(SESSIONS_SCHEMA)
+
+    def _load_secret(self) -> bytes:
+        configured = os.getenv("MSF_SESSION_SECRET")
+        if configured:
+            return configured.encode("utf-8")
+        with self.batch() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO app_secrets (name, value) VALUES ('session', ?)",
+                (secrets.token_hex(32),)
+            )
+            row = conn.execute("SELECT value FROM app_secrets WHERE name = 'session'").fetchone()
+        return row["value"].encode("ascii")
+
+    def _sign(self, session_id: str) -> str:
+        return _b64(hmac.new(self._secret, session_id.encode("ascii"), hashlib.sha256).digest())
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return hashlib.sha256(session_id.encode("ascii")).hexdigest()
+
+    def _unpack(self, token: str):
+        """The session id inside `token`, or None when the signature does not match."""
+        session_id, _, signature = (token or "").partition(".")
+        if not session_id or not signature:
+            return None
+        try:
+            if hmac.compare_digest(self._sign(session_id), signature):
+                return session_id
+        except (UnicodeEncodeError, TypeError):
+            pass
+        return None
+
+    def _remember(self, key: str, email: str, expires_at: float) -> None:
+        with self._cache_lock:
+            self._cache[key] = (email, expires_at, time.monotonic())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def create(self, email: str) -> str:
+        """Start a session for `email` and return the token to hand to the client."""
+        session_id = secrets.token_urlsafe(24)
+        now = time.time()
+        key = self._key(session_id)
+        with self.batch() as conn:
+            conn.execute(
+                "INSERT INTO sessions (key, email, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, email, now, now + SESSION_TTL)
+            )
+        self._remember(key, email, now + SESSION_TTL)
+        if now >= self._next_purge:
+            self._next_purge = now + PURGE_INTERVAL
+            self.purge_expired(now)
+        return f"{session_id}.{self._sign(session_id)}"
+
+    def resolve(self, token: str):
+        """The email signed in with `token`, or None if it is invalid, expired or revoked."""
+        session_id = self._unpack(token)
+        if session_id is None:
+            return None
+        key = self._key(session_id)
+        now = time.time()
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                email, expires_at, cached_at = hit
+                if expires_at > now and time.monotonic() - cached_at < SESSION_CACHE_TTL:
+                    self._cache.move_to_end(key)
+                    return email
+                del self._cache[key]
+        row = self._conn().execute(
+            "SELECT email, expires_at FROM sessions WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row["email"], row["expires_at"])
+        return row["email"]
+
+    def revoke(self, token: str) -> None:
+        session_id = self._unpack(token)
+        if session_id is None:
+            return
+        key = self._key(session_id)
+        with self._cache_lock:
+            self._cache.pop(key, None)
+        with self.batch() as conn:
+            conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def purge_expired(self, now: float = None) -> int:
+        """Delete expired sessions in short transactions so sign-ins are never held up."""
+        now = time.time() if now is None else now
+        removed = 0
+        while True:
+            with self.batch() as conn:
+                cur = conn.execute(
+                    "DELETE FROM sessions WHERE key IN "
+                    "(SELECT key FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                    (now, PURGE_CHUNK)
+                )
+            removed += cur.rowcount
+            if cur.rowcount < PURGE_CHUNK:
+                return removed
+
+
+_default_sessions = None
+_default_lock = threading.Lock()
+
+
+def get_sessions() -> SessionStore:
+    global _default_sessions
+    if _default_sessions is None:
+        with _default_lock:
+            if _default_sessions is None:
+                _default_sessions = SessionStore()
+    return _default_sessions
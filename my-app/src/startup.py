@@ -0,0 +1,52 @@
+"""Startup timeline for the app entry point.
+
+main.py imports this module before anything else, so T0 is (close to) the
+moment the interpreter started running app code. Marks are milliseconds since
+T0; the first time a mark is set wins, so per-session calls after the first
+one are free.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T0 = time.perf_counter()
+_marks = {}
+_prewarmed = set()
+_lock = threading.Lock()
+
+
+def mark(name: str) -> float:
+    with _lock:
+        if name not in _marks:
+            _marks[name] = round((time.perf_counter() - T0) * 1000, 2)
+            logger.info("startup: %s at %.0f ms", name, _marks[name])
+        return _marks[name]
+
+
+def marks() -> dict:
+    with _lock:
+        return dict(_marks)
+
+
+def prewarm(name: str, warm) -> None:
+    """Run `warm()` once per process on a background thread, marking when it is done.
+
+    Meant for work the next screen will need (imports, opening a store) that
+    should not delay the frame the user is looking at.
+    """
+    with _lock:
+        if name in _prewarmed:
+            return
+        _prewarmed.add(name)
+
+    def run():
+        try:
+            warm()
+        except Exception:
+            logger.exception("prewarming %s failed", name)
+            return
+        mark(f"prewarmed {name}")
+
+    threading.Thread(target=run, name=f"prewarm-{name}", daemon=True).start()
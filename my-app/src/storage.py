@@ -0,0 +1,684 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from models import Post
+
+#where the posts database lives; flet sets FLET_APP_STORAGE_DATA for packaged apps
+DEFAULT_DB_PATH = os.getenv(
+    "MSF_DB_PATH",
+    os.path.join(os.getenv("FLET_APP_STORAGE_DATA", "."), "posts.db")
+)
+
+POST_FIELDS = ("id", "title", "description", "category", "location", "date", "contact", "image", "status", "author")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    id          TEXT NOT NULL UNIQUE,
+    title       TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category    TEXT NOT NULL DEFAULT 'Unspecified',
+    location    TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    contact     TEXT NOT NULL DEFAULT '',
+    image       TEXT NOT NULL DEFAULT '',
+    status      TEXT NOT NULL DEFAULT 'Lost',
+    author      TEXT NOT NULL DEFAULT '',
+    created_at  REAL NOT NULL,
+    claimed_at  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_status ON posts(status, seq);
+CREATE INDEX IF NOT EXISTS idx_posts_category ON posts(category, seq);
+CREATE INDEX IF NOT EXISTS idx_posts_date ON posts(date, seq);
+CREATE INDEX IF NOT EXISTS idx_posts_author ON posts(author, seq);
+CREATE INDEX IF NOT EXISTS idx_posts_location ON posts(location, seq);
+CREATE INDEX IF NOT EXISTS idx_posts_status_date ON posts(status, date, seq);
+CREATE INDEX IF NOT EXISTS idx_posts_category_date ON posts(category, date, seq);
+CREATE INDEX IF NOT EXISTS idx_posts_location_date ON posts(location, date, seq);
+
+CREATE TABLE IF NOT EXISTS post_matches (
+    post_id  TEXT NOT NULL,
+    match_id TEXT NOT NULL,
+    score    REAL NOT NULL,
+    PRIMARY KEY (post_id, match_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_post_matches_match ON post_matches(match_id);
+CREATE TRIGGER IF NOT EXISTS post_matches_ad AFTER DELETE ON posts BEGIN
+    DELETE FROM post_matches WHERE post_id = old.id OR match_id = old.id;
+END;
+
+-- change log every process tails to keep its open list views current; the
+-- triggers record writes from any process (or tool) that touches the database
+CREATE TABLE IF NOT EXISTS post_changes (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind       TEXT NOT NULL,
+    post_id    TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_post_changes_created ON post_changes(created_at);
+CREATE TRIGGER IF NOT EXISTS post_changes_ai AFTER INSERT ON posts BEGIN
+    INSERT INTO post_changes (kind, post_id, created_at) VALUES ('create', new.id, (julianday('now') - 2440587.5) * 86400.0);
+END;
+CREATE TRIGGER IF NOT EXISTS post_changes_ad AFTER DELETE ON posts BEGIN
+    INSERT INTO post_changes (kind, post_id, created_at) VALUES ('delete', old.id, (julianday('now') - 2440587.5) * 86400.0);
+END;
+CREATE TRIGGER IF NOT EXISTS post_changes_au AFTER UPDATE OF status, image ON posts BEGIN
+    INSERT INTO post_changes (kind, post_id, created_at) VALUES ('update', new.id, (julianday('now') - 2440587.5) * 86400.0);
+END;
+CREATE TRIGGER IF NOT EXISTS post_changes_mi AFTER INSERT ON post_matches BEGIN
+    INSERT INTO post_changes (kind, post_id, created_at) VALUES ('update', new.post_id, (julianday('now') - 2440587.5) * 86400.0);
+END;
+CREATE TRIGGER IF NOT EXISTS post_changes_md AFTER DELETE ON post_matches BEGIN
+    INSERT INTO post_changes (kind, post_id, created_at) VALUES ('update', old.post_id, (julianday('now') - 2440587.5) * 86400.0);
+END;
+"""
+
+#every post read carries how many possible matches it has (an index lookup per row)
+#columns in the order Post.from_row unpacks them
+POST_SELECT = (
+    "SELECT posts.seq, " + ", ".join(f"posts.{f}" for f in POST_FIELDS)
+    + ", (SELECT COUNT(*) FROM post_matches m WHERE m.post_id = posts.id) AS match_count"
+)
+
+#full-text index over the searchable columns, kept in step with posts by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE posts_fts USING fts5(
+    title, description, category, location,
+    content='posts', content_rowid='seq',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+CREATE TRIGGER posts_fts_ai AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts(rowid, title, description, category, location)
+    VALUES (new.seq, new.title, new.description, new.category, new.location);
+END;
+CREATE TRIGGER posts_fts_ad AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, title, description, category, location)
+    VALUES ('delete', old.seq, old.title, old.description, old.category, old.location);
+END;
+CREATE TRIGGER posts_fts_au AFTER UPDATE OF title, description, category, location ON posts BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, title, description, category, location)
+    VALUES ('delete', old.seq, old.title, old.description, old.category, old.location);
+    INSERT INTO posts_fts(rowid, title, description, category, location)
+    VALUES (new.seq, new.title, new.description, new.category, new.location);
+END;
+INSERT INTO posts_fts(posts_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 4.0, 4.0)');
+INSERT INTO posts_fts(posts_fts) VALUES ('rebuild');
+"""
+
+#posts past their age (or claimed a while ago) are moved here by the archive
+#job; the list never reads it, search does. Rows keep their seq, and a second
+#full-text index covers them
+ARCHIVE_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_posts_claimed ON posts(claimed_at) WHERE claimed_at IS NOT NULL;
+CREATE TRIGGER IF NOT EXISTS posts_claimed_ai AFTER INSERT ON posts WHEN new.status = 'Claimed' BEGIN
+    UPDATE posts SET claimed_at = (julianday('now') - 2440587.5) * 86400.0 WHERE seq = new.seq;
+END;
+CREATE TRIGGER IF NOT EXISTS posts_claimed_au AFTER UPDATE OF status ON posts WHEN old.status IS NOT new.status BEGIN
+    UPDATE posts SET claimed_at = CASE WHEN new.status = 'Claimed' THEN (julianday('now') - 2440587.5) * 86400.0 END
+    WHERE seq = new.seq;
+END;
+
+CREATE TABLE IF NOT EXISTS posts_archive (
+    seq         INTEGER PRIMARY KEY,
+    id          TEXT NOT NULL UNIQUE,
+    title       TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category    TEXT NOT NULL,
+    location    TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    contact     TEXT NOT NULL,
+    image       TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    author      TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    archived_at REAL NOT NULL
+);
+"""
+
+ARCHIVE_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE posts_archive_fts USING fts5(
+    title, description, category, location,
+    content='posts_archive', content_rowid='seq',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+CREATE TRIGGER posts_archive_fts_ai AFTER INSERT ON posts_archive BEGIN
+    INSERT INTO posts_archive_fts(rowid, title, description, category, location)
+    VALUES (new.seq, new.title, new.description, new.category, new.location);
+END;
+CREATE TRIGGER posts_archive_fts_ad AFTER DELETE ON posts_archive BEGIN
+    INSERT INTO posts_archive_fts(posts_archive_fts, rowid, title, description, category, location)
+    VALUES ('delete', old.seq, old.title, old.description, old.category, old.location);
+END;
+INSERT INTO posts_archive_fts(posts_archive_fts, rank) VALUES ('rank', 'bm25(10.0, 2.0, 4.0, 4.0)');
+"""
+
+#an archived post is read like a live one, with no matches (they are dropped with it)
+ARCHIVE_SELECT = "SELECT posts.seq, " + ", ".join(f"posts.{f}" for f in POST_FIELDS) + ", 0 AS match_count"
+ARCHIVE_COLUMNS = ("seq",) + POST_FIELDS + ("created_at",)
+FTS_TABLES = ("posts_fts", "posts_archive_fts")
+
+#per-value post counts for the list filters, kept current by triggers so the
+#filter options never need a GROUP BY over the whole table
+FACET_COLUMNS = ("status", "category", "location")
+
+
+def _facet_triggers(column: str) -> str:
+    dec = (f"UPDATE post_facets SET count = count - 1 WHERE facet = '{column}' AND value = old.{column}; "
+           f"DELETE FROM post_facets WHERE facet = '{column}' AND value = old.{column} AND count <= 0;")
+    inc = (f"INSERT INTO post_facets (facet, value, count) VALUES ('{column}', new.{column}, 1) "
+           "ON CONFLICT (facet, value) DO UPDATE SET count = count + 1;")
+    return f"""
+CREATE TRIGGER post_facets_{column}_ai AFTER INSERT ON posts BEGIN {inc} END;
+CREATE TRIGGER post_facets_{column}_ad AFTER DELETE ON posts BEGIN {dec} END;
+CREATE TRIGGER post_facets_{column}_au AFTER UPDATE OF {column} ON posts
+WHEN old.{column} IS NOT new.{column} BEGIN {dec} {inc} END;
+INSERT INTO post_facets (facet, value, count) SELECT '{column}', {column}, COUNT(*) FROM posts GROUP BY {column};
+"""
+
+
+FACET_SCHEMA = """
+CREATE TABLE post_facets (
+    facet TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (facet, value)
+) WITHOUT ROWID;
+""" + "".join(_facet_triggers(c) for c in FACET_COLUMNS)
+
+#list orders: the ORDER BY, and the keyset condition (with the row fields it
+#reads) that continues a listing after the last row already shown
+SORTS = {
+    "oldest": ("posts.seq", "posts.seq > ?", ("seq",)),
+    "newest": ("posts.seq DESC", "posts.seq < ?", ("seq",)),
+    "date": ("posts.date DESC, posts.seq DESC", "(posts.date, posts.seq) < (?, ?)", ("date", "seq")),
+    #walks idx_posts_location; the near-a-building order (geo.py) pages each place's locations with it
+    "location": ("posts.location, posts.seq", "(posts.location, posts.seq) > (?, ?)", ("location", "seq")),
+}
+
+
+def filter_sql(filters) -> tuple:
+    """WHERE clauses and parameters for a filters dict (status, category, location, locations, date_from, date_to)."""
+    clauses, params = [], []
+    for column in FACET_COLUMNS:
+        if filters.get(column):
+            clauses.append(f"posts.{column} = ?")
+            params.append(filters[column])
+    if filters.get("locations"):
+        clauses.append(f"posts.location IN ({', '.join('?' * len(filters['locations']))})")
+        params.extend(filters["locations"])
+    if filters.get("date_from"):
+        clauses.append("posts.date >= ?")
+        params.append(filters["date_from"])
+    if filters.get("date_to"):
+        clauses.append("posts.date <= ?")
+        params.append(filters["date_to"])
+    return clauses, params
+
+
+#ranking every match of a very common word costs O(matches); only the newest
+#RANK_CANDIDATES matches that pass the filters (walked in rowid order, which is
+#cheap) are scored
+RANK_CANDIDATES = 1000
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def to_fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query where every word is a quoted prefix term."""
+    return " ".join(f'"{w}"*' for w in _WORD.findall(text))
+
+
+class SQLiteStore:
+    """Connection handling shared by the SQLite-backed stores.
+
+    Each thread gets its own connection so readers never block each other (WAL),
+    while writes go through one lock and are grouped into transactions.
+    Subclasses create their tables in `init_schema`.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        with self._write_lock:
+            self.init_schema(self._conn())
+
+    def init_schema(self, conn: sqlite3.Connection) -> None:
+        pass
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            #only takes effect while the file is new; lets the archive job hand freed pages back in slices
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def batch(self):
+        """Group several writes into one transaction (and one fsync)."""
+        with self._write_lock:
+            conn = self._conn()
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+
+class PostStore(SQLiteStore):
+    """SQLite-backed post repository shared by every Flet session in the process.
+
+    Posts go in and come out as models.Post records.
+    """
+
+    def init_schema(self, conn: sqlite3.Connection) -> None:
+        conn.executescript(SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(posts)")}
+        if "claimed_at" not in columns:
+            #databases from before archiving; adding a nullable column does not rewrite the table
+            conn.execute("ALTER TABLE posts ADD COLUMN claimed_at REAL")
+        conn.executescript(ARCHIVE_SCHEMA)
+        has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").fetchone()
+        if not has_fts:
+            conn.executescript(FTS_SCHEMA)
+        has_facets = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'post_facets'").fetchone()
+        if not has_facets:
+            conn.executescript(f"BEGIN; {FACET_SCHEMA} COMMIT;")
+        has_archive_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_archive_fts'").fetchone()
+        if not has_archive_fts:
+            conn.executescript(ARCHIVE_FTS_SCHEMA)
+
+    #writes
+    def add(self, post: Post) -> Post:
+        return self.add_many([post])[0]
+
+    def add_many(self, posts) -> list:
+        """Insert Posts in one transaction; each one gets its `seq` set and is returned."""
+        posts = list(posts)
+        now = time.time()
+        rows = [p.to_row() + (now,) for p in posts]
+        with self.batch() as conn:
+            conn.executemany(
+                f"INSERT INTO posts ({', '.join(POST_FIELDS)}, created_at) VALUES ({', '.join('?' * (len(POST_FIELDS) + 1))})",
+                rows
+            )
+            #AUTOINCREMENT hands out consecutive seqs inside one transaction
+            last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first = last - len(rows) + 1
+        for i, p in enumerate(posts):
+            p.seq = first + i
+        return posts
+
+    def import_rows(self, rows) -> int:
+        """Insert POST_FIELDS-ordered tuples in one transaction, skipping ids already stored.
+
+        Returns how many went in. The rows are staged in a temp table and moved
+        with one INSERT ... SELECT, so the triggers run inside a single
+        statement instead of once per executemany() row, which is more than
+        twice as fast. Imported posts do not get a `seq` back.
+        """
+        columns = ", ".join(POST_FIELDS)
+        with self.batch() as conn:
+            conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_staging ({columns})")
+            conn.executemany(f"INSERT INTO temp.import_staging VALUES ({', '.join('?' * len(POST_FIELDS))})", rows)
+            inserted = conn.execute(
+                f"INSERT OR IGNORE INTO posts ({columns}, created_at) "
+                f"SELECT {columns}, ? FROM temp.import_staging ORDER BY rowid",
+                (time.time(),)
+            ).rowcount
+            conn.execute("DELETE FROM temp.import_staging")
+        return inserted
+
+    @contextmanager
+    def bulk_load(self):
+        """One transaction for a large import, with the per-row index work left to the end.
+
+        The list indexes and the full-text and facet insert triggers are dropped
+        at the start; import_rows() calls inside then only write the rows (and
+        the change log). At the end each index is built once, the new rows go
+        into the full-text index in one statement, the facet counts are added
+        up, and the triggers come back before the commit. Readers see the
+        database as it was until then, and other writers wait for the commit
+        (busy_timeout), so this suits a load into a database the app is not
+        writing to.
+        """
+        with self.batch() as conn:
+            first = self.last_seq()
+            deferred = conn.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'posts' AND "
+                "((type = 'index' AND name LIKE 'idx_posts_%') OR name = 'posts_fts_ai' OR name LIKE 'post_facets_%_ai')"
+            ).fetchall()
+            for kind, name, _ in deferred:
+                conn.execute(f"DROP {kind.upper()} {name}")
+            yield
+            for _, _, sql in deferred:
+                conn.execute(sql)
+            conn.execute(
+                "INSERT INTO posts_fts(rowid, title, description, category, location) "
+                "SELECT seq, title, description, category, location FROM posts WHERE seq > ?", (first,)
+            )
+            for column in FACET_COLUMNS:
+                conn.execute(
+                    f"INSERT INTO post_facets (facet, value, count) SELECT '{column}', {column}, COUNT(*) FROM posts "
+                    f"WHERE seq > ? GROUP BY {column} ON CONFLICT (facet, value) DO UPDATE SET count = count + excluded.count",
+                    (first,)
+                )
+
+    def upsert_rows(self, rows) -> int:
+        """Insert POST_FIELDS-ordered tuples, or overwrite the stored post with the same id; one transaction.
+
+        For mirroring another store (see sync.py). A stored post is only
+        rewritten when some field differs, so rows that did not change fire no
+        triggers and reach no change log. Returns how many rows were written.
+        """
+        columns = ", ".join(POST_FIELDS)
+        fields = POST_FIELDS[1:]
+        with self.batch() as conn:
+            return conn.executemany(
+                f"INSERT INTO posts ({columns}, created_at) VALUES ({', '.join('?' * len(POST_FIELDS))}, {time.time()!r}) "
+                f"ON CONFLICT (id) DO UPDATE SET {', '.join(f'{f} = excluded.{f}' for f in fields)} "
+                f"WHERE ({', '.join(f'posts.{f}' for f in fields)}) IS NOT ({', '.join(f'excluded.{f}' for f in fields)})",
+                rows
+            ).rowcount
+
+    def delete_many(self, post_ids) -> int:
+        with self.batch() as conn:
+            return conn.executemany("DELETE FROM posts WHERE id = ?", ((i,) for i in post_ids)).rowcount
+
+    def set_cache_mb(self, mb: int) -> None:
+        """Page cache for this thread's connection; bulk writes touch many index pages per batch."""
+        self._conn().execute(f"PRAGMA cache_size = -{int(mb) * 1024}")
+
+    def delete(self, post_id: str) -> bool:
+        with self.batch() as conn:
+            return conn.execute("DELETE FROM posts WHERE id = ?", (post_id,)).rowcount > 0
+
+    def set_status(self, post_id: str, status: str) -> bool:
+        with self.batch() as conn:
+            return conn.execute("UPDATE posts SET status = ? WHERE id = ?", (status, post_id)).rowcount > 0
+
+    def set_image(self, post_id: str, image: str) -> bool:
+        with self.batch() as conn:
+            return conn.execute("UPDATE posts SET image = ? WHERE id = ?", (image, post_id)).rowcount > 0
+
+    #reads
+    def get(self, post_id: str):
+        row = self._conn().execute(f"{POST_SELECT} FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return Post.from_row(row) if row else None
+
+    def get_many(self, post_ids) -> dict:
+        """Posts by id for the ids that still exist."""
+        post_ids = list(post_ids)
+        found = {}
+        #stay well under SQLite's bound-parameter limit
+        for i in range(0, len(post_ids), 500):
+            chunk = post_ids[i:i + 500]
+            rows = self._conn().execute(
+                f"{POST_SELECT} FROM posts WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update((p.id, p) for p in map(Post.from_row, rows))
+        return found
+
+    def list_posts(self, after_seq: int = 0, limit: int = 25) -> list:
+        """Return up to `limit` posts in posting order, starting after `after_seq`.
+
+        Keyset paging keeps every page an index range scan no matter how deep it is.
+        """
+        rows = self._conn().execute(
+            f"{POST_SELECT} FROM posts WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+        ).fetchall()
+        return [Post.from_row(r) for r in rows]
+
+    def query_posts(self, filters=None, sort: str = "oldest", after=None, limit: int = 25) -> list:
+        """Posts matching `filters` in `sort` order (see SORTS), continuing after the row `after`.
+
+        Each filter is an equality or range on an indexed column, and paging is by
+        keyset, so a page costs the same at any depth.
+        """
+        order, keyset, key_fields = SORTS[sort]
+        clauses, params = filter_sql(filters or {})
+        if after is not None:
+            clauses.append(keyset)
+            params.extend(getattr(after, f) for f in key_fields)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"{POST_SELECT} FROM posts{where} ORDER BY {order} LIMIT ?", (*params, limit)
+        ).fetchall()
+        return [Post.from_row(r) for r in rows]
+
+    def facet_counts(self) -> dict:
+        """{facet: {value: count}} for the filter options, read from the trigger-maintained table."""
+        counts = {f: {} for f in FACET_COLUMNS}
+        for row in self._conn().execute("SELECT facet, value, count FROM post_facets WHERE count > 0"):
+            counts[row["facet"]][row["value"]] = row["count"]
+        return counts
+
+    def search(self, text: str, limit: int = 200, filters=None, include_archived: bool = False) -> list:
+        """Rank posts matching every word of `text` (as prefixes), best match first.
+
+        Title hits weigh most, then category and location, then description.
+        With `include_archived`, archived matches fill whatever room the live
+        ones leave, ranked among themselves. Filters are applied while the
+        candidates are collected, so a narrow filter still reaches old posts.
+        """
+        query = to_fts_query(text)
+        if not query:
+            return []
+        clauses, params = filter_sql(filters or {})
+        where = "".join(f" AND {c}" for c in clauses)
+        rows = self._conn().execute(
+            f"{POST_SELECT} FROM ("
+            "    SELECT posts_fts.rowid AS hit, posts_fts.rank AS rank FROM posts_fts"
+            f"    JOIN posts ON posts.seq = posts_fts.rowid WHERE posts_fts MATCH ?{where}"
+            "    ORDER BY posts_fts.rowid DESC LIMIT ?"
+            ") JOIN posts ON posts.seq = hit ORDER BY rank LIMIT ?",
+            (query, *params, RANK_CANDIDATES, limit)
+        ).fetchall()
+        posts = [Post.from_row(r) for r in rows]
+        if include_archived and len(posts) < limit:
+            #aliased as posts so filter_sql's clauses apply unchanged
+            rows = self._conn().execute(
+                f"{ARCHIVE_SELECT} FROM ("
+                "    SELECT posts_archive_fts.rowid AS hit, posts_archive_fts.rank AS rank FROM posts_archive_fts"
+                f"    JOIN posts_archive AS posts ON posts.seq = posts_archive_fts.rowid WHERE posts_archive_fts MATCH ?{where}"
+                "    ORDER BY posts_archive_fts.rowid DESC LIMIT ?"
+                ") JOIN posts_archive AS posts ON posts.seq = hit ORDER BY rank LIMIT ?",
+                (query, *params, RANK_CANDIDATES, limit - len(posts))
+            ).fetchall()
+            for r in rows:
+                p = Post.from_row(r)
+                p.archived = True
+                posts.append(p)
+        return posts
+
+    def save_matches(self, post_id: str, matches) -> None:
+        """Record (match_id, score) pairs for `post_id`, in both directions."""
+        rows = []
+        for match_id, score in matches:
+            rows.append((post_id, match_id, score))
+            rows.append((match_id, post_id, score))
+        with self.batch() as conn:
+            conn.executemany("INSERT OR REPLACE INTO post_matches (post_id, match_id, score) VALUES (?, ?, ?)", rows)
+
+    def clear_matches(self, post_id: str) -> int:
+        """Forget every match recorded for or against `post_id`."""
+        with self.batch() as conn:
+            return conn.execute("DELETE FROM post_matches WHERE post_id = ? OR match_id = ?", (post_id, post_id)).rowcount
+
+    def matches_for(self, post_id: str, limit: int = 50) -> list:
+        rows = self._conn().execute(
+            f"{POST_SELECT} FROM post_matches pm JOIN posts ON posts.id = pm.match_id "
+            "WHERE pm.post_id = ? ORDER BY pm.score DESC LIMIT ?",
+            (post_id, limit)
+        ).fetchall()
+        return [Post.from_row(r) for r in rows]
+
+    def export_rows(self, archived: bool = False, page: int = 5000):
+        """Every live (or archived) post as a POST_FIELDS tuple, in posting order.
+
+        Read a page at a time by seq, so a long export holds neither memory nor
+        a read snapshot that would keep the WAL from being checkpointed.
+        """
+        table = "posts_archive" if archived else "posts"
+        columns = ", ".join(POST_FIELDS)
+        cursor = self._conn().cursor()
+        #plain tuples rather than a sqlite3.Row per exported post
+        cursor.row_factory = None
+        after = 0
+        while True:
+            rows = cursor.execute(
+                f"SELECT seq, {columns} FROM {table} WHERE seq > ? ORDER BY seq LIMIT ?", (after, page)
+            ).fetchall()
+            if not rows:
+                return
+            after = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def last_seq(self) -> int:
+        """The newest live post's seq; posts added later all get a higher one."""
+        return self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM posts").fetchone()[0]
+
+    def archived_count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM posts_archive").fetchone()[0]
+
+    #archiving and compaction, a small step at a time (see archive.py)
+    def archive_candidates(self, created_before: float, claimed_before: float, limit: int) -> list:
+        """Seqs of up to `limit` posts due for the archive: posted before `created_before`
+        or claimed before `claimed_before`.
+
+        Posts are aged from the front of the posting order and the scan stops at
+        the first one still young, so it never walks the live tail.
+        """
+        conn = self._conn()
+        seqs = []
+        for row in conn.execute("SELECT seq, created_at FROM posts ORDER BY seq LIMIT ?", (limit,)):
+            if row["created_at"] >= created_before:
+                break
+            seqs.append(row["seq"])
+        if len(seqs) < limit:
+            rows = conn.execute(
+                "SELECT seq FROM posts WHERE claimed_at < ? ORDER BY claimed_at LIMIT ?",
+                (claimed_before, limit - len(seqs))
+            ).fetchall()
+            aged = set(seqs)
+            seqs.extend(r["seq"] for r in rows if r["seq"] not in aged)
+        return seqs
+
+    def archive(self, seqs, now: float = None) -> int:
+        """Move posts from the live table to the archive in one transaction; returns how many moved.
+
+        The delete from posts goes through the usual triggers, so open lists drop
+        the cards and the facet counts and matches follow.
+        """
+        seqs = list(seqs)
+        now = time.time() if now is None else now
+        columns = ", ".join(ARCHIVE_COLUMNS)
+        moved = 0
+        with self.batch() as conn:
+            for i in range(0, len(seqs), 500):
+                chunk = seqs[i:i + 500]
+                marks = ", ".join("?" * len(chunk))
+                #another process may have archived some of them already
+                conn.execute(
+                    f"INSERT OR IGNORE INTO posts_archive ({columns}, archived_at) "
+                    f"SELECT {columns}, ? FROM posts WHERE seq IN ({marks})",
+                    (now, *chunk)
+                )
+                moved += conn.execute(f"DELETE FROM posts WHERE seq IN ({marks})", chunk).rowcount
+        return moved
+
+    def merge_search_index(self, table: str, pages: int) -> bool:
+        """Merge up to `pages` pages of a full-text index's segments; True while there is more to merge."""
+        assert table in FTS_TABLES
+        with self.batch() as conn:
+            before = conn.total_changes
+            conn.execute(f"INSERT INTO {table}({table}, rank) VALUES ('merge', ?)", (pages,))
+            #fewer than two changes means the merge found nothing to do
+            return conn.total_changes - before >= 2
+
+    def vacuum_step(self, pages: int) -> bool:
+        """Return up to `pages` free pages to the file system; True while more are free.
+
+        A no-op for databases created before incremental auto-vacuum (freed pages
+        are still reused by later writes).
+        """
+        with self._write_lock:
+            conn = self._conn()
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return False
+            #executescript, because a single execute() frees one page per step
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            return conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+
+    def optimize(self) -> None:
+        """Refresh the query planner's statistics for indexes whose tables changed a lot."""
+        with self._write_lock:
+            self._conn().execute("PRAGMA optimize")
+
+    def manual_checkpoints(self) -> None:
+        """Stop this thread's connection from checkpointing inside its commits; call checkpoint() instead."""
+        self._conn().execute("PRAGMA wal_autocheckpoint=0")
+
+    def checkpoint(self) -> None:
+        """Copy committed pages from the WAL into the database without blocking writers."""
+        self._conn().execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+
+    #change log
+    def data_version(self) -> int:
+        """Changes whenever another connection commits; cheap enough to poll."""
+        return self._conn().execute("PRAGMA data_version").fetchone()[0]
+
+    def last_change(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM post_changes").fetchone()[0]
+
+    def change_bounds(self) -> tuple:
+        """(oldest seq still in the change log, newest seq ever logged); the first is newest + 1 when it is empty."""
+        conn = self._conn()
+        head = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'post_changes'").fetchone()
+        head = head[0] if head else 0
+        oldest = conn.execute("SELECT MIN(seq) FROM post_changes").fetchone()[0]
+        return (head + 1 if oldest is None else oldest), head
+
+    def changes_since(self, after_seq: int, limit: int = 1000) -> list:
+        """(seq, kind, post_id) rows logged after `after_seq`, oldest first."""
+        return self._conn().execute(
+            "SELECT seq, kind, post_id FROM post_changes WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+        ).fetchall()
+
+    def prune_changes(self, before: float) -> int:
+        with self.batch() as conn:
+            return conn.execute("DELETE FROM post_changes WHERE created_at < ?", (before,)).rowcount
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store() -> PostStore:
+    global _default_store
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                _default_store = PostStore()
+    return _default_store
@@ -0,0 +1,293 @@
+"""Background work for event handlers.
+
+Handlers run on the session's event loop, which every session in the process
+shares, so anything slow has to leave it: blocking I/O (SQLite, files, the
+network) goes to a thread pool and CPU-bound work (image decoding and
+resizing) to a process pool. Each session gets a TaskScope that bounds how
+much of that it can have queued at once, and a screen gets a child scope that
+is cancelled when the user navigates away from it.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import flet as ft
+
+from metrics import track
+
+logger = logging.getLogger(__name__)
+
+#worker processes for CPU-bound work; 0 runs it on the I/O threads instead
+CPU_WORKERS = int(os.getenv("MSF_CPU_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+IO_WORKERS = int(os.getenv("MSF_IO_WORKERS", "16"))
+#per session: tasks running at once, and tasks allowed to wait behind them
+SESSION_CONCURRENCY = int(os.getenv("MSF_SESSION_CONCURRENCY", "2"))
+SESSION_QUEUE = int(os.getenv("MSF_SESSION_QUEUE", "8"))
+
+
+class QueueFull(Exception):
+    """The session already has as many tasks waiting as it is allowed."""
+
+
+class Cancelled(Exception):
+    """The task's scope was cancelled, usually because the user left the screen."""
+
+
+class TaskScheduler:
+    """Process pool for CPU-bound work and thread pool for blocking I/O, shared by every session.
+
+    The process pool is started on first use, with the spawn start method so
+    workers never inherit the app's threads or open SQLite connections.
+    """
+
+    def __init__(self, cpu_workers: int = CPU_WORKERS, io_workers: int = IO_WORKERS):
+        self.cpu_workers = cpu_workers
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io")
+        self._cpu = None
+        self._lock = threading.Lock()
+
+    def _cpu_pool(self):
+        with self._lock:
+            if self._cpu is None and self.cpu_workers > 0:
+                try:
+                    self._cpu = ProcessPoolExecutor(
+                        max_workers=self.cpu_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                except (OSError, NotImplementedError, ImportError):
+                    #no subprocesses here (some packaged builds); CPU work shares the I/O threads
+                    logger.warning("process pool unavailable; running CPU work on threads", exc_info=True)
+                    self.cpu_workers = 0
+            return self._cpu
+
+    def io(self, fn, *args):
+        """Future for `fn(*args)` on an I/O thread."""
+        return self._io.submit(fn, *args)
+
+    def cpu(self, fn, *args):
+        """Future for `fn(*args)` in a worker process; `fn` and its arguments must pickle."""
+        pool = self._cpu_pool()
+        if pool is None:
+            return self._io.submit(fn, *args)
+        try:
+            return pool.submit(fn, *args)
+        except BrokenProcessPool:
+            #a worker died (killed, out of memory); start a fresh pool once
+            with self._lock:
+                if self._cpu is pool:
+                    self._cpu = None
+            pool = self._cpu_pool()
+            return pool.submit(fn, *args) if pool is not None else self._io.submit(fn, *args)
+
+    def scope(self, loop, concurrency: int = SESSION_CONCURRENCY, queue: int = SESSION_QUEUE) -> "TaskScope":
+        """A new session scope whose results are delivered on `loop`."""
+        return TaskScope(self, loop, _Quota(concurrency, queue))
+
+
+class _Quota:
+    """The share of the pools one session may use, common to all of its scopes."""
+    __slots__ = ("slots", "queued", "limit", "on_busy")
+
+    def __init__(self, concurrency: int, limit: int):
+        self.slots = asyncio.Semaphore(concurrency)
+        self.queued = 0
+        self.limit = limit
+        self.on_busy = None
+
+
+def _settle(target: asyncio.Future, source) -> None:
+    if target.done():
+        return
+    if source.cancelled():
+        target.set_exception(Cancelled())
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class TaskScope:
+    """One session's (or one screen's) handle on the scheduler.
+
+    `await scope.io(fn, ...)` / `await scope.cpu(fn, ...)` run a function in
+    the pools without blocking the event loop. At most SESSION_CONCURRENCY of a
+    session's tasks run at once; past SESSION_QUEUE waiting ones the call raises
+    QueueFull, so a user hammering a button cannot take the pools from everyone
+    else. `cancel()` drops queued work, stops delivering results of running work
+    (callers get Cancelled) and cancels child scopes; a cancelled scope refuses
+    new work. Everything except `call_soon` must be used on the scope's loop.
+    """
+
+    def __init__(self, scheduler: TaskScheduler, loop, quota: _Quota):
+        self.scheduler = scheduler
+        self._loop = loop
+        self._quota = quota
+        self._inflight = {}
+        self._children = set()
+        self._deferred = []
+        self.cancelled = False
+
+    @property
+    def on_busy(self):
+        return self._quota.on_busy
+
+    @on_busy.setter
+    def on_busy(self, callback) -> None:
+        """Called (on the loop) when a handler's task was refused with QueueFull."""
+        self._quota.on_busy = callback
+
+    def child(self) -> "TaskScope":
+        """A scope sharing this session's quota that can be cancelled on its own."""
+        scope = TaskScope(self.scheduler, self._loop, self._quota)
+        if self.cancelled:
+            scope.cancelled = True
+        else:
+            self._children.add(scope)
+        return scope
+
+    def _check(self) -> None:
+        if self.cancelled:
+            raise Cancelled()
+
+    async def _run(self, submit, fn, args):
+        self._check()
+        quota = self._quota
+        if quota.queued >= quota.limit:
+            raise QueueFull(f"{quota.queued} tasks already waiting")
+        quota.queued += 1
+        try:
+            await quota.slots.acquire()
+        finally:
+            quota.queued -= 1
+        try:
+            self._check()
+            source = submit(fn, *args)
+            target = self._loop.create_future()
+            self._inflight[target] = source
+            source.add_done_callback(lambda f: self._deliver(_settle, target, f))
+            try:
+                return await target
+            finally:
+                self._inflight.pop(target, None)
+                if target.cancelled():
+                    source.cancel()
+        finally:
+            quota.slots.release()
+
+    async def io(self, fn, *args):
+        return await self._run(self.scheduler.io, fn, args)
+
+    async def cpu(self, fn, *args):
+        return await self._run(self.scheduler.cpu, fn, args)
+
+    def _deliver(self, fn, *args) -> None:
+        try:
+            self._loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:
+            #the session's loop has shut down
+            pass
+
+    def call_soon(self, fn, *args) -> None:
+        """Run `fn(*args)` on the scope's loop unless the scope has been cancelled by then.
+
+        Safe from any thread; meant for callbacks from workers and feeds that
+        touch the page.
+        """
+        def run():
+            if not self.cancelled:
+                fn(*args)
+        self._deliver(run)
+
+    def defer(self, callback) -> None:
+        """Run `callback()` when the scope is cancelled."""
+        if self.cancelled:
+            callback()
+        else:
+            self._deferred.append(callback)
+
+    def cancel(self) -> None:
+        if self.cancelled:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self._loop:
+            self._deliver(self.cancel)
+            return
+        self.cancelled = True
+        for child in list(self._children):
+            child.cancel()
+        self._children.clear()
+        for target, source in list(self._inflight.items()):
+            source.cancel()
+            if not target.done():
+                target.set_exception(Cancelled())
+        for callback in self._deferred:
+            try:
+                callback()
+            except Exception:
+                logger.exception("cleanup after cancelling a task scope failed")
+        self._deferred.clear()
+
+    def handler(self, fn, name: str = None):
+        """Wrap an event handler to run in this scope.
+
+        Flet's automatic page update is switched off (handlers update what they
+        touched), Cancelled is swallowed because the screen it was for is gone,
+        and QueueFull is reported through `on_busy` instead of surfacing as an
+        error. Each call is recorded in the metrics as `name` (default: the
+        function's name; pass one for lambdas).
+        """
+        label = name or getattr(fn, "__name__", "handler")
+
+        @functools.wraps(fn)
+        async def run(*args):
+            ft.context.disable_auto_update()
+            try:
+                await track(label, fn, *args)
+            except Cancelled:
+                pass
+            except QueueFull:
+                logger.info("session queue full; dropped %s", label)
+                if self._quota.on_busy is not None:
+                    self._quota.on_busy()
+        return run
+
+
+def session_tasks(page) -> TaskScope:
+    """The TaskScope of `page`'s session, created on first use and cancelled when the session closes.
+
+    An on_close handler already set on the page still runs, after the scope is cancelled.
+    """
+    scope = getattr(page, "task_scope", None)
+    if scope is None:
+        scope = page.task_scope = get_scheduler().scope(page.session.connection.loop)
+        previous = page.on_close
+
+        async def on_close(e):
+            scope.cancel()
+            if previous is not None:
+                result = previous(e)
+                if inspect.isawaitable(result):
+                    await result
+        page.on_close = on_close
+    return scope
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler() -> TaskScheduler:
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_lock:
+            if _default_scheduler is None:
+                _default_scheduler = TaskScheduler()
+    return _default_scheduler
@@ -0,0 +1,99 @@
+import re
+
+from models import Status, parse_day
+
+#compiled once at import; these run on every keystroke of the auth forms
+CAMPUS_DOMAIN = "montclair.edu"
+EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+-]+@montclair\.edu")
+USERNAME_RE = re.compile(r"[a-zA-Z0-9._%+-]+")
+
+MIN_PASSWORD_LENGTH = 8
+PASSWORD_RULES = {
+    "length": f"Password must be at least {MIN_PASSWORD_LENGTH} characters",
+    "upper": "Password must contain at least one uppercase letter",
+    "lower": "Password must contain at least one lowercase letter",
+    "digit": "Password must contain at least one number",
+}
+
+
+def is_valid_email(email: str) -> bool:
+    return EMAIL_RE.fullmatch(email) is not None
+
+
+def is_valid_signin_input(value: str) -> bool:
+    """A NetID or a full @montclair.edu address."""
+    pattern = EMAIL_RE if "@" in value else USERNAME_RE
+    return pattern.fullmatch(value) is not None
+
+
+def normalize_to_email(value: str) -> str:
+    if "@" not in value:
+        return f"{value}@{CAMPUS_DOMAIN}"
+    return value
+
+
+def password_problems(password: str) -> list:
+    """Every rule `password` breaks, in PASSWORD_RULES order, from one pass over it."""
+    has_upper = has_lower = has_digit = False
+    #classify each distinct character once; set() does the pass over the string in C
+    for c in set(password):
+        if c.isupper():
+            has_upper = True
+        elif c.islower():
+            has_lower = True
+        elif c.isdigit():
+            has_digit = True
+        if has_upper and has_lower and has_digit:
+            break
+    problems = []
+    if len(password) < MIN_PASSWORD_LENGTH:
+        problems.append(PASSWORD_RULES["length"])
+    if not has_upper:
+        problems.append(PASSWORD_RULES["upper"])
+    if not has_lower:
+        problems.append(PASSWORD_RULES["lower"])
+    if not has_digit:
+        problems.append(PASSWORD_RULES["digit"])
+    return problems
+
+
+def is_password_strong(password: str):
+    """(ok, message) where message lists every failing rule, one per line."""
+    problems = password_problems(password)
+    if problems:
+        return False, "\n".join(problems)
+    return True, "Password is strong"
+
+
+#what the create form (post_item) requires of a post; bulk imports apply the same rules
+POST_REQUIRED = {
+    "title": "Item title is required",
+    "description": "Description is required",
+    "location": "Last seen location is required",
+}
+POST_STATUSES = frozenset(s.value for s in Status)
+STATUS_PROBLEM = f"Status must be one of {', '.join(s.value for s in Status)}"
+
+
+def post_problems(title: str, description: str, location: str, date_text: str, status: str) -> dict:
+    """{field: message} for every rule a post breaks; empty when it can be saved.
+
+    `date_text` must already have the form's default applied (today when left blank).
+    """
+    problems = {}
+    for field, value in (("title", title), ("description", description), ("location", location)):
+        if not value:
+            problems[field] = POST_REQUIRED[field]
+    if not parse_day(date_text):
+        problems["date"] = "Use YYYY-MM-DD"
+    if status not in POST_STATUSES:
+        problems["status"] = STATUS_PROBLEM
+    return problems
+
+
+def posts_valid(titles: list, descriptions: list, locations: list, date_texts: list, statuses: list) -> bool:
+    """Whether post_problems is empty for every post, given as columns; each rule checks a whole column at once."""
+    return (
+        "" not in titles and "" not in descriptions and "" not in locations
+        and 0 not in map(parse_day, date_texts) and POST_STATUSES.issuperset(statuses)
+    )